@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+bench_domain_store.py
+
+Memory benchmark for domain_store.py: bytes per domain held by a DomainStore
+against a plain `set()` of str, measured with tracemalloc.
+
+Usage:
+  python bench_domain_store.py [--sizes 100000,1000000]
+"""
+
+import argparse
+import random
+import string
+import time
+import tracemalloc
+
+from domain_store import DomainStore
+
+
+def random_domains(count, seed=1):
+    """Synthetic domains as bytes, so building a container creates fresh str objects"""
+    rng = random.Random(seed)
+    alphabet = string.ascii_lowercase + string.digits
+    domains = []
+    for _ in range(count):
+        labels = [''.join(rng.choice(alphabet) for _ in range(rng.randint(3, 12)))
+                  for _ in range(rng.randint(2, 4))]
+        domains.append(('.'.join(labels) + '.' + rng.choice(['com', 'net', 'org', 'io'])).encode())
+    return domains
+
+
+def measure(build, encoded):
+    """Return (bytes held after building, domains, seconds building without tracing)"""
+    start = time.perf_counter()
+    container = build(d.decode() for d in encoded)
+    elapsed = time.perf_counter() - start
+    del container
+
+    tracemalloc.start()
+    container = build(d.decode() for d in encoded)
+    size = len(container)
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return current, size, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark memory per domain of DomainStore vs set()")
+    parser.add_argument("--sizes", default="100000,1000000", help="Comma-separated domain counts")
+    args = parser.parse_args()
+
+    print(f"{'domains':>10} {'set B/domain':>13} {'store B/domain':>15} {'set s':>7} {'store s':>8}")
+    for count in [int(x) for x in args.sizes.split(",") if x.strip()]:
+        encoded = random_domains(count)
+        set_bytes, size, set_time = measure(set, encoded)
+        store_bytes, _, store_time = measure(DomainStore, encoded)
+        print(f"{size:>10} {set_bytes / size:>13.1f} {store_bytes / size:>15.1f} "
+              f"{set_time:>7.2f} {store_time:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+bench_feed_memory.py
+
+Memory benchmark for feed parsing: the old `read().decode().split('\\n')`
+approach against the streaming `iter_lines` pipeline from feed_parser.py.
+
+Usage:
+  python bench_feed_memory.py [--lines 2000000]
+
+A synthetic hosts-format feed is written to a temporary file, then each mode
+parses it into a domain set in a fresh subprocess and reports its peak RSS.
+Both modes end up holding the same domain set, so the difference is the
+transient cost of buffering the whole feed.
+"""
+
+import argparse
+import os
+import random
+import resource
+import string
+import subprocess
+import sys
+import tempfile
+import time
+
+from feed_parser import iter_lines
+
+
+def parse_hosts(lines):
+    """Minimal hosts/plain parser shared by both modes"""
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        parts = line.split()
+        domain = parts[1] if len(parts) >= 2 and parts[0] in ('0.0.0.0', '127.0.0.1') else parts[0]
+        if '.' in domain:
+            yield domain.lower()
+
+
+def write_feed(path, count, seed=1):
+    rng = random.Random(seed)
+    alphabet = string.ascii_lowercase + string.digits
+    with open(path, 'w') as f:
+        f.write("# synthetic hosts feed\n")
+        for _ in range(count):
+            label = ''.join(rng.choice(alphabet) for _ in range(rng.randint(4, 14)))
+            f.write(f"0.0.0.0 {label}.example{rng.randint(0, 999)}.com\n")
+
+
+def peak_rss_mb():
+    # ru_maxrss is KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_mode(mode, path):
+    start = time.perf_counter()
+    domains = set()
+    with open(path, 'rb') as f:
+        if mode == 'legacy':
+            content = f.read().decode('utf-8', errors='ignore')
+            domains.update(parse_hosts(content.split('\n')))
+        else:
+            domains.update(parse_hosts(iter_lines(f)))
+    elapsed = time.perf_counter() - start
+    print(f"{mode:>10} {len(domains):>10} {peak_rss_mb():>14.1f} {elapsed:>9.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark peak memory of feed parsing")
+    parser.add_argument("--lines", type=int, default=2000000, help="Lines in the synthetic feed")
+    parser.add_argument("--run", choices=["legacy", "streaming"], help=argparse.SUPPRESS)
+    parser.add_argument("--feed", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        run_mode(args.run, args.feed)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'feed.txt')
+        write_feed(path, args.lines)
+        print(f"Feed: {args.lines} lines, {os.path.getsize(path) / 1e6:.1f} MB")
+        print(f"{'mode':>10} {'domains':>10} {'peak RSS (MB)':>14} {'time (s)':>9}")
+        for mode in ('legacy', 'streaming'):
+            subprocess.run([sys.executable, os.path.abspath(__file__), '--run', mode, '--feed', path],
+                           check=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+bench_parallel_parse.py
+
+Benchmark of parallel_parse.parse_file: how parsing one large feed scales
+with the number of worker processes.
+
+Usage:
+  python bench_parallel_parse.py [--domains 3000000] [--format hosts] [--workers 1,2,4]
+
+Each worker count runs in a fresh subprocess on the same synthetic feed, so
+pool start-up is included in its time. The speedup is relative to the first
+worker count; it cannot exceed the number of CPUs, printed above the table.
+parse_file caps the workers at the CPUs available, so on a single CPU every
+row runs sequentially.
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from parallel_parse import available_cpus, parse_file
+from synthetic_corpus import FEED_FORMATS, write_feed
+
+
+def run_workers(path, workers):
+    start = time.perf_counter()
+    domains = parse_file(path, workers=workers, min_bytes=0)
+    print(f"{len(domains)} {time.perf_counter() - start}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark parallel feed parsing")
+    parser.add_argument("--domains", type=int, default=3000000, help="Domains in the feed")
+    parser.add_argument("--format", choices=FEED_FORMATS, default="hosts", help="Feed format")
+    parser.add_argument("--workers", default="1,2,4", help="Comma-separated worker counts")
+    parser.add_argument("--run", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--feed", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        run_workers(args.feed, args.run)
+        return
+
+    counts = [int(w) for w in args.workers.split(",") if w.strip()]
+    with tempfile.TemporaryDirectory() as tmp:
+        feed = os.path.join(tmp, f"feed.{args.format}")
+        write_feed(feed, args.domains, args.format, seed=1)
+        print(f"{os.path.getsize(feed) / 2**20:.0f} MiB {args.format} feed, {available_cpus()} CPUs")
+        print(f"{'workers':>7} {'domains':>10} {'seconds':>8} {'domains/s':>11} {'speedup':>8}")
+        base = None
+        for workers in counts:
+            out = subprocess.run([sys.executable, os.path.abspath(__file__), '--run', str(workers),
+                                  '--feed', feed], check=True, capture_output=True, text=True).stdout
+            domains, seconds = out.split()
+            seconds = float(seconds)
+            base = base or seconds
+            print(f"{workers:>7} {domains:>10} {seconds:>8.2f} {int(domains) / seconds:>11,.0f} "
+                  f"{base / seconds:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
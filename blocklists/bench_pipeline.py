@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+bench_pipeline.py
+
+End-to-end benchmark of the blocklist tooling on a synthetic corpus, with no
+network involved. Results are printed as JSON so runs can be compared
+between commits.
+
+Usage:
+  python bench_pipeline.py [--sizes 100000,1000000,5000000] [--corpus-dir DIR] [-o results.json]
+
+Each size is the total number of domains, spread over a hosts, an AdBlock
+and a plain feed generated by synthetic_corpus.py (cached in --corpus-dir
+when given). Every size runs in a fresh subprocess, through these stages:
+
+  parse       parse_feed(iter_lines(f)) per feed, as fetch_domains does
+  whitelist   is_allowlisted on every parsed domain, as download_blocklist does
+  merge_sort  DomainStore filled a feed at a time, then written
+              (as merge_blocklists.py does)
+  split       split_social_blocklist.split_domains with the default platforms
+  filter      split_social_blocklist.line_contains_matched on the first
+              feed lines, up to --line-sample lines or --filter-seconds (it
+              looks up each domain-like token of a line in the matched set);
+              compare its items_per_sec
+
+Peak memory is the process's ru_maxrss after each stage; since it never
+decreases, `rss_growth_mb` shows how much a stage raised it.
+"""
+
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from domain_store import DomainStore
+from feed_parser import iter_lines, parse_feed
+from split_social_blocklist import line_contains_matched, platform_name_from_pattern, split_domains
+from synthetic_corpus import FEED_FORMATS, write_feed
+
+DEFAULT_SIZES = "100000,1000000,5000000"
+SOCIAL_PATTERNS = ["youtube.com", "tiktok.com", "facebook.com", "instagram.com", "x.com", "twitter.com", "reddit.com"]
+
+
+def peak_rss_mb():
+    # ru_maxrss is KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def corpus_paths(corpus_dir, size, seed):
+    """Write (or reuse) the feeds of one corpus size; return {format: path}"""
+    paths = {}
+    per_feed = size // len(FEED_FORMATS)
+    for i, fmt in enumerate(FEED_FORMATS):
+        path = os.path.join(corpus_dir, f"{fmt}-{per_feed}-{seed + i}.txt")
+        if not os.path.exists(path):
+            write_feed(path + '.tmp', per_feed, fmt, seed + i)
+            os.replace(path + '.tmp', path)
+        paths[fmt] = path
+    return paths
+
+
+class StageTimer:
+    """Collect wall time, throughput and peak RSS for consecutive stages"""
+
+    def __init__(self):
+        self.stages = {}
+        self._rss = peak_rss_mb()
+
+    def record(self, name, start, items, **extra):
+        elapsed = time.perf_counter() - start
+        rss = peak_rss_mb()
+        self.stages[name] = {
+            'seconds': round(elapsed, 4),
+            'items': items,
+            'items_per_sec': round(items / elapsed) if elapsed > 0 else None,
+            'peak_rss_mb': round(rss, 1),
+            'rss_growth_mb': round(rss - self._rss, 1),
+            **extra,
+        }
+        self._rss = rss
+        print(f"  {name:>10} {items:>10} items {elapsed:>8.2f}s", file=sys.stderr)
+
+
+def run_size(size, corpus_dir, seed, line_sample, time_budget):
+    # Imported here so the cache directory it creates is only touched by workers
+    from merge_blocklists import is_allowlisted
+
+    paths = corpus_paths(corpus_dir, size, seed)
+    timer = StageTimer()
+    total_start = time.perf_counter()
+
+    start = time.perf_counter()
+    feeds = {}
+    for fmt, path in paths.items():
+        with open(path, 'rb') as f:
+            feeds[fmt] = set(parse_feed(iter_lines(f)))
+    parsed = sum(len(domains) for domains in feeds.values())
+    timer.record('parse', start, parsed, lines=size,
+                 bytes=sum(os.path.getsize(p) for p in paths.values()))
+
+    start = time.perf_counter()
+    for fmt, domains in feeds.items():
+        feeds[fmt] = {d for d in domains if not is_allowlisted(d)}
+    kept = sum(len(domains) for domains in feeds.values())
+    timer.record('whitelist', start, parsed, removed=parsed - kept)
+
+    start = time.perf_counter()
+    merged = DomainStore()
+    for fmt in list(feeds):
+        merged.update(feeds.pop(fmt))
+    with tempfile.TemporaryFile('wb') as out:
+        merged.write_to(out)
+    timer.record('merge_sort', start, kept, unique=len(merged))
+    del feeds
+
+    patterns = {}
+    for pat in SOCIAL_PATTERNS:
+        patterns.setdefault(platform_name_from_pattern(pat), []).append(pat)
+    start = time.perf_counter()
+    matched, others = split_domains(merged, patterns)
+    matched_all = set().union(*matched.values())
+    timer.record('split', start, len(merged), matched=len(matched_all), others=len(others))
+    del others
+
+    checked = removed = 0
+    start = time.perf_counter()
+    deadline = start + time_budget
+    with open(paths['hosts'], 'rb') as f:
+        for line in iter_lines(f):
+            if line_contains_matched(line, matched_all):
+                removed += 1
+            checked += 1
+            if checked >= line_sample or time.perf_counter() > deadline:
+                break
+    timer.record('filter', start, checked, removed=removed, matched_domains=len(matched_all))
+
+    return {
+        'size': size,
+        'seconds': round(time.perf_counter() - total_start, 4),
+        'peak_rss_mb': round(peak_rss_mb(), 1),
+        'stages': timer.stages,
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the blocklist pipeline on a synthetic corpus")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="Comma-separated corpus sizes (total domains)")
+    parser.add_argument("--corpus-dir", default=None, help="Keep generated feeds here and reuse them")
+    parser.add_argument("--seed", type=int, default=1, help="Corpus random seed")
+    parser.add_argument("--line-sample", type=int, default=20000,
+                        help="Most feed lines checked with line_contains_matched")
+    parser.add_argument("--filter-seconds", type=float, default=10.0,
+                        help="Time budget for the line_contains_matched stage")
+    parser.add_argument("-o", "--output", default=None, help="Write the JSON results here instead of stdout")
+    parser.add_argument("--run", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        json.dump(run_size(args.run, args.corpus_dir, args.seed, args.line_sample, args.filter_seconds),
+                  sys.stdout)
+        return
+
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+    with tempfile.TemporaryDirectory() as tmp:
+        corpus_dir = args.corpus_dir or tmp
+        os.makedirs(corpus_dir, exist_ok=True)
+        runs = []
+        for size in sizes:
+            print(f"Corpus of {size} domains:", file=sys.stderr)
+            proc = subprocess.run([sys.executable, os.path.abspath(__file__), '--run', str(size),
+                                   '--corpus-dir', corpus_dir, '--seed', str(args.seed),
+                                   '--line-sample', str(args.line_sample),
+                                   '--filter-seconds', str(args.filter_seconds)],
+                                  stdout=subprocess.PIPE, text=True, check=True)
+            runs.append(json.loads(proc.stdout))
+
+    results = {
+        'git_revision': git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'seed': args.seed,
+        'runs': runs,
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+            f.write('\n')
+        print(f"Wrote results to {args.output}", file=sys.stderr)
+    else:
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
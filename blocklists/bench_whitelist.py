@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+bench_whitelist.py
+
+Micro-benchmark for whitelist lookups: the suffix index in whitelist_index.py
+against the old linear `endswith` loop, for whitelists of growing size.
+
+Usage:
+  python bench_whitelist.py [--queries 20000] [--sizes 100,1000,10000,100000]
+
+Per-domain lookup time for the index should stay flat as the whitelist grows,
+while the linear loop grows with the number of entries.
+"""
+
+import argparse
+import random
+import string
+import time
+
+from whitelist_index import WhitelistIndex
+
+TLDS = ['com', 'net', 'org', 'io', 'co.uk', 'de', 'info', 'xyz']
+
+
+def random_label(rng):
+    return ''.join(rng.choice(string.ascii_lowercase + string.digits) for _ in range(rng.randint(3, 12)))
+
+
+def random_domain(rng, labels=2):
+    return '.'.join(random_label(rng) for _ in range(labels)) + '.' + rng.choice(TLDS)
+
+
+def linear_is_whitelisted(domain, whitelist):
+    """The lookup the scripts used before the suffix index"""
+    for whitelisted in whitelist:
+        if domain == whitelisted or domain.endswith('.' + whitelisted):
+            return True
+    return False
+
+
+def build_queries(rng, whitelist, count):
+    """Half subdomains of whitelisted entries, half unrelated domains"""
+    entries = list(whitelist)
+    queries = []
+    for i in range(count):
+        if i % 2:
+            queries.append(random_label(rng) + '.' + rng.choice(entries))
+        else:
+            queries.append(random_domain(rng, rng.randint(1, 4)))
+    return queries
+
+
+def time_per_lookup(check, queries):
+    start = time.perf_counter()
+    for domain in queries:
+        check(domain)
+    return (time.perf_counter() - start) / len(queries)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark whitelist lookups")
+    parser.add_argument("--queries", type=int, default=20000, help="Lookups per whitelist size")
+    parser.add_argument("--sizes", default="100,1000,10000,100000", help="Comma-separated whitelist sizes")
+    parser.add_argument("--linear-queries", type=int, default=200,
+                        help="Lookups used for the linear baseline (it is slow on big whitelists)")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    sizes = [int(x) for x in args.sizes.split(",") if x.strip()]
+
+    print(f"{'entries':>10} {'index ns/lookup':>16} {'linear ns/lookup':>17}")
+    for size in sizes:
+        whitelist = {random_domain(rng, 1) for _ in range(size)}
+        index = WhitelistIndex(whitelist)
+        queries = build_queries(rng, whitelist, args.queries)
+
+        index_time = time_per_lookup(index.__contains__, queries)
+        linear_time = time_per_lookup(lambda d: linear_is_whitelisted(d, whitelist),
+                                      queries[:args.linear_queries])
+        print(f"{len(whitelist):>10} {index_time * 1e9:>16.0f} {linear_time * 1e9:>17.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+classify_domains.py
+
+Sort the domains of a blocklist into categories (social, gambling, streaming,
+VPN/proxy, adult, ...) defined in a JSON file, writing one file per category.
+
+Usage:
+  python classify_domains.py -i youtube-blocklist.txt -c categories.json -o categories
+  python classify_domains.py -i blocker.txt -p youtube.com,tiktok.com -o categories --hosts-format
+
+Category file format (see categories.json):
+  {
+    "gambling": {
+      "suffixes": ["bet365.com"],           # the domain or any subdomain of it
+      "keywords": ["casino"],               # substring anywhere in the domain
+      "regexes":  ["(^|[.-])bet[.-]"]       # re.search on the lowercase domain
+    }
+  }
+
+`-p` adds one keyword category per pattern, named like the files of
+split_social_blocklist.py. A domain goes to every category it matches (and to
+other.txt if none). The input is read line by line, as in
+`split_social_blocklist.py --stream --dedup`, and each file lists its domains
+once, in input order.
+
+All categories are compiled into one matcher: a suffix index looked up once
+per label, one keyword automaton, and a second automaton over the literal
+text each regex requires, so only the regexes whose literal occurs in a
+domain are run. Classification cost therefore stays nearly flat as
+categories are added.
+"""
+
+from pathlib import Path
+import argparse
+import json
+import re
+import sys
+import time
+
+from hash_store import HashStore
+from multi_pattern import Automaton, required_literals
+from split_social_blocklist import DOMAIN_RE, normalize_pattern, platform_name_from_pattern
+
+DEFAULT_CATEGORIES = Path(__file__).resolve().parent / "categories.json"
+RULE_KINDS = ("suffixes", "keywords", "regexes")
+
+
+def category_slug(name):
+    return re.sub(r"[^a-z0-9_-]+", "-", name.strip().lower()).strip("-")
+
+
+def load_categories(path):
+    """Read and validate a category file; return {name: {kind: [rules]}}"""
+    with open(path, "r", encoding="utf-8") as f:
+        raw = json.load(f)
+    if not isinstance(raw, dict):
+        raise ValueError(f"{path}: expected an object mapping category names to rules")
+    categories = {}
+    for name, rules in raw.items():
+        unknown = set(rules) - set(RULE_KINDS)
+        if unknown:
+            raise ValueError(f"{path}: category {name!r} has unknown keys: {', '.join(sorted(unknown))}")
+        slug = category_slug(name)
+        if not slug or slug == "other":
+            raise ValueError(f"{path}: invalid category name {name!r}")
+        categories[slug] = {kind: [normalize_pattern(r) if kind != "regexes" else r
+                                   for r in rules.get(kind, []) if r.strip()]
+                            for kind in RULE_KINDS}
+    return categories
+
+
+class CategoryMatcher:
+    """All category rules compiled into one matcher; `match` returns a bit mask"""
+
+    def __init__(self, categories):
+        self.names = list(categories)
+        self._suffixes = {}
+        keywords = []
+        self._regexes = []
+        literals = []
+        self._unfiltered = []
+        for bit, name in enumerate(self.names):
+            rules = categories[name]
+            for suffix in rules["suffixes"]:
+                self._suffixes[suffix] = self._suffixes.get(suffix, 0) | (1 << bit)
+            keywords.extend((keyword, bit) for keyword in rules["keywords"])
+            for pattern in rules["regexes"]:
+                try:
+                    rule = (1 << bit, re.compile(pattern))
+                except re.error as e:
+                    raise ValueError(f"category {name!r}: invalid regex {pattern!r}: {e}") from None
+                required = required_literals(pattern)
+                if required is None:
+                    self._unfiltered.append(rule)
+                else:
+                    literals.extend((literal, len(self._regexes)) for literal in required)
+                    self._regexes.append(rule)
+        self._keywords = Automaton(keywords)
+        # A regex only runs on domains containing one of its required literals
+        self._regex_literals = Automaton(literals)
+
+    def match(self, domain):
+        mask = 0
+        candidate = domain
+        while True:
+            mask |= self._suffixes.get(candidate, 0)
+            dot = candidate.find(".")
+            if dot == -1:
+                break
+            candidate = candidate[dot + 1:]
+        for bit in self._keywords.values_in(domain):
+            mask |= 1 << bit
+        for index in self._regex_literals.values_in(domain):
+            bits, regex = self._regexes[index]
+            if not mask & bits and regex.search(domain):
+                mask |= bits
+        for bits, regex in self._unfiltered:
+            if not mask & bits and regex.search(domain):
+                mask |= bits
+        return mask
+
+    def categories_of(self, mask):
+        return [name for bit, name in enumerate(self.names) if mask & (1 << bit)]
+
+
+def classify_file(inp, matcher, out_dir, hosts_format=False):
+    """Classify every domain of `inp` in one pass; return ({category: count}, others, total)"""
+    names = matcher.names
+    seen = HashStore()
+    counts = {name: 0 for name in names}
+    others = 0
+    prefix = "0.0.0.0 " if hosts_format else ""
+    writers = [open(out_dir / f"{name}.txt", "w", encoding="utf-8") for name in names]
+    try:
+        with open(out_dir / "other.txt", "w", encoding="utf-8") as other, \
+                open(inp, "r", encoding="utf-8", errors="replace") as f:
+            for line in f:
+                for d in DOMAIN_RE.findall(line):
+                    d = d.lower()
+                    if not seen.add(d):
+                        continue
+                    mask = matcher.match(d)
+                    if not mask:
+                        other.write(prefix + d + "\n")
+                        others += 1
+                        continue
+                    bit = 0
+                    while mask:
+                        if mask & 1:
+                            writers[bit].write(prefix + d + "\n")
+                            counts[names[bit]] += 1
+                        mask >>= 1
+                        bit += 1
+    finally:
+        for w in writers:
+            w.close()
+    return counts, others, len(seen)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Classify blocklist domains into per-category files")
+    parser.add_argument("-i", "--input", default="youtube-blocklist.txt", help="Input blocklist file")
+    parser.add_argument("-c", "--categories", default=None,
+                        help=f"Category definition file (default: {DEFAULT_CATEGORIES.name} unless -p is given)")
+    parser.add_argument("-p", "--patterns", default="",
+                        help="Comma-separated extra patterns, one keyword category each (e.g. youtube.com)")
+    parser.add_argument("-o", "--out", default="categories", help="Output folder")
+    parser.add_argument("--hosts-format", action="store_true",
+                        help="Emit hosts-style lines (e.g. '0.0.0.0 domain') instead of plain domains")
+    args = parser.parse_args()
+
+    inp = Path(args.input)
+    if not inp.exists():
+        print(f"Input file not found: {inp}", file=sys.stderr)
+        sys.exit(2)
+
+    categories = {}
+    category_file = args.categories or (None if args.patterns else DEFAULT_CATEGORIES)
+    try:
+        if category_file:
+            categories = load_categories(category_file)
+        for pat in (normalize_pattern(x) for x in args.patterns.split(",") if x.strip()):
+            rules = categories.setdefault(platform_name_from_pattern(pat),
+                                          {kind: [] for kind in RULE_KINDS})
+            rules["keywords"].append(pat)
+        matcher = CategoryMatcher(categories)
+    except (OSError, ValueError) as e:
+        print(f"Cannot load categories: {e}", file=sys.stderr)
+        sys.exit(2)
+
+    out_dir = Path(args.out)
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    start = time.perf_counter()
+    counts, others, total = classify_file(inp, matcher, out_dir, args.hosts_format)
+    elapsed = time.perf_counter() - start
+
+    for name, count in counts.items():
+        print(f"Wrote {count} domains to {out_dir / f'{name}.txt'}")
+    print(f"Wrote {others} domains to {out_dir / 'other.txt'}")
+    rate = f" ({total / elapsed:,.0f} domains/s)" if elapsed > 0 else ""
+    print(f"Classified {total} domains into {len(counts)} categories in {elapsed:.2f}s{rate}")
+
+
+if __name__ == "__main__":
+    main()
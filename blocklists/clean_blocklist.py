@@ -1,8 +1,31 @@
 #!/usr/bin/env python3
 """
 Clean blocker.txt by removing whitelisted domains that are essential for normal internet usage
+
+Usage:
+  python clean_blocklist.py [-i blocker.txt] [-o cleaned.txt] [--removed whitelisted_domains.txt] [-v]
+                            [--prune never_hit.txt ...] [--whitelist keep.txt ...]
+
+--prune also drops every domain listed in the given files, e.g. the prune
+lists of query_log_analyzer.py (never queried) or prune_dead_domains.py
+(NXDOMAIN). Those files are the record of what was pruned.
+
+--whitelist adds the domains listed in the given files (one per line, '#'
+comments allowed) to the built-in whitelist.
 """
 
+import argparse
+import os
+import time
+
+from instrumentation import METRICS, add_arguments as add_metrics_arguments
+from whitelist_index import WhitelistIndex, normalize_entry
+
+HEADER_PREFIX = '# Total unique domains:'
+PROGRESS_EVERY = 500000
+# The count is padded to this width so the header can be patched in place
+COUNT_WIDTH = 12
+
 WHITELIST = {
     # Payment processors and gateways
     'paypal.com',
@@ -85,69 +108,145 @@ WHITELIST = {
     'stackpath.com',
 }
 
+WHITELIST_INDEX = WhitelistIndex(WHITELIST)
+
 def is_whitelisted(domain):
     """Check if a domain should be whitelisted (not blocked)"""
-    domain = domain.lower().strip()
-    
     # Handle regex patterns (remove || and ^)
-    if domain.startswith('||') and domain.endswith('^'):
-        domain = domain[2:-1]
-    
-    for whitelisted in WHITELIST:
-        if domain == whitelisted or domain.endswith('.' + whitelisted):
-            return True
-    return False
-
-def clean_blocklist(input_file, output_file, removed_file):
-    """Clean the blocklist by removing whitelisted domains"""
-    cleaned_domains = []
+    domain = normalize_entry(domain)
+    return domain in WHITELIST_INDEX
+
+def _header_line(count):
+    return f'{HEADER_PREFIX} {count:<{COUNT_WIDTH}}\n'
+
+
+def _replace_line(path, offset, old_len, new_line, encoding):
+    """Overwrite the line of `old_len` bytes at `offset` in `path` with `new_line` of the same width"""
+    # Encoded as the text-mode file that was written (newlines become os.linesep)
+    encoded = new_line.replace('\n', os.linesep).encode(encoding)
+    if len(encoded) != old_len:
+        raise ValueError(f"header line is {old_len} bytes, its replacement {len(encoded)}")
+    with open(path, 'r+b') as f:
+        f.seek(offset)
+        f.write(encoded)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def read_prune_list(paths):
+    """Set of the domains listed in prune files (one per line, '#' comments)"""
+    prune = set()
+    for path in paths:
+        with open(path, 'r', encoding='utf-8', errors='ignore') as f:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith('#'):
+                    prune.add(line.lower())
+    return prune
+
+
+def clean_blocklist(input_file, output_file, removed_file, verbose=False, prune=frozenset()):
+    """Clean the blocklist by removing whitelisted domains (and any in `prune`).
+
+    The input is streamed into a temporary file next to `output_file`,
+    which replaces it atomically once complete, so an interrupted run
+    leaves the old file untouched (input and output may be the same file).
+    """
     removed_domains = []
-    removed_count = 0
+    pruned = 0
+    domain_count = 0
+    lines_read = 0
+    header = None  # (byte offset, byte length, encoding) of the total-domains line
+    tmp_file = output_file + '.tmp'
 
     try:
-        with open(input_file, 'r') as f:
+        start = time.monotonic()
+        with METRICS.span('clean') as span, open(input_file, 'r') as f, open(tmp_file, 'w') as out:
             for line in f:
+                lines_read += 1
+                if lines_read % PROGRESS_EVERY == 0:
+                    print(f"  ... {lines_read} lines, {len(removed_domains)} removed")
                 line_stripped = line.strip()
-                if not line_stripped or line_stripped.startswith('#'):
-                    cleaned_domains.append(line)
+                if line_stripped and not line_stripped.startswith('#'):
+                    if is_whitelisted(line_stripped):
+                        removed_domains.append(line_stripped)
+                        continue
+                    if prune and line_stripped.lower() in prune:
+                        pruned += 1
+                        continue
+                if line.strip() and not line.startswith('#'):
+                    domain_count += 1
+                elif header is None and line.startswith(HEADER_PREFIX):
+                    offset = out.tell()
+                    out.write(_header_line(0))
+                    header = (offset, out.tell() - offset, out.encoding)
                     continue
+                out.write(line)
+            out.flush()
+            os.fsync(out.fileno())
+            span.count(domains_in=domain_count + len(removed_domains) + pruned, domains_out=domain_count)
 
-                if is_whitelisted(line_stripped):
-                    removed_count += 1
-                    removed_domains.append(line_stripped)
-                    print(f"Removed whitelisted domain: {line_stripped}")
-                else:
-                    cleaned_domains.append(line)
-
-        # Update the header with new count
-        header_updated = False
-        for i, line in enumerate(cleaned_domains):
-            if line.startswith('# Total unique domains:'):
-                # Count actual domains
-                domain_count = sum(1 for l in cleaned_domains if l.strip() and not l.startswith('#'))
-                cleaned_domains[i] = f'# Total unique domains: {domain_count}\n'
-                header_updated = True
-                break
-
-        with open(output_file, 'w') as f:
-            f.writelines(cleaned_domains)
+        # Update the header with the count taken during the pass
+        if header is not None:
+            offset, length, encoding = header
+            _replace_line(tmp_file, offset, length, _header_line(domain_count), encoding)
+        os.replace(tmp_file, output_file)
 
         # Write removed domains to separate file
-        with open(removed_file, 'w') as f:
+        removed_domains.sort()
+        with METRICS.span('write_removed') as span, open(removed_file + '.tmp', 'w') as f:
             f.write("# Whitelisted domains removed from blocker.txt\n")
             f.write(f"# Total removed: {len(removed_domains)}\n")
             f.write("# Date: 2026-03-13\n\n")
-            for domain in sorted(removed_domains):
-                f.write(domain + '\n')
-
-        print(f"\nCleaning complete:")
-        print(f"Removed {removed_count} whitelisted domains")
-        print(f"Remaining domains: {sum(1 for l in cleaned_domains if l.strip() and not l.startswith('#'))}")
+            f.writelines(domain + '\n' for domain in removed_domains)
+            span.count(domains_out=len(removed_domains))
+        os.replace(removed_file + '.tmp', removed_file)
+
+        if verbose and removed_domains:
+            print("\n".join(f"Removed whitelisted domain: {d}" for d in removed_domains))
+        print(f"\nCleaning complete in {time.monotonic() - start:.1f}s:")
+        print(f"Removed {len(removed_domains)} whitelisted domains")
+        if prune:
+            print(f"Pruned {pruned} domains listed in the prune files")
+        print(f"Remaining domains: {domain_count}")
         print(f"Cleaned blocklist saved to: {output_file}")
         print(f"Removed domains recorded in: {removed_file}")
 
     except Exception as e:
+        for path in (tmp_file, removed_file + '.tmp'):
+            if os.path.exists(path):
+                os.remove(path)
         print(f"Error cleaning blocklist: {e}")
 
+
+def main():
+    parser = argparse.ArgumentParser(description="Remove whitelisted domains from a blocklist")
+    parser.add_argument("-i", "--input", default="blocker.txt", help="Blocklist to clean")
+    parser.add_argument("-o", "--output", default=None, help="Cleaned blocklist (default: overwrite the input)")
+    parser.add_argument("--removed", default="whitelisted_domains.txt", help="Where to record removed domains")
+    parser.add_argument("-v", "--verbose", action="store_true", help="List every removed domain")
+    parser.add_argument("--prune", action="append", default=[], metavar="FILE",
+                        help="Also remove the domains listed in FILE (repeatable)")
+    parser.add_argument("--whitelist", action="append", default=[], metavar="FILE",
+                        help="Also keep the domains listed in FILE, and their subdomains (repeatable)")
+    add_metrics_arguments(parser, 'clean_blocklist')
+    args = parser.parse_args()
+    METRICS.start_from_args(args)
+    try:
+        for path in args.whitelist:
+            WHITELIST_INDEX.load_file(path)
+    except OSError as e:
+        print(f"Error reading whitelist: {e}")
+        return
+    try:
+        with METRICS.span('read_prune') as span:
+            prune = read_prune_list(args.prune)
+            span.count(domains_out=len(prune))
+    except OSError as e:
+        print(f"Error reading prune list: {e}")
+        return
+    clean_blocklist(args.input, args.output or args.input, args.removed, args.verbose, prune)
+
+
 if __name__ == "__main__":
-    clean_blocklist('blocker.txt', 'blocker.txt', 'whitelisted_domains.txt')
\ No newline at end of file
+    main()
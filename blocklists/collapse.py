@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+"""
+collapse.py
+
+Drop domains that are already covered by a blocked parent domain.
+
+AdGuard Home, dnsmasq (`address=/x/`) and unbound `local-zone` block a whole
+subtree, so when `example.com` is listed, `a.example.com` and `b.example.com`
+are redundant. The domains are sorted by their reversed labels, which puts
+every domain directly before its subdomains, and a single linear pass keeps
+only the domains whose ancestor has not been kept already.
+
+Do not collapse lists meant for exact-match consumers such as hosts files:
+there `example.com` does not block `a.example.com`.
+"""
+
+# Sorts below every character that can appear in a label, so a domain's
+# subdomains always follow it directly (e.g. before `example-foo.com`)
+_SEP = '\x00'
+
+
+def reversed_key(domain):
+    return _SEP.join(reversed(domain.split('.')))
+
+
+def collapse_subdomains(domains):
+    """Return (kept, removed_count, removed_bytes) for an iterable of domains.
+
+    `kept` is a list in reversed-label order; removed_bytes counts the
+    output bytes (domain plus newline) saved by dropping the subdomains.
+    """
+    kept = []
+    removed = 0
+    removed_bytes = 0
+    root = None
+    for key in sorted(map(reversed_key, domains)):
+        if root is not None and key.startswith(root):
+            removed += 1
+            removed_bytes += len(key) + 1
+            continue
+        kept.append('.'.join(reversed(key.split(_SEP))))
+        root = key + _SEP
+    return kept, removed, removed_bytes
@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+"""
+compiled_blocklist.py
+
+Compile the merged blocklist into a memory-mappable binary file that answers
+"is this domain blocked, and by which upstream lists?" in microseconds.
+
+Usage:
+  python compiled_blocklist.py compile -i youtube-blocklist.txt -o blocklist.bin
+  python compiled_blocklist.py lookup -b blocklist.bin ads.example.com www.example.org
+
+  from compiled_blocklist import CompiledBlocklist
+
+  with CompiledBlocklist('blocklist.bin') as blocklist:
+      match = blocklist.match('a.ads.example.com')   # ('ads.example.com', ['Steven Black'])
+
+File layout (little-endian):
+  header   magic, version, source count, slot count, domain count and the
+           offsets of the sections below
+  sources  JSON list of source names; bit i of a mask is source i
+  slots    open-addressing hash table, 16 bytes per slot:
+           u64 hash (0 = empty), u32 offset of the name, u32 source mask
+  names    UTF-8 domain names, each after a u16 byte length
+
+Provenance comes from the per-source snapshots written by merge_blocklists.py.
+Domains of the merged list that no snapshot contains are attributed to a
+"local" source (the hand-maintained part of the list). Opening the file is one
+`mmap` call; lookups hash the name and probe the table without loading it.
+"""
+
+from hashlib import blake2b
+import argparse
+import json
+import mmap
+import os
+import struct
+import sys
+import time
+
+from snapshots import DEFAULT_SNAPSHOT_DIR, SnapshotStore
+
+MAGIC = b'PHBLIST\x00'
+VERSION = 3
+HEADER = struct.Struct('<8sIIQQQQQ')
+SLOT = struct.Struct('<QII')
+NAME_LENGTH = struct.Struct('<H')
+MAX_NAME_BYTES = (1 << 16) - 1
+LOCAL_SOURCE = 'local'
+MAX_SOURCES = 32
+LOAD_FACTOR = 0.6
+
+
+def domain_hash(name_bytes):
+    # Never 0, which marks an empty slot
+    return int.from_bytes(blake2b(name_bytes, digest_size=8).digest(), 'little') | 1
+
+
+def first_slot(h, num_slots):
+    # Bit 0 of the hash is always set, so the slot comes from the bits above it
+    return (h >> 1) & (num_slots - 1)
+
+
+def _iter_list(file_path):
+    with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                yield line.lower()
+
+
+def compile_blocklist(input_path, output_path, snapshots=None, source_names=()):
+    """Compile a blocklist file; return the number of domains written.
+
+    `source_names` are looked up in `snapshots` (a SnapshotStore) to build
+    the per-domain source masks. A merged list is sorted and streamed; any
+    other input is sorted in memory first. Names too long for their length
+    prefix are skipped.
+    """
+    source_names = [name for name in source_names if snapshots and snapshots.exists(name)]
+    sources = source_names + [LOCAL_SOURCE]
+    if len(sources) > MAX_SOURCES:
+        raise ValueError(f"At most {MAX_SOURCES} sources fit in a mask, got {len(sources)}")
+    local_bit = 1 << (len(sources) - 1)
+
+    count = 0
+    is_sorted = True
+    previous = ''
+    for domain in _iter_list(input_path):
+        count += 1
+        if domain < previous:
+            is_sorted = False
+        previous = domain
+    # The source walk below needs the list in the snapshots' sorted order
+    domains = _iter_list(input_path) if is_sorted else sorted(set(_iter_list(input_path)))
+    num_slots = 1
+    while num_slots * LOAD_FACTOR < max(count, 1):
+        num_slots <<= 1
+    slots = bytearray(num_slots * SLOT.size)
+    names = bytearray()
+
+    # The blocklist and all snapshots are sorted, so one merge walk finds
+    # which snapshots contain each domain
+    iterators = [snapshots.iter_domains(name) for name in source_names]
+    heads = [next(it, None) for it in iterators]
+    previous = None
+    written = 0
+    for domain in domains:
+        if domain == previous:
+            continue
+        previous = domain
+        mask = 0
+        for i, it in enumerate(iterators):
+            while heads[i] is not None and heads[i] < domain:
+                heads[i] = next(it, None)
+            if heads[i] == domain:
+                mask |= 1 << i
+        if not mask:
+            mask = local_bit
+
+        encoded = domain.encode('utf-8')
+        if len(encoded) > MAX_NAME_BYTES:
+            continue
+        h = domain_hash(encoded)
+        slot = first_slot(h, num_slots)
+        while SLOT.unpack_from(slots, slot * SLOT.size)[0]:
+            slot = (slot + 1) & (num_slots - 1)
+        SLOT.pack_into(slots, slot * SLOT.size, h, len(names), mask)
+        names += NAME_LENGTH.pack(len(encoded))
+        names += encoded
+        written += 1
+
+    sources_blob = json.dumps(sources).encode('utf-8')
+    sources_offset = HEADER.size
+    slots_offset = sources_offset + len(sources_blob)
+    names_offset = slots_offset + len(slots)
+    tmp_path = output_path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(sources), num_slots, written,
+                            sources_offset, slots_offset, names_offset))
+        f.write(sources_blob)
+        f.write(slots)
+        f.write(names)
+    os.replace(tmp_path, output_path)
+    return written
+
+
+class CompiledBlocklist:
+    """Read-only, memory-mapped view of a compiled blocklist"""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, num_sources, self._num_slots, self.count,
+         sources_offset, self._slots_offset, self._names_offset) = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != VERSION:
+            self._map.close()
+            raise ValueError(f"{path} is not a compiled blocklist (version {VERSION})")
+        self.sources = json.loads(self._map[sources_offset:self._slots_offset])
+
+    def lookup(self, domain):
+        """Return the source mask of an exact match, or 0 if `domain` is not listed"""
+        encoded = domain.lower().encode('utf-8')
+        h = domain_hash(encoded)
+        data = self._map
+        mask_slots = self._num_slots - 1
+        slot = first_slot(h, self._num_slots)
+        while True:
+            stored_hash, name_offset, mask = SLOT.unpack_from(data, self._slots_offset + slot * SLOT.size)
+            if not stored_hash:
+                return 0
+            if stored_hash == h:
+                start = self._names_offset + name_offset
+                length, = NAME_LENGTH.unpack_from(data, start)
+                start += NAME_LENGTH.size
+                if data[start:start + length] == encoded:
+                    return mask
+            slot = (slot + 1) & mask_slots
+
+    def sources_of(self, mask):
+        return [name for i, name in enumerate(self.sources) if mask & (1 << i)]
+
+    def match(self, domain):
+        """Return (listed_domain, sources) for `domain` or its nearest listed parent, else None"""
+        domain = domain.lower().rstrip('.')
+        candidate = domain
+        while True:
+            mask = self.lookup(candidate)
+            if mask:
+                return candidate, self.sources_of(mask)
+            dot = candidate.find('.')
+            if dot == -1:
+                return None
+            candidate = candidate[dot + 1:]
+
+    def __contains__(self, domain):
+        return self.match(domain) is not None
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        """Listed domains in the order of the compiled input (sorted for merged lists)"""
+        data = self._map
+        offset = self._names_offset
+        end = len(data)
+        while offset < end:
+            length, = NAME_LENGTH.unpack_from(data, offset)
+            offset += NAME_LENGTH.size
+            yield data[offset:offset + length].decode('utf-8')
+            offset += length
+
+    def close(self):
+        self._map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compile the merged blocklist and query it")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    build = sub.add_parser("compile", help="Compile a blocklist file")
+    build.add_argument("-i", "--input", default="youtube-blocklist.txt", help="Merged blocklist file")
+    build.add_argument("-o", "--output", default="blocklist.bin", help="Compiled output file")
+    build.add_argument("--snapshot-dir", default=DEFAULT_SNAPSHOT_DIR,
+                       help="Per-source snapshots written by merge_blocklists.py")
+
+    query = sub.add_parser("lookup", help="Check whether domains are blocked and by which sources")
+    query.add_argument("-b", "--blocklist", default="blocklist.bin", help="Compiled blocklist file")
+    query.add_argument("domains", nargs="+", help="Domains to look up")
+    args = parser.parse_args()
+
+    if args.command == "compile":
+        from merge_blocklists import BLOCKLISTS
+        start = time.perf_counter()
+        written = compile_blocklist(args.input, args.output, SnapshotStore(args.snapshot_dir),
+                                    [name for name, _ in BLOCKLISTS])
+        print(f"Compiled {written} domains into {args.output} in {time.perf_counter() - start:.1f}s "
+              f"({os.path.getsize(args.output)} bytes)")
+        return
+
+    if not os.path.exists(args.blocklist):
+        print(f"Compiled blocklist not found: {args.blocklist}", file=sys.stderr)
+        sys.exit(2)
+    with CompiledBlocklist(args.blocklist) as blocklist:
+        for domain in args.domains:
+            start = time.perf_counter()
+            match = blocklist.match(domain)
+            elapsed = (time.perf_counter() - start) * 1e6
+            if match:
+                listed, sources = match
+                via = "" if listed == domain.lower() else f" (via {listed})"
+                print(f"BLOCKED  {domain}{via} by {', '.join(sources)}  [{elapsed:.1f} µs]")
+            else:
+                print(f"allowed  {domain}  [{elapsed:.1f} µs]")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+"""
+dns_wire.py
+
+Minimal DNS wire format (RFC 1035) and an asyncio UDP client that keeps
+thousands of queries in flight on a single socket.
+
+Usage:
+  from dns_wire import DNSClient, RCODE_NXDOMAIN
+
+  client = DNSClient(('127.0.0.1', 53), max_in_flight=2000)
+  await client.open()
+  response = await client.query('example.com')   # None after all retries timed out
+  if response and response.rcode == RCODE_NXDOMAIN:
+      ...
+  client.close()
+
+Only what the scripts need is decoded: the header, the question, the answer
+count and smallest answer TTL, and the negative-caching TTL of an SOA in the
+authority section (RFC 2308: the smaller of the record TTL and the SOA
+MINIMUM field). Responses are matched to queries by ID and question name, so
+a late answer to a timed-out query cannot complete an unrelated one.
+
+For servers (see dns/sinkhole.py) there is parse_query, build_response for
+locally generated answers and adjust_ttls to age a cached response.
+"""
+
+from collections import deque, namedtuple
+import asyncio
+import random
+import socket
+import struct
+
+QTYPE_A = 1
+QTYPE_SOA = 6
+QTYPE_AAAA = 28
+QTYPE_OPT = 41
+CLASS_IN = 1
+
+RCODE_NOERROR = 0
+RCODE_FORMERR = 1
+RCODE_SERVFAIL = 2
+RCODE_NXDOMAIN = 3
+RCODE_NOTIMP = 4
+RCODE_REFUSED = 5
+RCODE_NAMES = {0: 'NOERROR', 1: 'FORMERR', 2: 'SERVFAIL', 3: 'NXDOMAIN', 4: 'NOTIMP', 5: 'REFUSED'}
+
+# Receive buffer asked for, so a burst of answers is not dropped by the kernel
+RECV_BUFFER = 4 << 20
+
+FLAG_QR = 0x8000
+OPCODE_MASK = 0x7800
+FLAG_AA = 0x0400
+FLAG_TC = 0x0200
+FLAG_RD = 0x0100
+FLAG_RA = 0x0080
+
+_HEADER = struct.Struct('!HHHHHH')
+_QUESTION = struct.Struct('!HH')
+_RR = struct.Struct('!HHIH')
+_SOA_TIMERS = struct.Struct('!IIIII')
+# Length prefix of messages over TCP
+_LENGTH = struct.Struct('!H')
+
+Response = namedtuple('Response', ['qid', 'rcode', 'name', 'qtype', 'answers', 'min_ttl', 'negative_ttl',
+                                   'truncated'])
+# `question` is the raw question section, echoed back in answers
+Query = namedtuple('Query', ['qid', 'flags', 'name', 'qtype', 'qclass', 'question'])
+
+
+def parse_server(value, default_port=53):
+    """'host[:port]' or '[v6]:port' -> (host, port); raise ValueError if invalid"""
+    if value.startswith('['):
+        host, _, port = value[1:].partition(']:')
+        return host.rstrip(']'), int(port or default_port)
+    if value.count(':') == 1:
+        host, port = value.split(':')
+        return host, int(port)
+    return value, default_port
+
+
+def encode_name(name):
+    """Encode a domain name as length-prefixed labels; raise ValueError if invalid"""
+    out = bytearray()
+    for label in name.rstrip('.').split('.'):
+        raw = label.encode('ascii') if label.isascii() else label.encode('idna')
+        if not raw or len(raw) > 63:
+            raise ValueError(f"invalid label in {name!r}")
+        out.append(len(raw))
+        out += raw
+    out.append(0)
+    if len(out) > 255:
+        raise ValueError(f"name too long: {name!r}")
+    return bytes(out)
+
+
+def read_name(data, offset):
+    """Decode the (possibly compressed) name at `offset`; return (name, offset after it)"""
+    labels = []
+    end = None
+    jumps = 0
+    while True:
+        length = data[offset]
+        if length & 0xC0 == 0xC0:
+            if end is None:
+                end = offset + 2
+            jumps += 1
+            if jumps > 64:
+                raise ValueError("compression loop")
+            offset = ((length & 0x3F) << 8) | data[offset + 1]
+            continue
+        offset += 1
+        if not length:
+            break
+        labels.append(data[offset:offset + length].decode('ascii', 'replace'))
+        offset += length
+    return '.'.join(labels).lower(), end if end is not None else offset
+
+
+def build_query(qid, name, qtype=QTYPE_A, recursion=True):
+    flags = FLAG_RD if recursion else 0
+    return _HEADER.pack(qid, flags, 1, 0, 0, 0) + encode_name(name) + _QUESTION.pack(qtype, CLASS_IN)
+
+
+def _records(data, offset, count):
+    """Yield (offset of the TTL field, type, TTL, rdata offset, rdata length) of `count` records"""
+    for _ in range(count):
+        _, offset = read_name(data, offset)
+        rtype, _, ttl, rdlength = _RR.unpack_from(data, offset)
+        yield offset + 4, rtype, ttl, offset + _RR.size, rdlength
+        offset += _RR.size + rdlength
+
+
+def _sections(data):
+    """Header counts and the offset of the answer section of a message"""
+    qid, flags, qdcount, ancount, nscount, arcount = _HEADER.unpack_from(data)
+    offset = _HEADER.size
+    name = qtype = None
+    for _ in range(qdcount):
+        name, offset = read_name(data, offset)
+        qtype = _QUESTION.unpack_from(data, offset)[0]
+        offset += _QUESTION.size
+    return qid, flags, name, qtype, offset, (ancount, nscount, arcount)
+
+
+def parse_response(data):
+    """Decode a response datagram into a Response; raise ValueError if malformed"""
+    try:
+        qid, flags, name, qtype, offset, (ancount, nscount, _) = _sections(data)
+        if not flags & FLAG_QR:
+            raise ValueError("not a response")
+        min_ttl = None
+        end = offset
+        for _, _, ttl, rdata, rdlength in _records(data, offset, ancount):
+            min_ttl = ttl if min_ttl is None else min(min_ttl, ttl)
+            end = rdata + rdlength
+        negative_ttl = None
+        for _, rtype, ttl, rdata, _ in _records(data, end, nscount):
+            if rtype == QTYPE_SOA:
+                _, soa = read_name(data, rdata)
+                _, soa = read_name(data, soa)
+                minimum = _SOA_TIMERS.unpack_from(data, soa)[4]
+                negative_ttl = min(ttl, minimum)
+    except (IndexError, struct.error) as e:
+        raise ValueError(f"truncated response: {e}") from None
+    return Response(qid, flags & 0xF, name, qtype, ancount, min_ttl, negative_ttl, bool(flags & FLAG_TC))
+
+
+def parse_query(data):
+    """Decode a single-question query into a Query; raise ValueError if malformed"""
+    try:
+        qid, flags, qdcount, _, _, _ = _HEADER.unpack_from(data)
+        if flags & FLAG_QR or qdcount != 1:
+            raise ValueError("not a single-question query")
+        name, end = read_name(data, _HEADER.size)
+        qtype, qclass = _QUESTION.unpack_from(data, end)
+    except (IndexError, struct.error) as e:
+        raise ValueError(f"truncated query: {e}") from None
+    return Query(qid, flags, name, qtype, qclass, bytes(data[_HEADER.size:end + _QUESTION.size]))
+
+
+def build_response(query, rcode=RCODE_NOERROR, answers=()):
+    """Answer `query` locally; `answers` are (type, TTL, rdata) records for the question name"""
+    flags = FLAG_QR | FLAG_RA | (query.flags & (OPCODE_MASK | FLAG_RD)) | rcode
+    records = b''.join(b'\xc0\x0c' + _RR.pack(rtype, CLASS_IN, ttl, len(rdata)) + rdata
+                       for rtype, ttl, rdata in answers)
+    return _HEADER.pack(query.qid, flags, 1, len(answers), 0, 0) + query.question + records
+
+
+def adjust_ttls(data, elapsed):
+    """Copy of a response with every record TTL lowered by `elapsed` seconds (not below 0)"""
+    out = bytearray(data)
+    _, _, _, _, offset, counts = _sections(data)
+    for count in counts:
+        for ttl_offset, rtype, ttl, rdata, rdlength in _records(data, offset, count):
+            if rtype != QTYPE_OPT:  # the OPT "TTL" holds EDNS flags
+                struct.pack_into('!I', out, ttl_offset, max(ttl - elapsed, 0))
+            offset = rdata + rdlength
+    return bytes(out)
+
+
+class _ClientProtocol(asyncio.DatagramProtocol):
+    def __init__(self, client):
+        self.client = client
+
+    def datagram_received(self, data, addr):
+        self.client._received(data)
+
+    def error_received(self, exc):
+        # ICMP port unreachable etc.: the pending queries simply time out
+        pass
+
+
+class DNSClient:
+    """Asyncio UDP DNS client; one socket, query IDs matched to futures"""
+
+    def __init__(self, server, timeout=2.0, retries=1, max_in_flight=1000):
+        if not 0 < max_in_flight <= 65536:
+            raise ValueError("max_in_flight must be between 1 and 65536")
+        self.server = server
+        self.timeout = timeout
+        self.retries = retries
+        self.max_in_flight = max_in_flight
+        self._transport = None
+        self._pending = {}
+        # IDs are handed out in random order and reused last-released-last,
+        # so a late answer rarely meets a reused ID
+        ids = list(range(65536))
+        random.shuffle(ids)
+        self._free_ids = deque(ids)
+        self.sent = 0
+        self.received = 0
+        self.timeouts = 0
+
+    async def open(self):
+        loop = asyncio.get_running_loop()
+        self._slots = asyncio.Semaphore(self.max_in_flight)
+        self._transport, _ = await loop.create_datagram_endpoint(
+            lambda: _ClientProtocol(self), remote_addr=self.server)
+        sock = self._transport.get_extra_info('socket')
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECV_BUFFER)
+        except OSError:
+            pass
+
+    def close(self):
+        if self._transport is not None:
+            self._transport.close()
+            self._transport = None
+
+    def _received(self, data):
+        try:
+            response = parse_response(data)
+        except ValueError:
+            return
+        pending = self._pending.get(response.qid)
+        if pending is None:
+            return
+        name, future = pending
+        if response.name == name and not future.done():
+            self.received += 1
+            future.set_result((response, data))
+
+    async def query(self, name, qtype=QTYPE_A):
+        """Return the Response for `name`, or None if every attempt timed out"""
+        result = await self.exchange(name, qtype)
+        return result and result[0]
+
+    async def exchange(self, name, qtype=QTYPE_A):
+        """Return (Response, raw datagram) for `name`, or None if every attempt timed out"""
+        name = name.rstrip('.').lower()
+        question = encode_name(name) + _QUESTION.pack(qtype, CLASS_IN)
+        loop = asyncio.get_running_loop()
+        async with self._slots:
+            for _ in range(self.retries + 1):
+                qid = self._free_ids.popleft()
+                future = loop.create_future()
+                self._pending[qid] = (name, future)
+                self._transport.sendto(_HEADER.pack(qid, FLAG_RD, 1, 0, 0, 0) + question)
+                self.sent += 1
+                try:
+                    return await asyncio.wait_for(future, self.timeout)
+                except asyncio.TimeoutError:
+                    self.timeouts += 1
+                finally:
+                    del self._pending[qid]
+                    self._free_ids.append(qid)
+        return None
+
+
+async def tcp_exchange(server, name, qtype=QTYPE_A, timeout=2.0):
+    """One query over TCP (for answers truncated over UDP); return (Response, raw message) or None"""
+    name = name.rstrip('.').lower()
+    qid = random.getrandbits(16)
+    message = build_query(qid, name, qtype)
+    try:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(*server), timeout)
+        try:
+            writer.write(_LENGTH.pack(len(message)) + message)
+            length = _LENGTH.unpack(await asyncio.wait_for(reader.readexactly(2), timeout))[0]
+            data = await asyncio.wait_for(reader.readexactly(length), timeout)
+        finally:
+            writer.close()
+        response = parse_response(data)
+    except (OSError, ValueError, asyncio.TimeoutError, asyncio.IncompleteReadError):
+        return None
+    if response.qid != qid or response.name != name:
+        return None
+    return response, data
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+domain_store.py
+
+Compact, array-backed container for large domain sets.
+
+A plain `set()` of str costs roughly 100 bytes per domain once the str objects
+and hash table slots are counted. DomainStore keeps the domains as one sorted
+UTF-8 blob of newline-terminated names plus an array of 4-byte offsets, i.e.
+about the length of the domain plus 5 bytes. New domains go into a pending set
+that is merged into the blob once it grows past PENDING_LIMIT (or an eighth of
+the store, whichever is larger).
+
+It supports the set operations the scripts need: add/update, `in`, len,
+sorted iteration, union (`|`, `|=`) and difference (`-`) with another store
+or any iterable of domains. Because the blob is already one domain per line,
+`write_to(f)` dumps the sorted list without building any str objects.
+
+Usage:
+  from domain_store import DomainStore
+
+  domains = DomainStore()
+  domains.update(parse_feed(lines))
+  for domain in domains | other:   # sorted
+      ...
+"""
+
+from array import array
+from bisect import bisect_right
+from itertools import accumulate
+
+PENDING_LIMIT = 1 << 16
+
+# Items re-split from the blob at a time while merging
+SEGMENT_SIZE = 1 << 14
+
+
+class DomainStore:
+    """Sorted newline-terminated UTF-8 blob + offset array, with a pending set for recent adds"""
+
+    def __init__(self, domains=()):
+        self._blob = b''
+        self._offsets = array('I', [0])
+        self._pending = set()
+        self._limit = PENDING_LIMIT
+        self.update(domains)
+
+    @classmethod
+    def from_sorted(cls, domains):
+        """Build a store from domains already in sorted order (duplicates allowed)"""
+        store = cls()
+        blob = bytearray()
+        offsets = store._offsets
+        previous = None
+        for domain in domains:
+            if domain != previous:
+                blob += domain.encode('utf-8') + b'\n'
+                offsets.append(len(blob))
+                previous = domain
+        store._blob = bytes(blob)
+        store._limit = max(PENDING_LIMIT, len(offsets) >> 3)
+        return store
+
+    def _count(self):
+        return len(self._offsets) - 1
+
+    def _item(self, i):
+        offsets = self._offsets
+        return self._blob[offsets[i]:offsets[i + 1] - 1]
+
+    def _segments(self):
+        """Yield the stored items as lists of bytes, SEGMENT_SIZE items at a time"""
+        blob, offsets = self._blob, self._offsets
+        count = self._count()
+        for start in range(0, count, SEGMENT_SIZE):
+            end = min(start + SEGMENT_SIZE, count)
+            items = blob[offsets[start]:offsets[end]].split(b'\n')
+            items.pop()
+            yield items
+
+    def _contains_sorted(self, key):
+        lo, hi = 0, self._count()
+        while lo < hi:
+            mid = (lo + hi) // 2
+            item = self._item(mid)
+            if item < key:
+                lo = mid + 1
+            elif item > key:
+                hi = mid
+            else:
+                return True
+        return False
+
+    def _merge_sorted(self, new_items):
+        """Merge a sorted list of encoded domains into the blob.
+
+        The blob is re-split one segment at a time and each segment is merged
+        with the new items that sort before its last entry, so the extra memory
+        is bounded by SEGMENT_SIZE plus `new_items`. Segments with nothing to
+        merge are copied as one slice.
+        """
+        if not new_items:
+            return
+        blob, offsets = self._blob, self._offsets
+        count = self._count()
+        parts = []
+        new_offsets = array('I', [0])
+        size = 0
+        taken = 0
+        for start in range(0, count, SEGMENT_SIZE):
+            end = min(start + SEGMENT_SIZE, count)
+            upto = len(new_items) if end == count else bisect_right(new_items, self._item(end - 1), taken)
+            if upto == taken:
+                parts.append(blob[offsets[start]:offsets[end]])
+                new_offsets.extend(map((size - offsets[start]).__add__, offsets[start + 1:end + 1]))
+            else:
+                items = blob[offsets[start]:offsets[end]].split(b'\n')
+                items.pop()
+                items = list(dict.fromkeys(sorted(items + new_items[taken:upto])))
+                taken = upto
+                parts.append(b'\n'.join(items) + b'\n')
+                new_offsets.extend(accumulate(map((1).__add__, map(len, items)), initial=size))
+                new_offsets.pop(-len(items) - 1)
+            size = new_offsets[-1]
+        if taken < len(new_items):
+            items = list(dict.fromkeys(new_items[taken:]))
+            parts.append(b'\n'.join(items) + b'\n')
+            new_offsets.extend(accumulate(map((1).__add__, map(len, items)), initial=size))
+            new_offsets.pop(-len(items) - 1)
+        self._blob = b''.join(parts)
+        self._offsets = new_offsets
+        self._limit = max(PENDING_LIMIT, len(new_offsets) >> 3)
+
+    def _compact(self):
+        if self._pending:
+            pending = sorted(d.encode('utf-8') for d in self._pending)
+            self._pending = set()
+            self._merge_sorted(pending)
+
+    def add(self, domain):
+        # Duplicates of stored domains are dropped when the pending set is merged
+        self._pending.add(domain)
+        if len(self._pending) >= self._limit:
+            self._compact()
+
+    def update(self, domains):
+        if isinstance(domains, DomainStore):
+            self._compact()
+            domains._compact()
+            batch = []
+            for items in domains._segments():
+                batch.extend(items)
+                if len(batch) >= self._limit:
+                    self._merge_sorted(batch)
+                    batch = []
+            self._merge_sorted(batch)
+            return
+        pending = self._pending
+        for domain in domains:
+            pending.add(domain)
+            if len(pending) >= self._limit:
+                self._compact()
+                pending = self._pending
+
+    def __contains__(self, domain):
+        return domain in self._pending or self._contains_sorted(domain.encode('utf-8'))
+
+    def __len__(self):
+        self._compact()
+        return self._count()
+
+    def __iter__(self):
+        """Iterate over the domains in sorted order"""
+        self._compact()
+        for items in self._segments():
+            for item in items:
+                yield item.decode('utf-8')
+
+    def __or__(self, other):
+        result = DomainStore()
+        result.update(self)
+        result.update(other if isinstance(other, DomainStore) else DomainStore(other))
+        return result
+
+    def __ior__(self, other):
+        self.update(other)
+        return self
+
+    def __sub__(self, other):
+        if not isinstance(other, DomainStore):
+            return DomainStore.from_sorted(d for d in self if d not in other)
+        self._compact()
+        other._compact()
+        return DomainStore.from_sorted(d.decode('utf-8') for d in self._difference_bytes(other))
+
+    def _difference_bytes(self, other):
+        """Sorted merge walk: items of self that are not in other"""
+        theirs = (item for items in other._segments() for item in items)
+        current = next(theirs, None)
+        for items in self._segments():
+            for item in items:
+                while current is not None and current < item:
+                    current = next(theirs, None)
+                if item != current:
+                    yield item
+
+    def write_to(self, f):
+        """Write the sorted domains, one per line, to a binary file object"""
+        self._compact()
+        f.write(self._blob)
+
+    def nbytes(self):
+        """Memory held by the compacted blob and offsets"""
+        return len(self._blob) + self._offsets.itemsize * len(self._offsets)
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+exporters.py
+
+Write the merged domain list in several blocklist formats in one pass.
+
+Usage:
+  python exporters.py -i youtube-blocklist.txt -f hosts,dnsmasq,unbound,rpz,adguard -o exports [--gzip]
+
+Formats:
+  hosts     0.0.0.0 example.com
+  dnsmasq   address=/example.com/#
+  unbound   local-zone: "example.com." always_nxdomain
+  rpz       example.com CNAME .  (plus *.example.com, in a BIND RPZ zone)
+  adguard   ||example.com^
+
+The input is streamed once. Domains are formatted in batches and each format
+has its own buffered (optionally gzip-compressed) writer, so exporting all
+formats costs little more than exporting one.
+"""
+
+from pathlib import Path
+import argparse
+import gzip
+import sys
+import time
+
+BATCH_SIZE = 8192
+BUFFER_SIZE = 1 << 20
+
+# Formats whose consumers block only the exact names listed, not their
+# subdomains: a list with collapsed subdomains would unblock them
+EXACT_MATCH_FORMATS = {'hosts'}
+
+FORMATS = {
+    'hosts': {
+        'filename': 'hosts.txt',
+        'header': "# Blocklist in hosts format\n# Total domains: {total}\n\n",
+        'render': lambda batch: ''.join(f"0.0.0.0 {d}\n" for d in batch),
+    },
+    'dnsmasq': {
+        'filename': 'dnsmasq.conf',
+        'header': "# Blocklist for dnsmasq\n# Total domains: {total}\n\n",
+        'render': lambda batch: ''.join(f"address=/{d}/#\n" for d in batch),
+    },
+    'unbound': {
+        'filename': 'unbound.conf',
+        'header': "# Blocklist for unbound\n# Total domains: {total}\n\nserver:\n",
+        'render': lambda batch: ''.join(f'local-zone: "{d}." always_nxdomain\n' for d in batch),
+    },
+    'rpz': {
+        'filename': 'blocklist.rpz',
+        'header': ("; Blocklist as a BIND response policy zone\n; Total domains: {total}\n"
+                   "$TTL 300\n@ IN SOA localhost. root.localhost. (1 3600 600 86400 300)\n"
+                   "@ IN NS localhost.\n\n"),
+        'render': lambda batch: ''.join(f"{d} CNAME .\n*.{d} CNAME .\n" for d in batch),
+    },
+    'adguard': {
+        'filename': 'adguard.txt',
+        'header': "! Blocklist in AdGuard / AdBlock syntax\n! Total domains: {total}\n\n",
+        'render': lambda batch: ''.join(f"||{d}^\n" for d in batch),
+    },
+}
+
+
+class MultiExporter:
+    """One buffered writer per format, fed from a single stream of domains"""
+
+    def __init__(self, out_dir, formats, compress=False, total=0):
+        unknown = [fmt for fmt in formats if fmt not in FORMATS]
+        if unknown:
+            raise ValueError(f"Unknown export format(s): {', '.join(unknown)}")
+        out_dir = Path(out_dir)
+        out_dir.mkdir(parents=True, exist_ok=True)
+        self.paths = {}
+        self._writers = []
+        for fmt in formats:
+            spec = FORMATS[fmt]
+            path = out_dir / spec['filename']
+            if compress:
+                path = path.with_name(path.name + '.gz')
+                f = gzip.open(path, 'wt', encoding='utf-8', compresslevel=6)
+            else:
+                f = open(path, 'w', encoding='utf-8', buffering=BUFFER_SIZE)
+            f.write(spec['header'].format(total=total))
+            self.paths[fmt] = path
+            self._writers.append((spec['render'], f))
+        self.count = 0
+
+    def write_batch(self, batch):
+        for render, f in self._writers:
+            f.write(render(batch))
+        self.count += len(batch)
+
+    def export(self, domains):
+        """Write every domain of the iterable to all formats"""
+        batch = []
+        for domain in domains:
+            batch.append(domain)
+            if len(batch) >= BATCH_SIZE:
+                self.write_batch(batch)
+                batch = []
+        if batch:
+            self.write_batch(batch)
+        return self.count
+
+    def close(self):
+        for _, f in self._writers:
+            f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def export_domains(domains, out_dir, formats, compress=False, total=0):
+    """Export an iterable of domains; return {format: output path}"""
+    with MultiExporter(out_dir, formats, compress, total) as exporter:
+        exporter.export(domains)
+    return exporter.paths
+
+
+def read_domains(file_path):
+    """Yield the domains of a plain blocklist file"""
+    with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                yield line.lower()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the merged blocklist in several formats at once")
+    parser.add_argument("-i", "--input", default="youtube-blocklist.txt", help="Merged blocklist file")
+    parser.add_argument("-f", "--formats", default=",".join(FORMATS),
+                        help=f"Comma-separated formats ({', '.join(FORMATS)})")
+    parser.add_argument("-o", "--out", default="exports", help="Output folder")
+    parser.add_argument("--gzip", action="store_true", help="gzip-compress every output file")
+    args = parser.parse_args()
+
+    inp = Path(args.input)
+    if not inp.exists():
+        print(f"Input file not found: {inp}", file=sys.stderr)
+        sys.exit(2)
+    formats = [f.strip() for f in args.formats.split(",") if f.strip()]
+    if any(fmt not in FORMATS for fmt in formats):
+        parser.error(f"formats must be among: {', '.join(FORMATS)}")
+
+    total = sum(1 for _ in read_domains(inp))
+    start = time.perf_counter()
+    paths = export_domains(read_domains(inp), args.out, formats, args.gzip, total)
+    elapsed = time.perf_counter() - start
+    for fmt, path in paths.items():
+        print(f"Wrote {fmt:8} {path}")
+    print(f"Exported {total} domains in {len(paths)} formats in {elapsed:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+external_sort.py
+
+Sorted, deduplicated domain lists larger than the memory available.
+
+Usage:
+  from external_sort import ExternalSorter
+
+  with ExternalSorter(budget=64 << 20) as sorter:
+      for domains in feeds:
+          sorter.update(domains)
+      sorter.finish()
+      print(len(sorter))
+      for domain in sorter:   # sorted, each domain once
+          ...
+
+Domains are collected in a set until its estimated size reaches the budget;
+the set is then sorted and written to a temporary file as one run, and
+emptied. `finish()` k-way merges the runs with heapq.merge into a single
+sorted run, dropping duplicates on the way (in several passes when there are
+more than MAX_FAN_IN runs), so the number of domains is known before the
+output is written and the result can be streamed any number of times.
+Memory use stays near the budget regardless of the input size.
+"""
+
+import heapq
+import os
+import sys
+import tempfile
+
+DEFAULT_BUDGET = 64 << 20
+# Runs merged at once; each open run costs one file handle and read buffer
+MAX_FAN_IN = 64
+# Set slot and sort list entry per buffered domain, on top of the str itself
+ENTRY_OVERHEAD = 48
+
+
+def _read_run(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            yield line[:-1]
+
+
+def _unique(domains):
+    previous = None
+    for domain in domains:
+        if domain != previous:
+            yield domain
+            previous = domain
+
+
+class ExternalSorter:
+    """Set of domains that spills sorted runs to disk past a memory budget"""
+
+    def __init__(self, budget=DEFAULT_BUDGET, tmp_dir=None):
+        self.budget = budget
+        self._dir = tempfile.TemporaryDirectory(prefix='external-sort-', dir=tmp_dir)
+        self._buffer = set()
+        self._buffer_bytes = 0
+        self._runs = []
+        self._count = None
+        self.spilled = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._buffer = set()
+        self._runs = []
+        self._dir.cleanup()
+
+    def add(self, domain):
+        if domain not in self._buffer:
+            self._buffer.add(domain)
+            self._count = None
+            self._buffer_bytes += sys.getsizeof(domain) + ENTRY_OVERHEAD
+            if self._buffer_bytes >= self.budget:
+                self._spill()
+
+    def update(self, domains):
+        for domain in domains:
+            self.add(domain)
+
+    def _new_run(self, domains):
+        """Write sorted domains to a new run file; return (path, count)"""
+        fd, path = tempfile.mkstemp(suffix='.run', dir=self._dir.name)
+        count = 0
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            for domain in domains:
+                f.write(domain + '\n')
+                count += 1
+        return path, count
+
+    def _spill(self):
+        if self._buffer:
+            path, _ = self._new_run(sorted(self._buffer))
+            self._runs.append(path)
+            self.spilled += 1
+        self._buffer = set()
+        self._buffer_bytes = 0
+
+    def _merge(self, paths):
+        path, count = self._new_run(_unique(heapq.merge(*map(_read_run, paths))))
+        for old in paths:
+            os.remove(old)
+        return path, count
+
+    def finish(self):
+        """Merge everything added so far into one sorted run; return the domain count"""
+        if self._count is not None:
+            return self._count
+        self._spill()
+        while len(self._runs) > MAX_FAN_IN:
+            path, _ = self._merge(self._runs[:MAX_FAN_IN])
+            self._runs = self._runs[MAX_FAN_IN:] + [path]
+        path, self._count = self._merge(self._runs)
+        self._runs = [path]
+        return self._count
+
+    def __len__(self):
+        return self.finish()
+
+    def __iter__(self):
+        """Sorted unique domains, streamed from disk"""
+        self.finish()
+        return _read_run(self._runs[0])
@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""
+feed_cache.py
+
+On-disk conditional-GET cache for upstream feeds.
+
+For every URL the cache keeps three files, named after a hash of the URL:
+  <key>.json     URL, ETag, Last-Modified, body size and parser version
+  <key>.body     the raw response body
+  <key>.domains  the parsed domain set (one domain per line)
+
+Requests send `If-None-Match` / `If-Modified-Since` from the stored metadata.
+On a 304 the cached domain set is returned without reading a body or running
+the parser. On a 200 the body is streamed to disk while it is being parsed;
+with `workers` > 1 it is written to disk first and then parsed in parallel by
+parallel_parse.parse_file (large bodies only, see PARALLEL_MIN_BYTES).
+Hits, misses and the bytes saved are counted for the end-of-run report.
+
+`fetch_body` only brings the cached body up to date, for callers that
+stream it through their own parser instead of holding the domain set
+(merge_blocklists.py --memory-budget).
+
+Usage:
+  from feed_cache import FeedCache
+
+  cache = FeedCache()
+  result = cache.fetch(url, parse_lines)
+  ...
+  cache.report()
+"""
+
+from collections import namedtuple
+from urllib.error import HTTPError
+import hashlib
+import json
+import os
+import threading
+import urllib.request
+
+from feed_parser import CHUNK_SIZE, iter_lines
+from parallel_parse import default_workers, parse_file
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.feed-cache')
+
+FeedResult = namedtuple('FeedResult', ['domains', 'cached', 'size'])
+BodyResult = namedtuple('BodyResult', ['path', 'cached', 'size'])
+
+
+def _tmp_path(path):
+    return f"{path}.tmp.{threading.get_ident()}"
+
+
+def _write_atomic(path, data):
+    tmp_path = _tmp_path(path)
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+class _TeeReader:
+    """Binary reader that copies everything it reads into `sink`"""
+
+    def __init__(self, stream, sink):
+        self.stream = stream
+        self.sink = sink
+        self.size = 0
+
+    def read(self, size=-1):
+        data = self.stream.read(size)
+        self.sink.write(data)
+        self.size += len(data)
+        return data
+
+
+class FeedCache:
+    """Conditional-GET cache of raw feed bodies and their parsed domain sets"""
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, workers=None):
+        self.cache_dir = cache_dir
+        # Parse processes per large feed body (1 = parse while downloading)
+        self.workers = workers or default_workers()
+        os.makedirs(cache_dir, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+        self.bytes_downloaded = 0
+        self._lock = threading.Lock()
+
+    def _path(self, url, suffix):
+        key = hashlib.sha1(url.encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, key + suffix)
+
+    def _load_meta(self, url):
+        try:
+            with open(self._path(url, '.json'), 'r') as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if meta.get('url') != url or not os.path.exists(self._path(url, '.body')):
+            return None
+        return meta
+
+    def _load_domains(self, url):
+        with open(self._path(url, '.domains'), 'r', encoding='utf-8') as f:
+            return {line.rstrip('\n') for line in f if line.strip()}
+
+    def _store(self, url, meta, domains):
+        domains_path = self._path(url, '.domains')
+        tmp_path = _tmp_path(domains_path)
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for domain in sorted(domains):
+                f.write(domain + '\n')
+        os.replace(tmp_path, domains_path)
+        _write_atomic(self._path(url, '.json'), json.dumps(meta, indent=2).encode('utf-8'))
+
+    def body_path(self, url):
+        """Path of the cached raw body of `url`, or None if it has not been fetched"""
+        path = self._path(url, '.body')
+        return path if os.path.exists(path) else None
+
+    def _parse_cached_body(self, url, parse):
+        return parse_file(self._path(url, '.body'), parse, self.workers)
+
+    def _open(self, url, meta, headers, timeout):
+        """Conditional GET of `url`; None when the cached body is still current (304)"""
+        request_headers = dict(headers or {})
+        if meta:
+            if meta.get('etag'):
+                request_headers['If-None-Match'] = meta['etag']
+            if meta.get('last_modified'):
+                request_headers['If-Modified-Since'] = meta['last_modified']
+        req = urllib.request.Request(url, headers=request_headers)
+        try:
+            return urllib.request.urlopen(req, timeout=timeout)
+        except HTTPError as e:
+            if e.code != 304 or not meta:
+                raise
+            return None
+
+    def fetch_body(self, url, headers=None, timeout=10):
+        """Bring the cached body of `url` up to date without parsing it; return a BodyResult.
+
+        A new body invalidates the stored domain set, so the next `fetch`
+        parses the body again.
+        """
+        meta = self._load_meta(url)
+        response = self._open(url, meta, headers, timeout)
+        body_path = self._path(url, '.body')
+        if response is None:
+            with self._lock:
+                self.hits += 1
+                self.bytes_saved += meta.get('size', 0)
+            return BodyResult(body_path, True, meta.get('size', 0))
+
+        tmp_path = _tmp_path(body_path)
+        try:
+            with response, open(tmp_path, 'wb') as sink:
+                reader = _TeeReader(response, sink)
+                while reader.read(CHUNK_SIZE):
+                    pass
+                response_headers = response.headers
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        domains_path = self._path(url, '.domains')
+        if os.path.exists(domains_path):
+            os.remove(domains_path)
+        os.replace(tmp_path, body_path)
+        new_meta = {
+            'url': url,
+            'etag': response_headers.get('ETag'),
+            'last_modified': response_headers.get('Last-Modified'),
+            'size': reader.size,
+            'parser_version': None,
+        }
+        _write_atomic(self._path(url, '.json'), json.dumps(new_meta, indent=2).encode('utf-8'))
+        with self._lock:
+            self.misses += 1
+            self.bytes_downloaded += reader.size
+        return BodyResult(body_path, False, reader.size)
+
+    def fetch(self, url, parse, headers=None, timeout=10, parser_version=1):
+        """Return a FeedResult with the parsed domains of `url`.
+
+        `parse(lines)` turns an iterable of decoded lines into domains. Bump
+        `parser_version` when the parser changes so cached bodies are re-parsed.
+        With `workers` > 1, large bodies are parsed in chunks when `parse` is
+        parse_feed or parse_allowlist (see parallel_parse.parse_file).
+        """
+        meta = self._load_meta(url)
+        response = self._open(url, meta, headers, timeout)
+        if response is None:
+            return self._cache_hit(url, meta, parse, parser_version)
+
+        body_path = self._path(url, '.body')
+        tmp_path = _tmp_path(body_path)
+
+        try:
+            with response, open(tmp_path, 'wb') as sink:
+                reader = _TeeReader(response, sink)
+                if self.workers > 1:
+                    # Download first, then parse the body file in parallel
+                    while reader.read(CHUNK_SIZE):
+                        pass
+                else:
+                    domains = set(parse(iter_lines(reader)))
+                response_headers = response.headers
+            if self.workers > 1:
+                domains = parse_file(tmp_path, parse, self.workers)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        os.replace(tmp_path, body_path)
+        new_meta = {
+            'url': url,
+            'etag': response_headers.get('ETag'),
+            'last_modified': response_headers.get('Last-Modified'),
+            'size': reader.size,
+            'parser_version': parser_version,
+        }
+        self._store(url, new_meta, domains)
+        with self._lock:
+            self.misses += 1
+            self.bytes_downloaded += reader.size
+        return FeedResult(domains, False, reader.size)
+
+    def _cache_hit(self, url, meta, parse, parser_version):
+        if meta.get('parser_version') == parser_version and os.path.exists(self._path(url, '.domains')):
+            domains = self._load_domains(url)
+        else:
+            # Parser changed since the body was cached: re-parse the stored body
+            domains = self._parse_cached_body(url, parse)
+            meta = dict(meta, parser_version=parser_version)
+            self._store(url, meta, domains)
+        with self._lock:
+            self.hits += 1
+            self.bytes_saved += meta.get('size', 0)
+        return FeedResult(domains, True, meta.get('size', 0))
+
+    def report(self):
+        print(f"Feed cache: {self.hits} hits, {self.misses} misses, "
+              f"{self.bytes_downloaded} bytes downloaded, {self.bytes_saved} bytes saved")
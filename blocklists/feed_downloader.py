@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+feed_downloader.py
+
+Bounded-parallel download stage for upstream feeds.
+
+Feeds are fetched from a thread pool with a global concurrency cap. A per-host
+limit keeps us polite towards any single server: at most `per_host` requests to
+the same host are in flight, and consecutive requests to that host start at
+least `host_delay` seconds apart. Feeds on different hosts (e.g.
+adguardteam.github.io and raw.githubusercontent.com) download in parallel, so a
+refresh takes about as long as the slowest host instead of the sum of all feeds.
+
+Usage:
+  from feed_downloader import fetch_all
+
+  for (name, url), domains in fetch_all(BLOCKLISTS, lambda s: download_blocklist(*s),
+                                        url_of=lambda s: s[1]):
+      ...
+"""
+
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from urllib.parse import urlsplit
+import time
+
+MAX_WORKERS = 8
+PER_HOST = 2
+HOST_DELAY = 0.5
+
+
+class HostLimiter:
+    """Per-host concurrency cap plus a minimum delay between request starts.
+
+    Only the scheduling thread uses it: a source is handed to the pool once
+    its host has a free slot and its delay has passed, so pool workers never
+    wait on a busy host while sources on other hosts are queued.
+    """
+
+    def __init__(self, per_host=PER_HOST, host_delay=HOST_DELAY):
+        self.per_host = max(1, per_host)
+        self.host_delay = host_delay
+        self._in_flight = {}
+        self._next_start = {}
+
+    def ready_at(self, host, now):
+        """When a request to `host` may start (None while all its slots are busy)"""
+        if self._in_flight.get(host, 0) >= self.per_host:
+            return None
+        return max(now, self._next_start.get(host, now))
+
+    def started(self, host, now):
+        self._in_flight[host] = self._in_flight.get(host, 0) + 1
+        self._next_start[host] = now + self.host_delay
+
+    def finished(self, host):
+        self._in_flight[host] -= 1
+
+
+def fetch_all(sources, fetch, url_of=lambda source: source,
+              max_workers=MAX_WORKERS, per_host=PER_HOST, host_delay=HOST_DELAY):
+    """Run `fetch(source)` for every source concurrently.
+
+    Returns a list of (source, result) pairs in the same order as `sources`.
+    `url_of(source)` gives the URL used for per-host limiting. Each host has
+    its own queue; the calling thread submits the next source of a host only
+    when the host's limits allow, so the workers are always busy with
+    sources that may run.
+    """
+    sources = list(sources)
+    if not sources:
+        return []
+    limiter = HostLimiter(per_host, host_delay)
+    queues = {}
+    for index, source in enumerate(sources):
+        queues.setdefault(urlsplit(url_of(source)).hostname or '', deque()).append(index)
+    max_workers = min(max_workers, len(sources))
+    futures = [None] * len(sources)
+    running = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        while queues or running:
+            now = time.monotonic()
+            next_start = None
+            for host in list(queues):
+                while queues[host] and len(running) < max_workers:
+                    start = limiter.ready_at(host, now)
+                    if start is None:
+                        break
+                    if start > now:
+                        next_start = start if next_start is None else min(next_start, start)
+                        break
+                    index = queues[host].popleft()
+                    future = futures[index] = pool.submit(fetch, sources[index])
+                    running[future] = host
+                    limiter.started(host, now)
+                if not queues[host]:
+                    del queues[host]
+            timeout = None if next_start is None else max(0, next_start - time.monotonic())
+            if not running:
+                # wait() returns at once on an empty set: sleep until a host is due
+                time.sleep(timeout)
+                continue
+            done, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                limiter.finished(running.pop(future))
+    return [(source, future.result()) for source, future in zip(sources, futures)]
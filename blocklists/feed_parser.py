@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+"""
+feed_parser.py
+
+Streaming, multi-format parser for upstream feeds.
+
+`iter_lines` decodes a binary stream (an HTTP response or an open file)
+incrementally and yields one line at a time, so a feed is never held in
+memory as raw bytes, a decoded string and a list of lines all at once.
+
+`parse_feed` detects the format of a feed from a sample of its first lines and
+then runs a parser specialised for that format:
+
+  hosts     0.0.0.0 example.com          (also 127.0.0.1, ::, ::1)
+  adblock   ||example.com^$important     (AdGuard / uBlock DNS rules)
+  dnsmasq   address=/example.com/0.0.0.0 (also server=/x/ and local=/x/)
+  csv       URLhaus-style CSV, host taken from the URL column
+  regex     pihole-regex lines; only pure literals like ^ads\\.example\\.com$
+            can be turned into domains, the rest are skipped (regex_rules.py
+            evaluates the full rules)
+  plain     one domain (or URL) per line
+
+Every parser yields lowercased, validated domain names.
+
+`parse_allowlist` reads allowlist feeds the same way, except that from
+AdBlock-format feeds it takes the exception rules (`@@||example.com^`)
+instead of the blocking ones, so an AdGuard filter can serve as an allowlist.
+
+Usage:
+  from feed_parser import iter_lines, parse_allowlist, parse_feed
+
+  with urllib.request.urlopen(url) as response:
+      domains.update(parse_feed(iter_lines(response)))
+"""
+
+from itertools import chain
+import codecs
+import csv
+import re
+
+CHUNK_SIZE = 1 << 16
+SAMPLE_SIZE = 200
+
+# Bump when parsing output changes so FeedCache re-parses cached bodies
+PARSER_VERSION = 2
+
+FORMATS = ('hosts', 'adblock', 'dnsmasq', 'csv', 'regex', 'plain')
+
+HOSTS_IPS = {'0.0.0.0', '127.0.0.1', '::', '::1'}
+
+# Names that appear in every hosts file but are not blocklist entries
+HOSTS_BOILERPLATE = {
+    'localhost', 'localhost.localdomain', 'local', 'broadcasthost',
+    'ip6-localhost', 'ip6-loopback', 'ip6-localnet', 'ip6-mcastprefix',
+    'ip6-allnodes', 'ip6-allrouters', 'ip6-allhosts', '0.0.0.0',
+}
+
+# AdBlock modifiers that keep a rule a plain "block this domain" rule
+ADBLOCK_SAFE_MODIFIERS = {'important', 'third-party', '3p', 'all', 'document', 'doc', 'popup'}
+
+VALID_DOMAIN_RE = re.compile(r"(?:[a-z0-9_](?:[a-z0-9_-]{0,61}[a-z0-9_])?\.)+[a-z][a-z0-9-]{0,61}[a-z0-9]")
+URL_HOST_RE = re.compile(r"[a-z][a-z0-9+.-]*://(?:[^@/?#]*@)?([^:/?#\[\]]+)", re.I)
+REGEX_LITERAL_RE = re.compile(r"(?:\^|\(\^\|\\\.\)|\(\\\.\|\^\))((?:[a-z0-9_-]+\\\.)+[a-z0-9-]+)\$")
+
+
+def iter_lines(stream, encoding='utf-8', chunk_size=CHUNK_SIZE):
+    """Yield decoded lines (without the trailing newline) from a binary stream"""
+    decoder = codecs.getincrementaldecoder(encoding)(errors='ignore')
+    tail = ''
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        lines = (tail + decoder.decode(chunk)).split('\n')
+        tail = lines.pop()
+        yield from lines
+    tail += decoder.decode(b'', final=True)
+    if tail:
+        yield tail
+
+
+def clean_domain(token):
+    """Return `token` as a lowercased domain name, or None if it is not one"""
+    domain = token.strip().lower().rstrip('.')
+    if VALID_DOMAIN_RE.fullmatch(domain):
+        return domain
+    return None
+
+
+def host_from_url(url):
+    """Return the domain part of a URL, or None for IPs and malformed URLs"""
+    match = URL_HOST_RE.match(url.strip())
+    return clean_domain(match.group(1)) if match else None
+
+
+def take_sample(lines, sample_size=SAMPLE_SIZE):
+    """Read lines until `sample_size` of them are not blank or comments; return every line read.
+
+    Comment headers (StevenBlack's runs to hundreds of lines) then cannot
+    crowd the entries out of the sample that detect_format sees.
+    """
+    sample = []
+    entries = 0
+    for line in lines:
+        sample.append(line)
+        stripped = line.strip()
+        if stripped and not stripped.startswith(('#', '!')):
+            entries += 1
+            if entries >= sample_size:
+                break
+    return sample
+
+
+def detect_format(sample_lines):
+    """Guess the format of a feed from a sample of its lines"""
+    votes = dict.fromkeys(FORMATS, 0)
+    for line in sample_lines:
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith(('[Adblock', '! ')) or line == '!':
+            votes['adblock'] += 1
+            continue
+        if line.startswith(('#', '!')):
+            continue
+        if line.startswith(('||', '@@||')):
+            votes['adblock'] += 1
+        elif line.startswith(('address=/', 'server=/', 'local=/')):
+            votes['dnsmasq'] += 1
+        elif line.split(None, 1)[0] in HOSTS_IPS:
+            votes['hosts'] += 1
+        elif line.startswith('"') or (',' in line and '://' in line):
+            votes['csv'] += 1
+        elif line.startswith('^') or '\\.' in line or line.endswith('$'):
+            votes['regex'] += 1
+        else:
+            votes['plain'] += 1
+    best = max(FORMATS, key=lambda fmt: votes[fmt])
+    return best if votes[best] else 'plain'
+
+
+def parse_hosts(lines):
+    """hosts format: `0.0.0.0 example.com [more names] # comment`"""
+    for line in lines:
+        line = line.split('#', 1)[0]
+        parts = line.split()
+        if len(parts) < 2 or parts[0] not in HOSTS_IPS:
+            continue
+        for name in parts[1:]:
+            if name in HOSTS_BOILERPLATE:
+                continue
+            domain = clean_domain(name)
+            if domain:
+                yield domain
+
+
+def parse_adblock(lines):
+    """AdBlock DNS syntax: `||example.com^` with optional `$modifiers`.
+
+    Exception rules (`@@`), cosmetic rules and rules whose modifiers narrow
+    them to some clients or record types are skipped. Bare domains are kept.
+    """
+    for line in lines:
+        line = line.strip()
+        if not line or line[0] in '!#[@/':
+            continue
+        if line.startswith('||'):
+            rule, _, modifiers = line[2:].partition('$')
+            if modifiers and not set(modifiers.split(',')) <= ADBLOCK_SAFE_MODIFIERS:
+                continue
+            if not rule.endswith('^'):
+                continue
+            domain = clean_domain(rule[:-1])
+        elif '$' in line or '^' in line or '*' in line:
+            continue
+        else:
+            domain = clean_domain(line)
+        if domain:
+            yield domain
+
+
+def parse_exceptions(lines):
+    """AdBlock exception rules: `@@||example.com^` with optional `$modifiers`.
+
+    Yields the domains the rules unblock (with their subdomains). Exceptions
+    narrowed by modifiers, like their blocking counterparts, are skipped.
+    """
+    for line in lines:
+        line = line.strip()
+        if not line.startswith('@@||'):
+            continue
+        rule, _, modifiers = line[4:].partition('$')
+        if modifiers and not set(modifiers.split(',')) <= ADBLOCK_SAFE_MODIFIERS:
+            continue
+        if not rule.endswith('^'):
+            continue
+        domain = clean_domain(rule[:-1])
+        if domain:
+            yield domain
+
+
+def parse_dnsmasq(lines):
+    """dnsmasq syntax: `address=/example.com/0.0.0.0`, `server=/x/`, `local=/x/`"""
+    for line in lines:
+        line = line.strip()
+        if not line.startswith(('address=/', 'server=/', 'local=/')):
+            continue
+        for name in line.split('/')[1:-1]:
+            domain = clean_domain(name)
+            if domain:
+                yield domain
+
+
+def parse_csv(lines):
+    """CSV with a URL column (URLhaus `csv_recent`); yields the URL hosts.
+
+    The URL column is taken from a `url` header (URLhaus puts it in a
+    `# id,dateadded,url,...` comment), otherwise from the first field that
+    looks like a URL.
+    """
+    url_column = None
+
+    def data_lines():
+        nonlocal url_column
+        for line in lines:
+            stripped = line.strip()
+            if stripped.startswith('#'):
+                header = [h.strip().lower() for h in stripped.lstrip('#').split(',')]
+                if 'url' in header:
+                    url_column = header.index('url')
+            elif stripped:
+                yield stripped
+
+    for row in csv.reader(data_lines()):
+        if url_column is not None and url_column < len(row):
+            url = row[url_column]
+        else:
+            url = next((field for field in row if '://' in field), None)
+        if url:
+            domain = host_from_url(url)
+            if domain:
+                yield domain
+
+
+def parse_regex(lines):
+    """pihole-regex lines: yield the domains of pure-literal anchored patterns"""
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        match = REGEX_LITERAL_RE.fullmatch(line.split(';', 1)[0])
+        if match:
+            domain = clean_domain(match.group(1).replace('\\.', '.'))
+            if domain:
+                yield domain
+
+
+def parse_plain(lines):
+    """One domain per line; URLs are reduced to their host"""
+    for line in lines:
+        line = line.split('#', 1)[0].strip()
+        if not line:
+            continue
+        parts = line.split(None, 2)
+        token = parts[0]
+        if token in HOSTS_IPS and len(parts) > 1:
+            # A hosts line in a feed whose sample did not look like hosts
+            token = parts[1]
+        if '://' in token:
+            domain = host_from_url(token)
+        else:
+            domain = clean_domain(token)
+        if domain:
+            yield domain
+
+
+PARSERS = {
+    'hosts': parse_hosts,
+    'adblock': parse_adblock,
+    'dnsmasq': parse_dnsmasq,
+    'csv': parse_csv,
+    'regex': parse_regex,
+    'plain': parse_plain,
+}
+
+
+def parse_feed(lines, fmt=None, sample_size=SAMPLE_SIZE):
+    """Yield the domains of a feed, detecting its format unless `fmt` is given"""
+    lines = iter(lines)
+    if fmt is None:
+        sample = take_sample(lines, sample_size)
+        fmt = detect_format(sample)
+        lines = chain(sample, lines)
+    return PARSERS[fmt](lines)
+
+
+def parse_allowlist(lines, fmt=None, sample_size=SAMPLE_SIZE):
+    """Yield the allowed domains of an allowlist feed (the `@@` exceptions of an AdBlock-format one)"""
+    lines = iter(lines)
+    if fmt is None:
+        sample = take_sample(lines, sample_size)
+        fmt = detect_format(sample)
+        lines = chain(sample, lines)
+    return (parse_exceptions if fmt == 'adblock' else PARSERS[fmt])(lines)
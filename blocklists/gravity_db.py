@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+"""
+gravity_db.py
+
+Write the merged blocklist straight into Pi-hole's gravity.db, so Pi-hole
+does not have to download and re-parse our text list in `pihole -g`.
+
+Usage:
+  python gravity_db.py -i youtube-blocklist.txt -d /etc/pihole/gravity.db [--diff] [--address URL]
+  python merge_blocklists.py --gravity-db /etc/pihole/gravity.db [--gravity-diff]
+
+The list is one row of the adlist table (address file://<list path> unless
+--address is given), and its domains are the gravity rows with that
+adlist_id. The adlist row's number, date_updated and status and the
+gravity_count and updated entries of the info table are set as `pihole -g`
+sets them; the rows of other adlists are left alone.
+
+Full mode (the default) works on a copy, like Pi-hole's own gravity swap:
+the database is copied with SQLite's backup API, and in the copy, with
+journaling and syncing off, the list's rows are replaced with one
+executemany in a single transaction. When the list makes up at least half
+of the gravity table, the gravity index is dropped first and rebuilt once
+after the load; otherwise the other lists' rows would be re-sorted for
+nothing and the index is kept. The copy then atomically replaces gravity.db (keeping its
+owner and mode), so FTL never sees a half-loaded table.
+
+--diff updates gravity.db in place: the list's current rows are read back
+and only the domains added or removed since are inserted or deleted, in one
+transaction with the index kept. Day-to-day updates touch a small share of
+the list, so this writes far less.
+
+Afterwards run `pihole reloadlists` (v6) or `pihole restartdns reload-lists`
+(v5) so FTL picks up the change. When --database does not exist it is
+created from gravity_schema.sql, a local copy of Pi-hole's schema (for
+tests).
+"""
+
+from collections import namedtuple
+from itertools import repeat
+import argparse
+import os
+import sqlite3
+import stat
+import sys
+import time
+
+from exporters import read_domains
+
+DEFAULT_DATABASE = '/etc/pihole/gravity.db'
+SCHEMA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'gravity_schema.sql')
+ADLIST_COMMENT = 'Merged PI-HOLE-BLOCK list, written by gravity_db.py'
+# adlist.status as set by `pihole -g`
+STATUS_UPDATED = 1
+STATUS_UNCHANGED = 2
+# Page cache for the load, in KiB
+CACHE_SIZE = 256 << 10
+REQUIRED_COLUMNS = {
+    'gravity': {'domain', 'adlist_id'},
+    'adlist': {'id', 'address', 'enabled', 'number', 'date_updated'},
+    'info': {'property', 'value'},
+}
+
+GravityResult = namedtuple('GravityResult', ['adlist_id', 'rows', 'inserted', 'deleted', 'gravity_count'])
+
+
+def create_database(path):
+    """Create an empty gravity.db from the local schema copy"""
+    with open(SCHEMA_PATH, 'r', encoding='utf-8') as f:
+        schema = f.read()
+    conn = sqlite3.connect(path)
+    try:
+        conn.executescript(schema)
+    finally:
+        conn.close()
+
+
+def _columns(conn, table):
+    return {row[1] for row in conn.execute(f'PRAGMA table_info("{table}")')}
+
+
+def check_schema(conn):
+    """Raise ValueError unless the database has the gravity tables this module writes"""
+    for table, required in REQUIRED_COLUMNS.items():
+        missing = required - _columns(conn, table)
+        if missing:
+            raise ValueError(f"not a Pi-hole gravity database (table {table} lacks {', '.join(sorted(missing))})")
+
+
+def _adlist_id(conn, address, comment):
+    """Id of the blocking adlist row for `address`, inserted if missing"""
+    typed = 'type' in _columns(conn, 'adlist')
+    where = 'address = ? AND type = 0' if typed else 'address = ?'
+    row = conn.execute(f'SELECT id FROM adlist WHERE {where}', (address,)).fetchone()
+    if row:
+        return row[0]
+    return conn.execute('INSERT INTO adlist (address, enabled, comment) VALUES (?, 1, ?)',
+                        (address, comment)).lastrowid
+
+
+def _unique(domains):
+    """Drop repeats of the previous domain (the merged list is sorted and unique already)"""
+    previous = None
+    for domain in domains:
+        if domain != previous:
+            yield domain
+            previous = domain
+
+
+def _finish(conn, adlist_id, rows, changed):
+    """Update the adlist row and the info table like `pihole -g` does; return gravity_count"""
+    columns = _columns(conn, 'adlist')
+    updates = {'number': rows, 'date_updated': int(time.time())}
+    if 'status' in columns:
+        updates['status'] = STATUS_UPDATED if changed else STATUS_UNCHANGED
+    if 'invalid_domains' in columns:
+        updates['invalid_domains'] = 0
+    conn.execute(f"UPDATE adlist SET {', '.join(f'{name} = ?' for name in updates)} WHERE id = ?",
+                 (*updates.values(), adlist_id))
+    # Unlike COUNT(DISTINCT domain), this form walks idx_gravity instead of building a temp b-tree
+    gravity_count = conn.execute('SELECT COUNT(*) FROM (SELECT DISTINCT domain FROM gravity)').fetchone()[0]
+    conn.executemany('INSERT OR REPLACE INTO info (property, value) VALUES (?, ?)',
+                     [('gravity_count', gravity_count), ('updated', int(time.time()))])
+    return gravity_count
+
+
+def _gravity_indexes(conn):
+    """(name, SQL) of the indexes on the gravity table (Pi-hole has idx_gravity)"""
+    return conn.execute("SELECT name, sql FROM sqlite_master "
+                        "WHERE type = 'index' AND tbl_name = 'gravity' AND sql IS NOT NULL").fetchall()
+
+
+def write_full(domains, database, address, comment=ADLIST_COMMENT):
+    """Replace the list's gravity rows through a copy of `database`; return a GravityResult"""
+    tmp_path = database + '.tmp'
+    source = sqlite3.connect(database)
+    conn = None
+    try:
+        check_schema(source)
+        if source.execute('PRAGMA journal_mode').fetchone()[0].lower() == 'wal':
+            # A WAL file left next to the swapped-in copy would be replayed into it
+            raise ValueError(f"{database} is in WAL mode; use the in-place --diff mode")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        conn = sqlite3.connect(tmp_path, isolation_level=None)
+        source.backup(conn)
+
+        conn.execute('PRAGMA journal_mode = OFF')
+        conn.execute('PRAGMA synchronous = OFF')
+        conn.execute('PRAGMA locking_mode = EXCLUSIVE')
+        conn.execute('PRAGMA temp_store = MEMORY')
+        conn.execute(f'PRAGMA cache_size = -{CACHE_SIZE}')
+        conn.execute('BEGIN')
+        adlist_id = _adlist_id(conn, address, comment)
+        domains = list(_unique(domains))
+        # Rebuilding the index only pays when the list is most of the table;
+        # sorted inserts into a kept index are cheaper than re-sorting other lists' rows
+        total = conn.execute('SELECT COUNT(*) FROM gravity').fetchone()[0]
+        previous = conn.execute('SELECT number FROM adlist WHERE id = ?', (adlist_id,)).fetchone()[0]
+        indexes = _gravity_indexes(conn) if len(domains) >= total - previous else []
+        for name, _ in indexes:
+            conn.execute(f'DROP INDEX "{name}"')
+        deleted = conn.execute('DELETE FROM gravity WHERE adlist_id = ?', (adlist_id,)).rowcount
+        inserted = conn.executemany('INSERT INTO gravity (domain, adlist_id) VALUES (?, ?)',
+                                    zip(domains, repeat(adlist_id))).rowcount
+        for _, sql in indexes:
+            conn.execute(sql)
+        gravity_count = _finish(conn, adlist_id, inserted, True)
+        conn.execute('COMMIT')
+        conn.close()
+    except BaseException:
+        if conn is not None:
+            conn.close()
+            os.remove(tmp_path)
+        raise
+    finally:
+        source.close()
+
+    st = os.stat(database)
+    os.chmod(tmp_path, stat.S_IMODE(st.st_mode))
+    try:
+        os.chown(tmp_path, st.st_uid, st.st_gid)
+    except PermissionError:
+        pass
+    os.replace(tmp_path, database)
+    return GravityResult(adlist_id, inserted, inserted, deleted, gravity_count)
+
+
+def write_diff(domains, database, address, comment=ADLIST_COMMENT):
+    """Insert and delete only the changed domains of the list, in place; return a GravityResult"""
+    conn = sqlite3.connect(database, isolation_level=None, timeout=30)
+    try:
+        check_schema(conn)
+        conn.execute('PRAGMA temp_store = MEMORY')
+        conn.execute(f'PRAGMA cache_size = -{CACHE_SIZE}')
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            adlist_id = _adlist_id(conn, address, comment)
+            existing = {domain for (domain,) in
+                        conn.execute('SELECT domain FROM gravity WHERE adlist_id = ?', (adlist_id,))}
+            wanted = set(domains)
+            removed = existing - wanted
+            added = sorted(wanted - existing)
+            del existing
+            conn.executemany('DELETE FROM gravity WHERE domain = ? AND adlist_id = ?',
+                             zip(removed, repeat(adlist_id)))
+            conn.executemany('INSERT INTO gravity (domain, adlist_id) VALUES (?, ?)',
+                             zip(added, repeat(adlist_id)))
+            gravity_count = _finish(conn, adlist_id, len(wanted), bool(added or removed))
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+    finally:
+        conn.close()
+    return GravityResult(adlist_id, len(wanted), len(added), len(removed), gravity_count)
+
+
+def write_gravity(domains, database, address, diff=False, comment=ADLIST_COMMENT):
+    """Load `domains` into gravity.db as the adlist `address` (created from the local schema if missing)"""
+    if not os.path.exists(database):
+        create_database(database)
+    write = write_diff if diff else write_full
+    return write(domains, database, address, comment)
+
+
+def list_address(file_path):
+    """Default adlist address of a list file"""
+    return 'file://' + os.path.abspath(file_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a blocklist straight into Pi-hole's gravity.db")
+    parser.add_argument("-i", "--input", default="youtube-blocklist.txt", help="Merged blocklist file")
+    parser.add_argument("-d", "--database", default=DEFAULT_DATABASE, help="Pi-hole gravity.db")
+    parser.add_argument("--address", default=None,
+                        help="Address of the list's adlist row (default: file:// URL of --input)")
+    parser.add_argument("--diff", action="store_true",
+                        help="Update the database in place, inserting and deleting only what changed")
+    args = parser.parse_args()
+    if not os.path.exists(args.input):
+        print(f"Input file not found: {args.input}", file=sys.stderr)
+        sys.exit(2)
+    if not os.path.exists(args.database):
+        print(f"Creating {args.database} from {os.path.basename(SCHEMA_PATH)}")
+
+    start = time.perf_counter()
+    try:
+        result = write_gravity(read_domains(args.input), args.database, args.address or list_address(args.input),
+                               args.diff)
+    except (OSError, ValueError, sqlite3.Error) as e:
+        print(f"Cannot write {args.database}: {e}", file=sys.stderr)
+        sys.exit(2)
+    elapsed = time.perf_counter() - start
+
+    mode = "Updated in place" if args.diff else "Rebuilt"
+    print(f"✓ {mode} adlist {result.adlist_id} in {args.database} in {elapsed:.1f}s: {result.rows} domains "
+          f"(+{result.inserted} -{result.deleted} rows)")
+    print(f"✓ gravity_count: {result.gravity_count}")
+    print("  Run `pihole reloadlists` (v6) or `pihole restartdns reload-lists` (v5) to load it into FTL")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+hash_store.py
+
+Compact set of 64-bit domain hashes, for deduplicating streams of domains.
+
+Usage:
+  from hash_store import HashStore
+
+  seen = HashStore()
+  if seen.add(domain):      # True the first time a domain is seen
+      out.write(domain + '\\n')
+
+The table is an open-addressing `array('Q')` of hashes, 8 bytes per slot at
+a load factor of at most 2/3, instead of the ~60 bytes per entry of a set of
+strings (plus the strings themselves). Python's `hash()` is only stable
+within one process, so a store must not be persisted. Two different domains
+sharing a 64-bit hash would be treated as one; with millions of domains the
+odds of that are about 1 in a million.
+"""
+
+from array import array
+
+_MASK = (1 << 64) - 1
+
+
+class HashStore:
+    """Open-addressing set of 64-bit hashes of strings"""
+
+    def __init__(self, capacity=1 << 16):
+        size = 1
+        while size * 2 < capacity * 3:
+            size <<= 1
+        self._slots = array('Q', bytes(8 * size))
+        self._count = 0
+
+    def _find(self, h):
+        slots = self._slots
+        mask = len(slots) - 1
+        # Bit 0 of every hash is set (0 marks an empty slot): start from the bits above it
+        i = (h >> 1) & mask
+        while True:
+            stored = slots[i]
+            if stored == h or not stored:
+                return i
+            i = (i + 1) & mask
+
+    def add(self, domain):
+        """Add `domain`; return True if it was not in the store yet"""
+        # 0 marks an empty slot
+        h = (hash(domain) & _MASK) | 1
+        i = self._find(h)
+        if self._slots[i]:
+            return False
+        self._slots[i] = h
+        self._count += 1
+        if self._count * 3 > len(self._slots) * 2:
+            self._grow()
+        return True
+
+    def _grow(self):
+        old = self._slots
+        self._slots = array('Q', bytes(16 * len(old)))
+        for h in old:
+            if h:
+                self._slots[self._find(h)] = h
+
+    def __contains__(self, domain):
+        return bool(self._slots[self._find((hash(domain) & _MASK) | 1)])
+
+    def __len__(self):
+        return self._count
+
+    def nbytes(self):
+        return self._slots.itemsize * len(self._slots)
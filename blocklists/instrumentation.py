@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+"""
+instrumentation.py
+
+Per-stage timing and memory spans for the blocklist scripts. Each run writes
+a JSON report and, optionally, a Prometheus textfile for node_exporter's
+textfile collector.
+
+Usage:
+  from instrumentation import METRICS, add_arguments
+
+  add_arguments(parser, 'merge_blocklists')   # --metrics, --prometheus, --trace-memory
+  args = parser.parse_args()
+  METRICS.start_from_args(args)
+
+  with METRICS.span('download', source=name) as span:
+      ...
+      span.count(bytes_in=size, domains_in=len(parsed), domains_out=len(kept))
+
+Every span records wall time, CPU time of the process and of its own thread,
+the process peak RSS so far and the counters given to `count`. With
+--trace-memory, spans opened on the main thread also record the peak of
+tracemalloc's traced memory while they were open (tracemalloc slows Python
+down noticeably, so it is off by default). The reports are written when the
+run ends, also after sys.exit or an exception (atexit).
+
+`--metrics ''` turns instrumentation off: `span` then returns one shared
+no-op object, which costs a method call per span and nothing per domain.
+"""
+
+from datetime import datetime, timezone
+import atexit
+import json
+import os
+import re
+import threading
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:  # not on Windows
+    resource = None
+
+COUNTERS = ('bytes_in', 'domains_in', 'domains_out')
+PROMETHEUS_PREFIX = 'blocklist'
+_LABEL_NAME_RE = re.compile(r'[^a-zA-Z0-9_]')
+
+
+def max_rss_bytes():
+    """Peak resident set size of the process so far, or None if unknown"""
+    if resource is None:
+        return None
+    # ru_maxrss is in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class _NullSpan:
+    """Stands in for every span while instrumentation is off"""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def count(self, **counters):
+        pass
+
+
+NULL_SPAN = _NullSpan()
+
+
+class Span:
+    """One timed stage of a run; counters are added with `count`"""
+
+    def __init__(self, metrics, name, labels):
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self.record = None
+        self._peak = 0
+
+    def count(self, **counters):
+        for key, value in counters.items():
+            self.counters[key] += value
+
+    def __enter__(self):
+        self._main = threading.current_thread() is threading.main_thread()
+        if self._main and self.metrics.trace_memory:
+            self.metrics._push(self)
+        self._start = time.perf_counter()
+        self._cpu = time.process_time()
+        self._thread_cpu = time.thread_time()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        wall = time.perf_counter() - self._start
+        record = {
+            'stage': self.name,
+            'labels': self.labels,
+            'start_s': round(self._start - self.metrics.started, 6),
+            'wall_s': round(wall, 6),
+            'cpu_s': round(time.process_time() - self._cpu, 6),
+            'thread_cpu_s': round(time.thread_time() - self._thread_cpu, 6),
+            'max_rss_bytes': max_rss_bytes(),
+        }
+        if self._main and self.metrics.trace_memory:
+            record['peak_traced_bytes'] = self.metrics._pop(self)
+        record.update(self.counters)
+        if exc_type is not None:
+            record['error'] = exc_type.__name__
+        self.record = record
+        self.metrics._add(record)
+        return False
+
+
+class Metrics:
+    """Collects the spans of one run and writes the reports at its end"""
+
+    def __init__(self):
+        self.enabled = False
+        self.trace_memory = False
+        self.spans = []
+        self._lock = threading.Lock()
+        self._stack = []
+
+    def start(self, script, report=None, textfile=None, trace_memory=False):
+        """Turn instrumentation on for this run; a falsy `report` leaves it off"""
+        if not report:
+            return
+        self.enabled = True
+        self.script = script
+        self.report = report
+        self.textfile = textfile
+        self.trace_memory = trace_memory
+        self.started = time.perf_counter()
+        self.started_cpu = time.process_time()
+        self.started_at = time.time()
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        atexit.register(self.finish)
+
+    def start_from_args(self, args):
+        self.start(args.metrics_script, args.metrics, args.prometheus, args.trace_memory)
+
+    def span(self, name, **labels):
+        """Context manager timing the stage `name`; labels (e.g. source=) tell repeated stages apart"""
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self, name, {key: str(value) for key, value in labels.items()})
+
+    def _push(self, span):
+        # Fold the peak so far into the enclosing span before restarting the
+        # peak for this one
+        peak = tracemalloc.get_traced_memory()[1]
+        if self._stack:
+            parent = self._stack[-1]
+            parent._peak = max(parent._peak, peak)
+        tracemalloc.reset_peak()
+        self._stack.append(span)
+
+    def _pop(self, span):
+        peak = max(span._peak, tracemalloc.get_traced_memory()[1])
+        if span in self._stack:
+            self._stack.remove(span)
+        if self._stack:
+            parent = self._stack[-1]
+            parent._peak = max(parent._peak, peak)
+        return peak
+
+    def _add(self, record):
+        with self._lock:
+            self.spans.append(record)
+
+    def summary(self):
+        """The whole run as one JSON-ready dict"""
+        run = {
+            'script': self.script,
+            'started_at': datetime.fromtimestamp(self.started_at, timezone.utc).isoformat(timespec='seconds'),
+            'wall_s': round(time.perf_counter() - self.started, 6),
+            'cpu_s': round(time.process_time() - self.started_cpu, 6),
+            'max_rss_bytes': max_rss_bytes(),
+        }
+        if self.trace_memory and tracemalloc.is_tracing():
+            run['peak_traced_bytes'] = max([span.get('peak_traced_bytes', 0) for span in self.spans]
+                                           + [tracemalloc.get_traced_memory()[1]])
+        with self._lock:
+            run['spans'] = list(self.spans)
+        return run
+
+    def finish(self):
+        """Write the JSON report (and the Prometheus textfile); runs once, at exit at the latest"""
+        if not self.enabled:
+            return
+        self.enabled = False
+        run = self.summary()
+        try:
+            _write_atomic(self.report, json.dumps(run, indent=2) + '\n')
+            if self.textfile:
+                _write_atomic(self.textfile, prometheus_text(run))
+        except OSError as e:
+            print(f"  ! Could not write metrics: {e}")
+
+
+def _write_atomic(path, text):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    # node_exporter may read the file at any time: never show it half written
+    os.replace(tmp_path, path)
+
+
+def _labels(labels):
+    escaped = (value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for value in labels.values())
+    names = (_LABEL_NAME_RE.sub('_', name) for name in labels)
+    return '{' + ','.join(f'{name}="{value}"' for name, value in zip(names, escaped)) + '}'
+
+
+def prometheus_text(run):
+    """The run in Prometheus text exposition format; repeated stages with the same labels are summed"""
+    script = run['script']
+    stages = {}
+    for span in run['spans']:
+        labels = dict({'script': script, 'stage': span['stage']}, **span['labels'])
+        key = tuple(labels.items())
+        total = stages.setdefault(key, {'labels': labels, 'runs': 0, 'errors': 0})
+        total['runs'] += 1
+        total['errors'] += 'error' in span
+        for field in ('wall_s', 'cpu_s') + COUNTERS:
+            total[field] = total.get(field, 0) + span[field]
+        if 'peak_traced_bytes' in span:
+            total['peak_traced_bytes'] = max(total.get('peak_traced_bytes', 0), span['peak_traced_bytes'])
+
+    families = [
+        ('stage_wall_seconds', 'wall_s', 'Wall time of the stage in the last run'),
+        ('stage_cpu_seconds', 'cpu_s', 'Process CPU time while the stage ran in the last run'),
+        ('stage_peak_traced_bytes', 'peak_traced_bytes', 'Peak traced Python memory during the stage'),
+        ('stage_bytes_in', 'bytes_in', 'Bytes downloaded or read by the stage'),
+        ('stage_domains_in', 'domains_in', 'Domains the stage received'),
+        ('stage_domains_out', 'domains_out', 'Domains the stage produced'),
+        ('stage_runs', 'runs', 'Times the stage ran'),
+        ('stage_errors', 'errors', 'Times the stage ended with an exception'),
+    ]
+    lines = []
+    for suffix, field, help_text in families:
+        samples = [(total['labels'], total[field]) for total in stages.values() if field in total]
+        if not samples:
+            continue
+        name = f"{PROMETHEUS_PREFIX}_{suffix}"
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} gauge")
+        lines.extend(f"{name}{_labels(labels)} {value}" for labels, value in samples)
+
+    run_labels = _labels({'script': script})
+    for suffix, value, help_text in (
+            ('run_wall_seconds', run['wall_s'], 'Wall time of the last run'),
+            ('run_cpu_seconds', run['cpu_s'], 'CPU time of the last run'),
+            ('run_max_rss_bytes', run['max_rss_bytes'], 'Peak resident set size of the last run'),
+            ('run_last_completion_timestamp_seconds', round(time.time(), 3), 'When the last run ended')):
+        if value is None:
+            continue
+        name = f"{PROMETHEUS_PREFIX}_{suffix}"
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} gauge")
+        lines.append(f"{name}{run_labels} {value}")
+    return '\n'.join(lines) + '\n'
+
+
+def add_arguments(parser, script):
+    """Add --metrics, --prometheus and --trace-memory to a script's argument parser"""
+    parser.set_defaults(metrics_script=script)
+    parser.add_argument("--metrics", default=f"{script}.metrics.json", metavar="PATH",
+                        help="Per-stage timing report of this run, as JSON ('' turns instrumentation off)")
+    parser.add_argument("--prometheus", default=None, metavar="PATH",
+                        help="Also write the metrics as a Prometheus textfile (for node_exporter's "
+                             "textfile collector, e.g. /var/lib/node_exporter/textfile/<name>.prom)")
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="Record the peak traced Python memory of each stage (tracemalloc; slower)")
+
+
+METRICS = Metrics()
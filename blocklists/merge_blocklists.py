@@ -1,9 +1,26 @@
 #!/usr/bin/env python3
-import urllib.request
-import re
+from collections import Counter
+import argparse
+import heapq
+import os
+import sqlite3
 from urllib.error import URLError
 import time
 
+from collapse import collapse_subdomains
+from compiled_blocklist import compile_blocklist
+from domain_store import DomainStore
+from external_sort import ExternalSorter
+from exporters import EXACT_MATCH_FORMATS, FORMATS as EXPORT_FORMATS, export_domains
+from feed_cache import FeedCache
+from feed_downloader import fetch_all
+from feed_parser import PARSER_VERSION, iter_lines, parse_allowlist, parse_feed
+from gravity_db import list_address, write_gravity
+from instrumentation import METRICS, add_arguments as add_metrics_arguments
+from regex_rules import is_regex_list, load_rules, report_matches, write_matches
+from snapshots import DEFAULT_SNAPSHOT_DIR, SnapshotStore
+from whitelist_index import WhitelistIndex, normalize_entry
+
 # List of external blocklists to download
 BLOCKLISTS = [
     ("Steven Black", "https://raw.githubusercontent.com/StevenBlack/hosts/master/hosts"),
@@ -15,6 +32,12 @@ BLOCKLISTS = [
     ("OpenPhish", "https://openphish.com/feed.txt"),
 ]
 
+# Allowlist feeds, fetched before the blocklists; of AdBlock-format feeds only
+# the exception rules (`@@||domain^`) are used
+ALLOWLISTS = [
+    ("AdGuard DNS filter", "https://adguardteam.github.io/HostlistsRegistry/assets/filter_1.txt"),
+]
+
 # Whitelist of domains that should NEVER be blocked (critical for normal internet usage)
 WHITELIST = {
     # Payment processors
@@ -68,87 +91,25 @@ WHITELIST = {
     # Analytics subdomains that are often required for sites to function
 }
 
-def is_whitelisted(domain):
-    """Check if a domain should be whitelisted (not blocked)"""
-    domain = domain.lower()
-    for whitelisted in WHITELIST:
-        if domain == whitelisted or domain.endswith('.' + whitelisted):
-            return True
-    return False
-    """Download and parse a blocklist from URL"""
-    domains = set()
-    try:
-        print(f"  Downloading {name}...")
-        with urllib.request.urlopen(url, timeout=10) as response:
-            content = response.read().decode('utf-8', errors='ignore')
-        print(f"  ✓ Downloaded {len(content)} bytes from {name}")
-        
-        for line in content.split('\n'):
-            line = line.strip()
-            if not line or line.startswith('#'):
-                continue
-            
-            # Parse different formats
-            parts = line.split()
-            if len(parts) >= 2:
-                if parts[0] in ['0.0.0.0', '127.0.0.1']:
-                    # hosts file format
-                    domain = parts[1]
-                elif parts[0].startswith('^'):
-                    # regex format, skip
-                    continue
-                else:
-                    domain = parts[0]
-            else:
-                domain = parts[0] if parts else ""
-            
-            if domain and '.' in domain:
-                if not is_whitelisted(domain):
-                    domains.add(domain.lower())
-        
-        print(f"  ✓ Extracted {len(domains)} domains from {name}")
-        return domains
-    except URLError as e:
-        print(f"  ✗ Failed to download {name}: {e}")
-        return set()
-    except Exception as e:
-        print(f"  ✗ Error processing {name}: {e}")
-        return set()
+# One suffix index for the built-in whitelist and every allowlist feed; each
+# entry maps to the rule reported for the domains it removes
+WHITELIST_INDEX = WhitelistIndex()
 
-print("=" * 60)
-print("PI-HOLE COMPREHENSIVE BLOCKLIST MERGER")
-print("=" * 60)
+# Domains removed by the allowlist in this run -> the rule that removed them
+ALLOWLISTED = {}
 
-# Download all blocklists
-all_external_domains = set()
-for name, url in BLOCKLISTS:
-    domains = download_blocklist(name, url)
-    all_external_domains.update(domains)
-    time.sleep(1)  # Rate limiting
+def allow(entry, source):
+    """Add an allowlist entry (the domain and its subdomains) from `source` to the index"""
+    WHITELIST_INDEX.add(entry, f"@@||{normalize_entry(entry)}^ ({source})")
 
-print(f"\n✓ Total domains from external sources: {len(all_external_domains)}")
+for _entry in sorted(WHITELIST):
+    allow(_entry, 'built-in')
 
-# Read current blocklist
-current_domains = set()
-current_comments = []
-try:
-    with open('youtube-blocklist.txt', 'r') as f:
-        for line in f:
-            line_stripped = line.strip()
-            if line_stripped.startswith('#'):
-                continue
-            elif line_stripped and not is_whitelisted(line_stripped):
-                current_domains.add(line_stripped.lower())
-    print(f"✓ Read {len(current_domains)} domains from current blocklist")
-except Exception as e:
-    print(f"✗ Error reading current blocklist: {e}")
-
-# Merge and sort
-all_domains = sorted(all_external_domains | current_domains)
-print(f"\n✓ TOTAL unique domains after merge: {len(all_domains)}")
-
-# Write merged blocklist
-header = f"""# COMPREHENSIVE PI-HOLE BLOCKLIST
+FEED_CACHE = FeedCache()
+
+HEADER_TOTAL_PREFIX = '# Total unique domains:'
+
+HEADER = """# COMPREHENSIVE PI-HOLE BLOCKLIST
 # ====================================
 # This blocklist is designed to block as much as possible including:
 # - Malware & Phishing
@@ -169,24 +130,488 @@ header = f"""# COMPREHENSIVE PI-HOLE BLOCKLIST
 # - URLhaus
 # - OpenPhish
 # 
-# Total unique domains: {len(all_domains)}
+# Total unique domains: {total}
 # Last updated: 2026-01-21
 
 """
 
-try:
-    with open('youtube-blocklist.txt', 'w') as f:
-        f.write(header)
+def is_whitelisted(domain):
+    """Check if a domain should be whitelisted (not blocked)"""
+    return domain.lower() in WHITELIST_INDEX
+
+def is_allowlisted(domain):
+    """Like is_whitelisted for a lowercased domain, recording the rule that removed it for the report"""
+    rule = WHITELIST_INDEX.match(domain)
+    if rule is None:
+        return False
+    ALLOWLISTED[domain] = rule
+    return True
+
+def load_allowlists(extra_urls=()):
+    """Fetch the allowlist feeds (ALLOWLISTS and --allowlist) into WHITELIST_INDEX"""
+    sources = ALLOWLISTS + [(url, url) for url in extra_urls]
+    if not sources:
+        return
+    # A feed can be both a blocklist and an allowlist: keep its allowed set apart
+    cache = FeedCache(os.path.join(FEED_CACHE.cache_dir, 'allowlists'), FEED_CACHE.workers)
+
+    def fetch(source):
+        name, url = source
+        try:
+            return cache.fetch(url, parse_allowlist, timeout=10, parser_version=PARSER_VERSION).domains
+        except Exception as e:
+            print(f"  ✗ Failed to download allowlist {name}: {e}")
+            return set()
+
+    print("Loading allowlists...")
+    before = len(WHITELIST_INDEX)
+    with METRICS.span('allowlists') as span:
+        results = fetch_all(sources, fetch, url_of=lambda source: source[1], host_delay=1)
+        for (name, _), domains in results:
+            for domain in sorted(domains):
+                allow(domain, name)
+            print(f"  ✓ {len(domains)} allowed domains from {name}")
+        span.count(domains_in=sum(len(domains) for _, domains in results),
+                   domains_out=len(WHITELIST_INDEX) - before)
+    print(f"✓ Allowlist index: {len(WHITELIST_INDEX)} entries ({len(WHITELIST_INDEX) - before} from feeds)\n")
+
+def download_blocklist(name, url):
+    """Download and parse a blocklist from URL (conditional GET through the feed cache)"""
+    try:
+        print(f"  Downloading {name}...")
+        with METRICS.span('download', source=name) as span:
+            result = FEED_CACHE.fetch(url, parse_feed, timeout=10, parser_version=PARSER_VERSION)
+            if result.cached:
+                print(f"  ✓ {name} not modified, reusing cached copy ({result.size} bytes)")
+            else:
+                print(f"  ✓ Downloaded {result.size} bytes from {name}")
+
+            domains = {domain for domain in result.domains if not is_allowlisted(domain)}
+            span.count(bytes_in=0 if result.cached else result.size, domains_in=len(result.domains),
+                       domains_out=len(domains))
+        print(f"  ✓ Extracted {len(domains)} domains from {name}")
+        return domains
+    except URLError as e:
+        print(f"  ✗ Failed to download {name}: {e}")
+        return set()
+    except Exception as e:
+        print(f"  ✗ Error processing {name}: {e}")
+        return set()
+
+def read_blocklist_domains(file_path):
+    """Yield the non-whitelisted domains of an existing blocklist, in file order"""
+    if not os.path.exists(file_path):
+        return
+    with open(file_path, 'r') as f:
+        for line in f:
+            line_stripped = line.strip()
+            if line_stripped and not line_stripped.startswith('#'):
+                domain = line_stripped.lower()
+                if not is_allowlisted(domain):
+                    yield domain
+
+def merged_domains(file_path, added, removed):
+    """Stream the existing (sorted) blocklist with `added` merged in and `removed` dropped"""
+    previous = None
+    existing = (d for d in read_blocklist_domains(file_path) if d not in removed)
+    for domain in heapq.merge(existing, sorted(added)):
+        if domain != previous:
+            yield domain
+            previous = domain
+
+def header_total(file_path):
+    """Domain count recorded in the header of an existing blocklist, or None"""
+    if not os.path.exists(file_path):
+        return None
+    with open(file_path, 'r') as f:
+        for line in f:
+            if line.startswith(HEADER_TOTAL_PREFIX):
+                try:
+                    return int(line[len(HEADER_TOTAL_PREFIX):])
+                except ValueError:
+                    return None
+            if line.strip() and not line.startswith('#'):
+                return None
+    return None
+
+def apply_deltas(file_path, added, removed):
+    """Update the blocklist in place from per-source deltas; return (domain count, rewritten).
+
+    The existing file is streamed twice (once to count, once to write) instead
+    of being loaded, re-merged and re-sorted. It is not rewritten at all when
+    there is nothing to change, i.e. no deltas and no domain dropped by the
+    allowlist since it was written (the count still matches its header).
+    """
+    total = sum(1 for _ in merged_domains(file_path, added, removed))
+    if not added and not removed and header_total(file_path) == total:
+        return total, False
+    tmp_path = file_path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        f.write(HEADER.format(total=total))
         f.write("# ===== COMBINED DOMAIN LIST =====\n\n")
-        for domain in all_domains:
+        for domain in merged_domains(file_path, added, removed):
             f.write(domain + '\n')
-    
+    os.replace(tmp_path, file_path)
+    return total, True
+
+def merge_incremental(results, file_path, snapshots):
+    """Apply each source's changes since its last snapshot to the blocklist"""
+    added = set()
+    removed = set()
+    skipped = []
+    for (name, url), domains in results:
+        if not domains and snapshots.exists(name):
+            print(f"  ! {name} returned no domains, keeping its previous snapshot")
+            skipped.append(name)
+            continue
+        source_added, source_removed = snapshots.update(name, domains)
+        print(f"  {name}: +{len(source_added)} -{len(source_removed)}")
+        added.update(source_added)
+        removed.update(source_removed)
+
+    # A domain dropped by one source stays if another source still lists it
+    removed = {d for d in removed if not any(d in domains for _, domains in results)}
+    # ...including a source skipped this run, through its kept snapshot
+    for name in skipped:
+        if removed:
+            removed.difference_update(snapshots.iter_domains(name))
+    print(f"\n✓ Changes since last run: +{len(added)} -{len(removed)} domains")
+
+    total, rewritten = apply_deltas(file_path, added, removed)
     print("\n" + "=" * 60)
-    print(f"✓ Successfully merged blocklists!")
-    print(f"✓ Blocklist size: {len(all_domains)} domains")
-    print(f"✓ File: youtube-blocklist.txt")
+    if rewritten:
+        print(f"✓ Updated {file_path} in place")
+    else:
+        print(f"✓ {file_path} is already up to date, not rewritten")
+    print(f"✓ Blocklist size: {total} domains")
     print("=" * 60)
-except Exception as e:
-    print(f"\n✗ Error writing blocklist: {e}")
+    return total
+
+def spill_blocklist(name, url, sorter, snapshots, budget, tmp_dir):
+    """Stream one feed into `sorter` and its snapshot without holding its domain set; return its count.
+
+    The body is parsed from the feed cache's copy on disk and the domains
+    are sorted and deduplicated through their own ExternalSorter of `budget`
+    bytes, which also yields the sorted stream the snapshot is written from.
+    """
+    try:
+        print(f"  Downloading {name}...")
+        with METRICS.span('download', source=name) as span:
+            result = FEED_CACHE.fetch_body(url, timeout=10)
+            if result.cached:
+                print(f"  ✓ {name} not modified, reusing cached copy ({result.size} bytes)")
+            else:
+                print(f"  ✓ Downloaded {result.size} bytes from {name}")
+
+            parsed = 0
+            with ExternalSorter(budget, tmp_dir=tmp_dir) as feed, open(result.path, 'rb') as f:
+                for domain in parse_feed(iter_lines(f)):
+                    parsed += 1
+                    if not is_allowlisted(domain):
+                        feed.add(domain)
+                count = feed.finish()
+                if count or not snapshots.exists(name):
+                    snapshots.write(name, feed)
+                else:
+                    print(f"  ! {name} returned no domains, keeping its previous snapshot")
+                sorter.update(feed)
+            span.count(bytes_in=0 if result.cached else result.size, domains_in=parsed, domains_out=count)
+        print(f"  ✓ Extracted {count} domains from {name}")
+        return count
+    except URLError as e:
+        print(f"  ✗ Failed to download {name}: {e}")
+        return 0
+    except Exception as e:
+        print(f"  ✗ Error processing {name}: {e}")
+        return 0
+
+def merge_external(args, snapshots):
+    """Full merge through on-disk sorts that keep memory near --memory-budget.
+
+    Feeds are fetched one at a time and each is streamed from disk into the
+    merge sorter (see spill_blocklist), so no feed's domain set is ever held
+    whole; half the budget goes to the merge sorter and half to the feed
+    being read. The current blocklist is streamed in, and the sorted result
+    is streamed out.
+    """
+    budget = int(args.memory_budget * 2**20) // 2
+    tmp_dir = os.path.dirname(os.path.abspath(args.output))
+
+    with ExternalSorter(budget, tmp_dir=tmp_dir) as sorter:
+        start_time = time.monotonic()
+        with METRICS.span('download_all') as span:
+            total_in = sum(spill_blocklist(name, url, sorter, snapshots, budget, tmp_dir)
+                           for name, url in BLOCKLISTS)
+            span.count(domains_out=total_in)
+        print(f"\n✓ Downloaded {len(BLOCKLISTS)} blocklists in {time.monotonic() - start_time:.1f}s")
+
+        current = 0
+        with METRICS.span('read_current') as span:
+            for domain in read_blocklist_domains(args.output):
+                sorter.add(domain)
+                current += 1
+            span.count(domains_out=current)
+        print(f"✓ Read {current} domains from current blocklist")
+
+        with METRICS.span('sort') as span:
+            total = sorter.finish()
+            span.count(domains_out=total)
+        print(f"\n✓ TOTAL unique domains after merge: {total} "
+              f"(sorted in {sorter.spilled} runs of at most {args.memory_budget / 2:g} MB)")
+
+        tmp_path = args.output + '.tmp'
+        with METRICS.span('write') as span, open(tmp_path, 'w') as f:
+            f.write(HEADER.format(total=total))
+            f.write("# ===== COMBINED DOMAIN LIST =====\n\n")
+            for domain in sorter:
+                f.write(domain + '\n')
+            span.count(domains_out=total)
+        os.replace(tmp_path, args.output)
+        print("\n" + "=" * 60)
+        print(f"✓ Successfully merged blocklists!")
+        print(f"✓ Blocklist size: {total} domains")
+        print(f"✓ File: {args.output}")
+        print("=" * 60)
+
+        export_output(args, sorter, total)
+        regex_report(args, sorter, total)
+    compile_output(args, snapshots)
+    gravity_output(args)
+    allowlist_report(args)
+    FEED_CACHE.report()
+
+def export_output(args, domains, total):
+    """Write the --export formats in one pass over the merged domains.
+
+    With --collapse the formats that block whole subtrees get the list without
+    redundant subdomains; exact-match formats always get every domain.
+    """
+    if not args.export:
+        return
+    exact = [fmt for fmt in args.export if not args.collapse or fmt in EXACT_MATCH_FORMATS]
+    subtree = [fmt for fmt in args.export if fmt not in exact]
+    paths = {}
+    if exact:
+        with METRICS.span('export') as span:
+            paths.update(export_domains(domains, args.export_dir, exact, args.gzip, total))
+            span.count(domains_in=total)
+    if subtree:
+        with METRICS.span('collapse') as span:
+            kept, removed, removed_bytes = collapse_subdomains(domains)
+            kept.sort()
+            span.count(domains_in=total, domains_out=len(kept))
+        print(f"✓ Collapsed {removed} redundant subdomains for {', '.join(subtree)} "
+              f"({removed / max(total, 1):.1%} of rules, {removed_bytes} bytes smaller), {len(kept)} domains left")
+        with METRICS.span('export') as span:
+            paths.update(export_domains(kept, args.export_dir, subtree, args.gzip, len(kept)))
+            span.count(domains_in=len(kept))
+    for fmt in args.export:
+        print(f"✓ Exported {fmt} to {paths[fmt]}")
+
+def regex_report(args, domains, total):
+    """Report which merged domains each rule of the regex-format sources matches (--regex-report)"""
+    if not args.regex_report:
+        return
+    paths = [path for path in (FEED_CACHE.body_path(url) for _, url in BLOCKLISTS)
+             if path and is_regex_list(path)]
+    if not paths:
+        print("  ! No regex-format source has been downloaded, skipping --regex-report")
+        return
+    stats = Counter()
+    with METRICS.span('regex_report') as span:
+        rules = load_rules(paths, stats=stats)
+        print(f"\n✓ {len(rules)} regex rules from {len(paths)} source(s) "
+              f"({stats['duplicate']} duplicates, {stats['per-query'] + stats['invalid']} unusable dropped)")
+        matches = rules.match_all(domains)
+        span.count(domains_in=total, domains_out=len(set().union(*matches.values())) if matches else 0)
+    report_matches(rules, matches, total, top=10)
+    write_matches(args.regex_report, matches)
+    print(f"✓ Regex rule matches written to {args.regex_report}")
+
+def compile_output(args, snapshots):
+    """Compile the written blocklist when --compile was given"""
+    if not args.compile:
+        return
+    with METRICS.span('compile') as span:
+        written = compile_blocklist(args.output, args.compile, snapshots, [name for name, _ in BLOCKLISTS])
+        span.count(domains_out=written)
+    print(f"✓ Compiled {written} domains into {args.compile}")
+
+def allowlist_report(args):
+    """Summarise the domains the allowlist removed and write each with its rule (--allowlist-report)"""
+    if not ALLOWLISTED:
+        print("✓ Allowlist removed no domains")
+        return
+    by_rule = Counter(ALLOWLISTED.values())
+    print(f"\n✓ Allowlist removed {len(ALLOWLISTED)} domains ({len(by_rule)} rules matched); top rules:")
+    for rule, count in by_rule.most_common(10):
+        print(f"  {count:>10}  {rule}")
+    if not args.allowlist_report:
+        return
+    tmp_path = args.allowlist_report + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write("# domain\trule\n")
+        f.writelines(f"{domain}\t{ALLOWLISTED[domain]}\n" for domain in sorted(ALLOWLISTED))
+    os.replace(tmp_path, args.allowlist_report)
+    print(f"✓ Removed domains and their allowlist rules written to {args.allowlist_report}")
+
+def gravity_output(args):
+    """Load the written blocklist into Pi-hole's gravity.db when --gravity-db was given"""
+    if not args.gravity_db:
+        return
+    try:
+        with METRICS.span('gravity_db') as span:
+            result = write_gravity(read_blocklist_domains(args.output), args.gravity_db,
+                                   list_address(args.output), args.gravity_diff)
+            span.count(domains_out=result.rows)
+    except (OSError, ValueError, sqlite3.Error) as e:
+        print(f"✗ Could not write {args.gravity_db}: {e}")
+        return
+    print(f"✓ Loaded {result.rows} domains into {args.gravity_db} as adlist {result.adlist_id} "
+          f"(+{result.inserted} -{result.deleted} rows); run `pihole reloadlists` to apply")
+
+def main():
+    parser = argparse.ArgumentParser(description="Merge upstream blocklists into one Pi-hole blocklist")
+    parser.add_argument("-o", "--output", default="youtube-blocklist.txt",
+                        help="Blocklist to merge into (read, then rewritten)")
+    parser.add_argument("--collapse", action="store_true",
+                        help="Drop subdomains of blocked domains from the --export formats that block whole "
+                             "subtrees (dnsmasq, unbound, rpz, adguard); the blocklist itself, hosts exports "
+                             "and --gravity-db keep every name")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Apply only per-source changes since the last run instead of rebuilding the list")
+    parser.add_argument("--snapshot-dir", default=DEFAULT_SNAPSHOT_DIR,
+                        help="Where per-source snapshots are kept between runs")
+    parser.add_argument("--compile", metavar="PATH", default=None,
+                        help="Also compile the result for fast lookups (see compiled_blocklist.py)")
+    parser.add_argument("--export", default="",
+                        help=f"Comma-separated extra output formats ({', '.join(EXPORT_FORMATS)})")
+    parser.add_argument("--export-dir", default="exports", help="Folder for --export files")
+    parser.add_argument("--gzip", action="store_true", help="gzip-compress the --export files")
+    parser.add_argument("--parse-workers", type=int, default=None,
+                        help="Processes used to parse each large feed (default: one per CPU; 1 = no pool)")
+    parser.add_argument("--memory-budget", type=float, metavar="MB", default=None,
+                        help="Sort the full merge on disk, keeping at most about MB megabytes of domains "
+                             "in memory (for low-memory hosts)")
+    parser.add_argument("--regex-report", metavar="PATH", default=None,
+                        help="Write which merged domains each rule of the regex sources (pihole-regex) "
+                             "matches, as TSV (see regex_rules.py)")
+    parser.add_argument("--allowlist", action="append", default=[], metavar="URL",
+                        help="Extra allowlist feed (repeatable; file:// for local files). Of AdBlock-format "
+                             "feeds only the @@ exception rules are used")
+    parser.add_argument("--allowlist-report", metavar="PATH", default=None,
+                        help="Write every domain the allowlist removed, with the rule that removed it, "
+                             "as TSV")
+    parser.add_argument("--gravity-db", metavar="PATH", default=None,
+                        help="Also write the result straight into this Pi-hole gravity.db (see gravity_db.py)")
+    parser.add_argument("--gravity-diff", action="store_true",
+                        help="Update --gravity-db in place, inserting and deleting only what changed")
+    add_metrics_arguments(parser, 'merge_blocklists')
+    args = parser.parse_args()
+    if args.incremental and args.collapse:
+        parser.error("--collapse needs the full merged list and cannot be combined with --incremental")
+    if args.memory_budget is not None:
+        if args.memory_budget <= 0:
+            parser.error("--memory-budget must be positive")
+        if args.incremental or args.collapse:
+            parser.error("--memory-budget applies to the full merge and cannot be combined with "
+                         "--incremental or --collapse")
+    if args.gravity_diff and not args.gravity_db:
+        parser.error("--gravity-diff needs --gravity-db")
+    args.export = [fmt.strip() for fmt in args.export.split(",") if fmt.strip()]
+    if any(fmt not in EXPORT_FORMATS for fmt in args.export):
+        parser.error(f"--export formats must be among: {', '.join(EXPORT_FORMATS)}")
+    if args.collapse and all(fmt in EXACT_MATCH_FORMATS for fmt in args.export):
+        parser.error("--collapse only applies to --export formats that block whole subtrees: "
+                     f"{', '.join(fmt for fmt in EXPORT_FORMATS if fmt not in EXACT_MATCH_FORMATS)}")
+    if args.parse_workers is not None:
+        FEED_CACHE.workers = max(args.parse_workers, 1)
+    snapshots = SnapshotStore(args.snapshot_dir)
+    METRICS.start_from_args(args)
+
+    print("=" * 60)
+    print("PI-HOLE COMPREHENSIVE BLOCKLIST MERGER")
+    print("=" * 60)
+
+    load_allowlists(args.allowlist)
+
+    if args.memory_budget is not None:
+        merge_external(args, snapshots)
+        return
+
+    # Download all blocklists (in parallel, rate limited per host)
+    start_time = time.monotonic()
+    with METRICS.span('download_all') as span:
+        results = fetch_all(BLOCKLISTS, lambda source: download_blocklist(*source),
+                            url_of=lambda source: source[1], host_delay=1)
+        span.count(domains_out=sum(len(domains) for _, domains in results))
+    print(f"\n✓ Downloaded {len(BLOCKLISTS)} blocklists in {time.monotonic() - start_time:.1f}s")
+
+    if args.incremental:
+        with METRICS.span('apply_deltas') as span:
+            total = merge_incremental(results, args.output, snapshots)
+            span.count(domains_out=total)
+        export_output(args, read_blocklist_domains(args.output), total)
+        regex_report(args, read_blocklist_domains(args.output), total)
+        compile_output(args, snapshots)
+        gravity_output(args)
+        allowlist_report(args)
+        FEED_CACHE.report()
+        return
+
+    with METRICS.span('snapshots'):
+        for (name, url), domains in results:
+            # A failed download must not wipe out the source's last good snapshot
+            if domains or not snapshots.exists(name):
+                snapshots.update(name, domains)
+    # Fill one compact store a feed at a time (see domain_store.py), dropping
+    # each feed's set once it is in, instead of a full set union and sorted list
+    with METRICS.span('union') as span:
+        span.count(domains_in=sum(len(domains) for _, domains in results))
+        all_domains = DomainStore()
+        while results:
+            all_domains.update(results.pop()[1])
+        span.count(domains_out=len(all_domains))
+    print(f"✓ Total domains from external sources: {len(all_domains)}")
+
+    # Read current blocklist straight into the store
+    before = len(all_domains)
+    try:
+        with METRICS.span('read_current') as span:
+            all_domains.update(read_blocklist_domains(args.output))
+            span.count(domains_out=len(all_domains) - before)
+        print(f"✓ Read current blocklist, {len(all_domains) - before} domains not in any source")
+    except Exception as e:
+        print(f"✗ Error reading current blocklist: {e}")
+    print(f"\n✓ TOTAL unique domains after merge: {len(all_domains)}")
+
+    # Write merged blocklist
+    header = HEADER.format(total=len(all_domains))
+
+    try:
+        # Replaced atomically: readers such as dns/sinkhole.py never see a partial list
+        tmp_path = args.output + '.tmp'
+        with METRICS.span('write') as span, open(tmp_path, 'wb') as f:
+            f.write(header.encode('utf-8'))
+            f.write(b"# ===== COMBINED DOMAIN LIST =====\n\n")
+            all_domains.write_to(f)
+            span.count(domains_out=len(all_domains))
+        os.replace(tmp_path, args.output)
+    
+        print("\n" + "=" * 60)
+        print(f"✓ Successfully merged blocklists!")
+        print(f"✓ Blocklist size: {len(all_domains)} domains")
+        print(f"✓ File: {args.output}")
+        print("=" * 60)
+    except Exception as e:
+        print(f"\n✗ Error writing blocklist: {e}")
 
+    export_output(args, all_domains, len(all_domains))
+    regex_report(args, all_domains, len(all_domains))
+    compile_output(args, snapshots)
+    gravity_output(args)
+    allowlist_report(args)
+    FEED_CACHE.report()
 
+if __name__ == "__main__":
+    main()
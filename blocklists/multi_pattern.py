@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""
+multi_pattern.py
+
+Find which of many literal patterns occur in a string, in one scan.
+
+Usage:
+  from multi_pattern import Automaton
+
+  automaton = Automaton([("youtube.com", "youtube"), ("tiktok", "tiktok")])
+  automaton.values_in("m.youtube.com")     # {'youtube'}
+
+An Aho-Corasick automaton walks the string once, however many patterns there
+are. Most blocklist domains contain no pattern at all, so a regex (C speed)
+rejects those before the automaton walk in Python. The regex is the patterns'
+trie written as nested groups, which costs at most one branch per character
+instead of one per pattern.
+
+`required_literals` finds literal text that every match of a regex must
+contain, so an automaton over those literals can pick out the few regexes
+worth running on a given domain.
+"""
+
+import re
+
+_QUANTIFIERS = "*+?{"
+# `{m}`, `{m,}`, `{,n}`, `{m,n}`; any other `{` is a literal brace
+_BRACE_RE = re.compile(r"\{(\d*)(,?)(\d*)\}")
+
+
+def trie_regex(literals):
+    """Regex source matching any of `literals` (only for existence checks)"""
+    trie = {}
+    for literal in literals:
+        node = trie
+        for ch in literal:
+            node = node.setdefault(ch, {})
+        # A shorter literal matches wherever a longer one does
+        node.clear()
+        node[""] = True
+
+    def build(node):
+        if "" in node:
+            return ""
+        branches = [re.escape(ch) + build(child) for ch, child in sorted(node.items())]
+        return branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+
+    return build(trie)
+
+
+def _split_top_level(pattern):
+    """Split a regex source on its top-level `|`"""
+    branches, depth, start, i = [], 0, 0, 0
+    while i < len(pattern):
+        ch = pattern[i]
+        if ch == "\\":
+            i += 1
+        elif ch == "[":
+            i = _class_end(pattern, i)
+        elif ch == "(":
+            depth += 1
+        elif ch == ")":
+            depth -= 1
+        elif ch == "|" and depth == 0:
+            branches.append(pattern[start:i])
+            start = i + 1
+        i += 1
+    branches.append(pattern[start:])
+    return branches
+
+
+def _class_end(pattern, i):
+    """Index of the `]` closing the character class opened at `i`"""
+    i += 1
+    if i < len(pattern) and pattern[i] == "^":
+        i += 1
+    if i < len(pattern) and pattern[i] == "]":
+        i += 1
+    while i < len(pattern) and pattern[i] != "]":
+        if pattern[i] == "\\":
+            i += 1
+        i += 1
+    return i
+
+
+def _longest_literal(branch):
+    """Longest run of literal characters that every match of `branch` contains"""
+    best, run, i = "", "", 0
+    while i < len(branch):
+        ch = branch[i]
+        literal = None
+        if ch == "\\" and i + 1 < len(branch):
+            nxt = branch[i + 1]
+            # Escaped punctuation is a literal; \d, \w, \b, \x41, ... are not
+            literal = nxt if not nxt.isalnum() else None
+            i += 2 + {"x": 2, "u": 4, "U": 8}.get(nxt, 0)
+            if nxt == "N":
+                i = branch.find("}", i) + 1 or len(branch)
+            while nxt.isdigit() and i < len(branch) and branch[i].isdigit():
+                i += 1
+        elif ch == "[":
+            i = _class_end(branch, i) + 1
+        elif ch == "(":
+            depth = 0
+            while i < len(branch):
+                if branch[i] == "\\":
+                    i += 1
+                elif branch[i] == "[":
+                    i = _class_end(branch, i)
+                elif branch[i] == "(":
+                    depth += 1
+                elif branch[i] == ")":
+                    depth -= 1
+                    if depth == 0:
+                        break
+                i += 1
+            i += 1
+        elif ch in ".^$":
+            i += 1
+        else:
+            literal = ch
+            i += 1
+        quantifier = branch[i] if i < len(branch) else ""
+        brace = _BRACE_RE.match(branch, i) if quantifier == "{" else None
+        if brace and not any(brace.groups()):
+            brace = None  # `{}` matches itself
+        if quantifier and quantifier in _QUANTIFIERS and (quantifier != "{" or brace):
+            # Items repeated at least once are required, like `+`; `{0}` and
+            # `{0,n}` may match nothing, like `?` and `*`
+            required = quantifier == "+" or bool(brace and int(brace.group(1) or 0) >= 1)
+            i = brace.end() if brace else i + 1
+            if i < len(branch) and branch[i] in "?+":
+                i += 1
+            if required and literal is not None:
+                run += literal
+            # An optional or repeated item ends the run either way
+            literal = None
+        if literal is None:
+            best = max(best, run, key=len)
+            run = ""
+        else:
+            run += literal
+    return max(best, run, key=len)
+
+
+def required_literals(pattern):
+    """Literals one of which occurs in every match of `pattern`, or None if unknown.
+
+    Patterns with inline flags (e.g. `(?i)`) or a branch without any literal
+    return None, and must be run on every input.
+    """
+    if pattern.startswith("(?") and not pattern.startswith(("(?:", "(?=", "(?!", "(?<", "(?P")):
+        return None
+    literals = [_longest_literal(branch) for branch in _split_top_level(pattern)]
+    return None if not all(literals) else literals
+
+
+class Automaton:
+    """Aho-Corasick automaton over (pattern, value) pairs"""
+
+    def __init__(self, patterns=()):
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [set()]
+        literals = set()
+        for pattern, value in patterns:
+            literals.add(pattern)
+            state = 0
+            for ch in pattern:
+                nxt = self._goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[state][ch] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append(set())
+                state = nxt
+            self._out[state].add(value)
+        self.size = len(literals)
+
+        # Breadth-first: a state's failure link is the longest proper suffix
+        # that is also a trie state, and it inherits that state's outputs
+        queue = list(self._goto[0].values())
+        for state in queue:
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fail = self._fail[state]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(ch, 0)
+                self._out[nxt] |= self._out[self._fail[nxt]]
+
+        # Only answers "any pattern here?"; the automaton finds which ones
+        self._prefilter = re.compile(trie_regex(literals)) if literals else None
+
+    def values_in(self, text):
+        """Return the set of values of every pattern that occurs in `text`"""
+        if self._prefilter is None or not self._prefilter.search(text):
+            return set()
+        goto, fail, out = self._goto, self._fail, self._out
+        found = set(out[0])
+        state = 0
+        for ch in text:
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if out[state]:
+                found |= out[state]
+        return found
+
+    def __len__(self):
+        return self.size
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+parallel_parse.py
+
+Parse very large feed files (OISD big, StevenBlack unified hosts, ...) on
+several cores.
+
+Usage:
+  from parallel_parse import parse_file
+
+  domains = parse_file('.feed-cache/<key>.body', workers=4)
+
+The file is split into newline-aligned byte ranges. Each worker process maps
+the file with mmap and parses only its own range, so the feed is never
+pickled or copied between processes; only the parsed domains travel back,
+as one newline-joined string per chunk (far cheaper to pickle than a list of
+strings), and are merged into one set. For the format-detecting parsers
+(parse_feed, parse_allowlist) the format is detected once from the start of
+the file and every chunk is parsed with that format.
+
+The pool only pays off with spare CPUs: the worker count is capped at the
+CPUs this process may run on. Files under PARALLEL_MIN_BYTES, a single CPU,
+other parse functions and formats whose parser carries state from line to
+line (CSV: header row, quoted fields) are parsed sequentially.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import mmap
+import multiprocessing
+import os
+import threading
+
+from feed_parser import detect_format, iter_lines, parse_allowlist, parse_feed, take_sample
+
+# Below this size the pool round trip costs more than it saves
+PARALLEL_MIN_BYTES = 8 << 20
+CHUNKS_PER_WORKER = 4
+# Formats whose parser treats every line on its own
+CHUNKABLE_FORMATS = {'hosts', 'adblock', 'dnsmasq', 'regex', 'plain'}
+# Parsers that detect the feed format themselves and accept it as `fmt=`
+FORMAT_PARSERS = (parse_feed, parse_allowlist)
+
+_pool = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+
+def available_cpus():
+    """CPUs this process may run on (its affinity mask, where the OS has one)"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def default_workers():
+    return available_cpus()
+
+
+def _get_pool(workers):
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown()
+            # spawn: the callers download feeds from threads, and forking a
+            # threaded process can leave a child holding a dead thread's lock
+            _pool = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn'))
+            _pool_workers = workers
+        return _pool
+
+
+class _RangeReader:
+    """Binary reader over bytes [start, end) of a memory map"""
+
+    def __init__(self, data, start, end):
+        self.data = data
+        self.data.seek(start)
+        self.remaining = end - start
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        self.remaining -= size
+        return self.data.read(size)
+
+
+def chunk_ranges(data, chunks):
+    """Split a memory map into up to `chunks` ranges that end on a newline"""
+    size = len(data)
+    ranges = []
+    start = 0
+    for i in range(1, chunks):
+        cut = data.find(b'\n', max(start, size * i // chunks))
+        if cut == -1:
+            break
+        ranges.append((start, cut + 1))
+        start = cut + 1
+    if start < size:
+        ranges.append((start, size))
+    return ranges
+
+
+def _parse_range(path, start, end, parse):
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        return '\n'.join(set(parse(iter_lines(_RangeReader(data, start, end)))))
+
+
+def parse_file(path, parse=parse_feed, workers=None, min_bytes=PARALLEL_MIN_BYTES):
+    """Return the set of domains `parse(lines)` yields for the file at `path`"""
+    workers = min(workers or default_workers(), available_cpus())
+    with open(path, 'rb') as f:
+        chunkable = False
+        if parse in FORMAT_PARSERS:
+            fmt = detect_format(take_sample(iter_lines(f)))
+            f.seek(0)
+            parse = partial(parse, fmt=fmt)
+            chunkable = fmt in CHUNKABLE_FORMATS
+        size = os.fstat(f.fileno()).st_size
+        if not chunkable or workers < 2 or size < min_bytes:
+            return set(parse(iter_lines(f)))
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            ranges = chunk_ranges(data, workers * CHUNKS_PER_WORKER)
+
+    pool = _get_pool(workers)
+    futures = [pool.submit(_parse_range, path, start, end, parse) for start, end in ranges]
+    domains = set()
+    for future in futures:
+        chunk = future.result()
+        if chunk:
+            domains.update(chunk.split('\n'))
+    return domains
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+prune_dead_domains.py
+
+Find blocklist domains that no longer exist (NXDOMAIN) by resolving all of
+them concurrently with asyncio, and write them to a prune list.
+
+Usage:
+  python prune_dead_domains.py -i blocker.txt [-o dead_domains.txt] [--resolver 127.0.0.1:53]
+                               [--concurrency 2000] [--timeout 2] [--retries 1]
+                               [--cache .nxdomain-cache.json] [--max-cache-ttl 86400]
+
+Queries go out over one UDP socket (see dns_wire.py) with up to
+--concurrency of them in flight, so a local stub resolver (unbound,
+dnsmasq, Pi-hole's own FTL) can be used, or a throwaway one in tests. Only
+NXDOMAIN counts as dead: a domain with no A record still exists, and
+timeouts or SERVFAIL say nothing about the name. The blocklist itself is
+not modified; review the prune list, then apply it with
+`clean_blocklist.py --prune dead_domains.txt`.
+
+NXDOMAIN answers are cached on disk for their negative TTL (from the SOA of
+the response, capped at --max-cache-ttl, or --default-ttl without an SOA),
+so a re-run only queries the domains whose answer has expired.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+from dns_wire import RCODE_NAMES, RCODE_NOERROR, RCODE_NXDOMAIN, DNSClient, parse_server
+from feed_parser import iter_lines, parse_feed
+
+DEFAULT_CACHE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.nxdomain-cache.json')
+DEFAULT_TTL = 3600
+MAX_CACHE_TTL = 86400
+PROGRESS_EVERY = 50000
+
+
+class NXDomainCache:
+    """On-disk {domain: expiry time} of NXDOMAIN answers"""
+
+    def __init__(self, path, default_ttl=DEFAULT_TTL, max_ttl=MAX_CACHE_TTL):
+        self.path = path
+        self.default_ttl = default_ttl
+        self.max_ttl = max_ttl
+        self.now = time.time()
+        self._expiry = {}
+        if path and os.path.exists(path):
+            try:
+                with open(path, 'r') as f:
+                    self._expiry = {d: t for d, t in json.load(f).items() if t > self.now}
+            except (OSError, ValueError) as e:
+                print(f"  ! Ignoring unreadable NXDOMAIN cache {path}: {e}")
+
+    def __contains__(self, domain):
+        return self._expiry.get(domain, 0) > self.now
+
+    def __len__(self):
+        return len(self._expiry)
+
+    def add(self, domain, negative_ttl=None):
+        ttl = self.default_ttl if negative_ttl is None else negative_ttl
+        self._expiry[domain] = self.now + min(ttl, self.max_ttl)
+
+    def discard(self, domain):
+        self._expiry.pop(domain, None)
+
+    def save(self):
+        if not self.path:
+            return
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({d: t for d, t in self._expiry.items() if t > self.now}, f)
+        os.replace(tmp_path, self.path)
+
+
+class PruneStats:
+    def __init__(self):
+        self.checked = 0
+        self.alive = 0
+        self.dead = 0
+        self.cached = 0
+        self.failed = 0
+        self.timeouts = 0
+        self.rcodes = {}
+
+
+async def find_dead(domains, client, cache, stats, concurrency):
+    """Resolve `domains`; return the NXDOMAIN ones in input order"""
+    dead = {}
+    pending = iter(enumerate(domains))
+
+    async def worker():
+        for i, domain in pending:
+            if domain in cache:
+                stats.cached += 1
+                dead[i] = domain
+                continue
+            try:
+                response = await client.query(domain)
+            except ValueError:
+                # Not a valid DNS name: nothing to learn about it
+                stats.failed += 1
+                continue
+            stats.checked += 1
+            if stats.checked % PROGRESS_EVERY == 0:
+                print(f"  ... {stats.checked} resolved, {stats.dead} NXDOMAIN")
+            if response is None:
+                stats.timeouts += 1
+            elif response.rcode == RCODE_NXDOMAIN:
+                stats.dead += 1
+                cache.add(domain, response.negative_ttl)
+                dead[i] = domain
+            elif response.rcode == RCODE_NOERROR:
+                stats.alive += 1
+                cache.discard(domain)
+            else:
+                stats.failed += 1
+                name = RCODE_NAMES.get(response.rcode, str(response.rcode))
+                stats.rcodes[name] = stats.rcodes.get(name, 0) + 1
+
+    await client.open()
+    try:
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+    finally:
+        client.close()
+    return [dead[i] for i in sorted(dead)]
+
+
+def read_domains(path):
+    """Unique domains of a blocklist in any feed format, in file order"""
+    with open(path, 'rb') as f:
+        return list(dict.fromkeys(parse_feed(iter_lines(f))))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="List blocklist domains that no longer resolve (NXDOMAIN)")
+    parser.add_argument("-i", "--input", default="blocker.txt", help="Blocklist to check")
+    parser.add_argument("-o", "--output", default="dead_domains.txt", help="Where to write the prune list")
+    parser.add_argument("--resolver", default="127.0.0.1:53", help="Resolver address, host[:port]")
+    parser.add_argument("--concurrency", type=int, default=2000, help="Queries in flight (max 65536)")
+    parser.add_argument("--timeout", type=float, default=2.0, help="Seconds to wait for each answer")
+    parser.add_argument("--retries", type=int, default=1, help="Retries after a timeout")
+    parser.add_argument("--cache", default=DEFAULT_CACHE, help="NXDOMAIN cache file ('' to disable)")
+    parser.add_argument("--default-ttl", type=int, default=DEFAULT_TTL,
+                        help="Cache lifetime of an NXDOMAIN answer without an SOA record")
+    parser.add_argument("--max-cache-ttl", type=int, default=MAX_CACHE_TTL,
+                        help="Upper bound on the cache lifetime of an NXDOMAIN answer")
+    args = parser.parse_args()
+    if not 0 < args.concurrency <= 65536:
+        parser.error("--concurrency must be between 1 and 65536")
+
+    try:
+        server = parse_server(args.resolver)
+    except ValueError:
+        parser.error(f"invalid --resolver {args.resolver!r}")
+    try:
+        domains = read_domains(args.input)
+    except OSError as e:
+        print(f"Cannot read blocklist: {e}", file=sys.stderr)
+        sys.exit(2)
+
+    print(f"Resolving {len(domains)} domains via {server[0]}:{server[1]} "
+          f"({args.concurrency} in flight)...")
+    cache = NXDomainCache(args.cache, args.default_ttl, args.max_cache_ttl)
+    client = DNSClient(server, args.timeout, args.retries, args.concurrency)
+    stats = PruneStats()
+    start = time.perf_counter()
+    dead = asyncio.run(find_dead(domains, client, cache, stats, args.concurrency))
+    elapsed = time.perf_counter() - start
+    cache.save()
+
+    tmp_path = args.output + '.tmp'
+    with open(tmp_path, 'w') as f:
+        f.write(f"# NXDOMAIN domains from {os.path.basename(args.input)} (resolver {args.resolver})\n")
+        f.write(f"# Total: {len(dead)}\n\n")
+        f.writelines(domain + '\n' for domain in dead)
+    os.replace(tmp_path, args.output)
+
+    qps = client.sent / elapsed if elapsed > 0 else 0
+    ratio = len(dead) / len(domains) if domains else 0
+    print(f"\n✓ Resolved {stats.checked} domains in {elapsed:.1f}s "
+          f"({client.sent} queries, {qps:,.0f} queries/s)")
+    print(f"  alive {stats.alive}, NXDOMAIN {stats.dead}, from cache {stats.cached}, "
+          f"timed out {stats.timeouts}, failed {stats.failed}"
+          + (f" ({', '.join(f'{k} {v}' for k, v in sorted(stats.rcodes.items()))})" if stats.rcodes else ""))
+    print(f"✓ Prune candidates: {len(dead)} of {len(domains)} domains ({ratio:.1%})")
+    print(f"✓ Written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,345 @@
+#!/usr/bin/env python3
+"""
+query_log_analyzer.py
+
+Rank blocklist entries by how often they are actually queried, using Pi-hole
+query logs, and list the entries nobody has queried in N days.
+
+Usage:
+  python query_log_analyzer.py -b blocklist.bin --log /var/log/pihole/pihole.log [--log pihole.log.1 ...]
+  python query_log_analyzer.py -b blocklist.bin --ftl-db /etc/pihole/pihole-FTL.db --days 30 \
+                               --hits-out hits.tsv --prune-out never_hit.txt
+  python clean_blocklist.py -i youtube-blocklist.txt --prune never_hit.txt
+
+Inputs:
+  --log     pihole.log text logs (dnsmasq format, `query[A] name from client`
+            lines; rotated .gz files are read directly)
+  --ftl-db  the `queries` table of pihole-FTL.db, aggregated per domain by
+            SQLite itself (opened read-only)
+
+The blocklist is the compiled hash index written by `merge_blocklists.py
+--compile` (a plain list is compiled to a temporary file first), so every
+lookup is a few probes into a memory-mapped table and the per-source
+provenance of each entry comes for free. Logs are streamed line by line and
+only the entries that were hit are counted, so memory depends on the number
+of distinct entries hit, not on the log size; lookups of repeated names are
+memoized (up to MEMO_LIMIT names).
+
+Entries match exactly, as in Pi-hole's gravity; with --subdomains a query
+also counts for its nearest listed parent (as in dns/sinkhole.py). The prune
+list is only written when the logs cover the whole --days window (or with
+--force), since a shorter log cannot show that an entry never fires.
+"""
+
+from datetime import datetime, timedelta, timezone
+import argparse
+import gzip
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+from compiled_blocklist import MAGIC, CompiledBlocklist, compile_blocklist
+from merge_blocklists import BLOCKLISTS
+from snapshots import DEFAULT_SNAPSHOT_DIR, SnapshotStore
+
+MEMO_LIMIT = 1 << 20
+PROGRESS_EVERY = 5000000
+# Bytes of log lines handled per batch
+READ_BLOCK = 1 << 22
+QUERY_MARKER = ': query['
+TOP_N = 20
+
+
+class HitCounter:
+    """Hits and last-hit time per blocklist entry"""
+
+    def __init__(self, blocklist, subdomains=False, since=0):
+        self.blocklist = blocklist
+        self.subdomains = subdomains
+        self.since = since
+        self.hits = {}      # entry -> [count, last timestamp]
+        self._memo = {}
+        self.queries = 0
+        self.matched = 0
+        self.outside_window = 0
+        self.first_seen = None
+        self.last_seen = None
+
+    def _lookup(self, domain):
+        if self.subdomains:
+            match = self.blocklist.match(domain)
+            entry = match and match[0]
+        else:
+            entry = domain if self.blocklist.lookup(domain) else None
+        if len(self._memo) >= MEMO_LIMIT:
+            self._memo.clear()
+        self._memo[domain] = entry
+        return entry
+
+    def cover(self, first, last):
+        """Widen the time range the logs are known to cover"""
+        if self.first_seen is None or first < self.first_seen:
+            self.first_seen = first
+        if self.last_seen is None or last > self.last_seen:
+            self.last_seen = last
+
+    def add(self, domain, timestamp, count=1):
+        """Count `count` queries of `domain`, the last one at `timestamp` (within the covered range)"""
+        if timestamp < self.since:
+            self.outside_window += count
+            return
+        self.queries += count
+        entry = self._memo.get(domain, False)
+        if entry is False:
+            entry = self._lookup(domain)
+        if entry is None:
+            return
+        self.matched += count
+        hit = self.hits.get(entry)
+        if hit is None:
+            self.hits[entry] = [count, timestamp]
+        else:
+            hit[0] += count
+            if timestamp > hit[1]:
+                hit[1] = timestamp
+
+
+MONTHS = {name: i for i, name in enumerate(
+    ('Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec'), 1)}
+
+
+class SyslogClock:
+    """Epoch seconds of a `Mon DD HH:MM:SS` (year inferred) or ISO line timestamp.
+
+    strptime would dominate the run time, so only the start of each hour is
+    converted (local time, as logged) and minutes and seconds are added.
+    """
+
+    def __init__(self, now=None):
+        self.now = datetime.fromtimestamp(now or time.time())
+        self._hours = {}
+        self._value = 0.0
+
+    def _hour_start(self, key, iso):
+        try:
+            if iso:
+                stamp = datetime(int(key[:4]), int(key[5:7]), int(key[8:10]), int(key[11:13]))
+            else:
+                stamp = datetime(self.now.year, MONTHS[key[:3]], int(key[4:6]), int(key[7:9]))
+                if stamp > self.now + timedelta(days=1):
+                    stamp = stamp.replace(year=stamp.year - 1)
+        except (KeyError, ValueError):
+            return None
+        if len(self._hours) > 100000:
+            self._hours.clear()
+        self._hours[key] = value = stamp.timestamp()
+        return value
+
+    def __call__(self, line):
+        iso = line[4:5] == '-'
+        key = line[:13] if iso else line[:9]
+        hour = self._hours.get(key)
+        if hour is None:
+            hour = self._hour_start(key, iso)
+        try:
+            minutes = line[14:16] if iso else line[10:12]
+            seconds = line[17:19] if iso else line[13:15]
+            if hour is not None:
+                self._value = hour + int(minutes) * 60 + int(seconds)
+        except ValueError:
+            pass  # not a timestamp: keep the previous line's time
+        return self._value
+
+
+def open_log(path):
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8', errors='replace')
+    return open(path, 'r', encoding='utf-8', errors='replace')
+
+
+def read_pihole_log(path, counter, clock):
+    """Count the `query[TYPE] name from client` lines of a pihole.log; return lines read"""
+    lines = 0
+    reported = 0
+    stamps = {}  # timestamp prefix -> epoch seconds, for the lines of the current second
+    add = counter.add
+    with open_log(path) as f:
+        for block in iter(lambda: f.readlines(READ_BLOCK), []):
+            lines += len(block)
+            for line in block:
+                _, marker, rest = line.partition(QUERY_MARKER)
+                if not marker:
+                    continue
+                fields = rest.split(' ', 2)
+                if len(fields) < 2 or not fields[1].strip():
+                    continue
+                stamp = line[:19]
+                timestamp = stamps.get(stamp)
+                if timestamp is None:
+                    if len(stamps) > 1024:
+                        stamps.clear()
+                    timestamp = stamps[stamp] = clock(line)
+                    counter.cover(timestamp, timestamp)
+                add(fields[1].strip().lower(), timestamp)
+            if lines - reported >= PROGRESS_EVERY:
+                reported = lines
+                print(f"  ... {lines} lines, {counter.matched} blocklist hits")
+    return lines
+
+
+def read_ftl_db(path, counter):
+    """Count the queries table of pihole-FTL.db, aggregated per domain by SQLite; return rows read"""
+    db = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        first, last, total = db.execute("SELECT MIN(timestamp), MAX(timestamp), COUNT(*) FROM queries").fetchone()
+        if not total:
+            return 0
+        counter.cover(first, last)
+        counter.outside_window += db.execute("SELECT COUNT(*) FROM queries WHERE timestamp < ?",
+                                             (counter.since,)).fetchone()[0]
+        cursor = db.execute("SELECT domain, COUNT(*), MAX(timestamp) FROM queries "
+                            "WHERE timestamp >= ? AND domain IS NOT NULL GROUP BY domain", (counter.since,))
+        for domain, count, latest in cursor:
+            counter.add(domain.lower(), latest, count)
+        return total
+    finally:
+        db.close()
+
+
+def open_blocklist(path, snapshot_dir):
+    """Open a compiled blocklist, compiling a plain one to a temporary file first"""
+    with open(path, 'rb') as f:
+        compiled = f.read(len(MAGIC)) == MAGIC
+    if compiled:
+        return CompiledBlocklist(path)
+    fd, tmp_path = tempfile.mkstemp(suffix='.bin')
+    os.close(fd)
+    try:
+        print(f"Compiling {path} (use merge_blocklists.py --compile to skip this step)...")
+        compile_blocklist(path, tmp_path, SnapshotStore(snapshot_dir), [name for name, _ in BLOCKLISTS])
+        # The mapping stays valid after the file is unlinked
+        return CompiledBlocklist(tmp_path)
+    finally:
+        os.remove(tmp_path)
+
+
+def write_hits(path, counter):
+    """Tab-separated entry, hits, last hit (UTC) and sources, most hit first"""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write("# domain\thits\tlast_hit_utc\tsources\n")
+        for entry, (count, last) in sorted(counter.hits.items(), key=lambda item: (-item[1][0], item[0])):
+            sources = counter.blocklist.sources_of(counter.blocklist.lookup(entry))
+            stamp = datetime.fromtimestamp(last, timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+            f.write(f"{entry}\t{count}\t{stamp}\t{','.join(sources)}\n")
+    os.replace(tmp_path, path)
+
+
+def write_prune_list(path, counter, days):
+    """Entries without a hit in the window, in blocklist order; return how many"""
+    tmp_path = path + '.tmp'
+    count = 0
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(f"# Blocklist entries not queried in the last {days:g} days\n")
+        f.write(f"# Generated by query_log_analyzer.py; remove with clean_blocklist.py --prune {os.path.basename(path)}\n\n")
+        for entry in counter.blocklist:
+            if entry not in counter.hits:
+                f.write(entry + '\n')
+                count += 1
+    os.replace(tmp_path, path)
+    return count
+
+
+def report_sources(counter):
+    """Print hits and distinct entries hit per upstream source"""
+    blocklist = counter.blocklist
+    hits = [0] * len(blocklist.sources)
+    entries = [0] * len(blocklist.sources)
+    for entry, (count, _) in counter.hits.items():
+        mask = blocklist.lookup(entry)
+        for i in range(len(blocklist.sources)):
+            if mask & (1 << i):
+                hits[i] += count
+                entries[i] += 1
+    print("\nHits per source:")
+    for i, name in sorted(enumerate(blocklist.sources), key=lambda item: -hits[item[0]]):
+        print(f"  {name:<24} {hits[i]:>12} queries  {entries[i]:>9} entries hit")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rank blocklist entries by real hits in Pi-hole query logs")
+    parser.add_argument("-b", "--blocklist", default="blocklist.bin",
+                        help="Compiled blocklist (or the plain merged list, compiled on the fly)")
+    parser.add_argument("--log", action="append", default=[], help="pihole.log file (repeatable, .gz ok)")
+    parser.add_argument("--ftl-db", action="append", default=[], help="pihole-FTL.db file (repeatable)")
+    parser.add_argument("--days", type=float, default=30, help="Only count queries from the last N days")
+    parser.add_argument("--subdomains", action="store_true",
+                        help="Credit a query to its nearest listed parent domain, not only exact entries")
+    parser.add_argument("--top", type=int, default=TOP_N, help="How many top entries to print")
+    parser.add_argument("--hits-out", default=None, help="Write per-entry hits as TSV to this file")
+    parser.add_argument("--prune-out", default=None, help="Write entries never hit in the window to this file")
+    parser.add_argument("--force", action="store_true",
+                        help="Write --prune-out even if the logs cover less than --days")
+    parser.add_argument("--snapshot-dir", default=DEFAULT_SNAPSHOT_DIR,
+                        help="Per-source snapshots, used when compiling a plain blocklist")
+    args = parser.parse_args()
+    if not args.log and not args.ftl_db:
+        parser.error("give at least one --log or --ftl-db")
+
+    try:
+        blocklist = open_blocklist(args.blocklist, args.snapshot_dir)
+    except (OSError, ValueError) as e:
+        print(f"Cannot open blocklist: {e}", file=sys.stderr)
+        sys.exit(2)
+
+    now = time.time()
+    since = now - args.days * 86400
+    counter = HitCounter(blocklist, args.subdomains, since)
+    clock = SyslogClock(now)
+    start = time.perf_counter()
+    read = 0
+    try:
+        for path in args.log:
+            print(f"Reading {path}...")
+            read += read_pihole_log(path, counter, clock)
+        for path in args.ftl_db:
+            print(f"Reading {path}...")
+            read += read_ftl_db(path, counter)
+    except (OSError, sqlite3.Error) as e:
+        print(f"Cannot read query log: {e}", file=sys.stderr)
+        sys.exit(2)
+    elapsed = time.perf_counter() - start
+
+    rate = f" ({read / elapsed:,.0f}/s)" if elapsed > 0 else ""
+    print(f"\n✓ Read {read} log lines / queries in {elapsed:.1f}s{rate}")
+    print(f"✓ {counter.queries} queries in the last {args.days:g} days "
+          f"({counter.outside_window} older ones skipped), {counter.matched} hit the blocklist")
+    share = len(counter.hits) / len(blocklist) if len(blocklist) else 0
+    print(f"✓ {len(counter.hits)} of {len(blocklist)} entries were hit ({share:.2%})")
+
+    if counter.hits:
+        print(f"\nTop {args.top} entries:")
+        ranked = sorted(counter.hits.items(), key=lambda item: (-item[1][0], item[0]))[:args.top]
+        for entry, (count, _) in ranked:
+            print(f"  {count:>10}  {entry}")
+        report_sources(counter)
+
+    if args.hits_out:
+        write_hits(args.hits_out, counter)
+        print(f"\n✓ Hits written to {args.hits_out}")
+    if args.prune_out:
+        covered = counter.first_seen is not None and counter.first_seen <= since
+        if not covered and not args.force:
+            first = datetime.fromtimestamp(counter.first_seen).isoformat() if counter.first_seen else "none"
+            print(f"\n✗ Not writing {args.prune_out}: the logs start at {first}, "
+                  f"less than {args.days:g} days ago (use --force to write it anyway)")
+        else:
+            pruned = write_prune_list(args.prune_out, counter, args.days)
+            print(f"\n✓ {pruned} entries never hit in {args.days:g} days written to {args.prune_out}")
+    blocklist.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+"""
+regex_rules.py
+
+Evaluate pihole-regex style rule lists against a set of domains and report
+which domains each rule matches.
+
+Usage:
+  python regex_rules.py -r regex.list [-r more.list] -i youtube-blocklist.txt [--matches-out matches.tsv]
+
+  from regex_rules import load_rules
+
+  rules = load_rules(['regex.list'])
+  for pattern, domains in rules.match_all(domains).items():
+      ...
+
+Rules are POSIX extended regexes searched case-insensitively in each name, as
+in Pi-hole. Of the options after `;`, `reply=` does not change what a rule
+matches, while `querytype=` and `invert` make a rule depend on the query, not
+only the name, so such rules are skipped. Duplicate rules are dropped, and
+rules Python's `re` cannot compile are counted and skipped.
+
+All rules are compiled into one RuleSet:
+  - the literal text each rule requires (multi_pattern.required_literals)
+    goes into one automaton, whose trie regex rejects most names in a single
+    C-level search; a rule then only runs on names containing its literal
+  - rules without a usable literal are joined into one combined alternation
+    that answers "does any of them match?" per name; only on a hit are they
+    run one by one to find which
+  - the few rules that cannot share an alternation (backreferences, named
+    groups, global inline flags) run on their own
+
+`match_all` walks the domain set once with all of that. The compiled RuleSet
+is pickled under .regex-cache/, keyed by a hash of the rules, so an unchanged
+list is not analysed again on the next run.
+"""
+
+from collections import Counter
+import argparse
+import hashlib
+import os
+import pickle
+import re
+import sys
+import time
+
+from feed_parser import detect_format, iter_lines, parse_feed, take_sample
+from multi_pattern import Automaton, required_literals
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.regex-cache')
+# Bump when RuleSet changes so stale pickles are rebuilt
+ENGINE_VERSION = 2
+# Shorter required literals occur in too many names to be worth a prefilter
+MIN_LITERAL = 3
+PER_QUERY_OPTIONS = {'querytype', 'invert'}
+TOP_N = 20
+
+POSIX_CLASSES = {
+    '[:alnum:]': 'a-zA-Z0-9', '[:alpha:]': 'a-zA-Z', '[:digit:]': '0-9', '[:lower:]': 'a-z',
+    '[:upper:]': 'A-Z', '[:xdigit:]': '0-9A-Fa-f', '[:space:]': ' \\t\\n\\r\\f\\v', '[:blank:]': ' \\t',
+}
+POSIX_CLASS_RE = re.compile('|'.join(re.escape(name) for name in POSIX_CLASSES))
+# Rules that change meaning or fail to compile inside a shared alternation
+UNCOMBINABLE_RE = re.compile(r"\\[1-9]|\(\?P[<=]|\(\?\(|^\(\?[a-zA-Z]")
+
+
+def translate(pattern):
+    """POSIX ERE -> Python re source (bracket classes like [[:digit:]])"""
+    return POSIX_CLASS_RE.sub(lambda m: POSIX_CLASSES[m.group()], pattern)
+
+
+def parse_rules(lines, stats=None):
+    """Yield the rule patterns of a pihole-regex list; skipped lines are counted in `stats`"""
+    stats = Counter() if stats is None else stats
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        pattern, _, options = line.partition(';')
+        names = {option.split('=', 1)[0].strip().lower() for option in options.split(';') if option.strip()}
+        if names & PER_QUERY_OPTIONS:
+            stats['per-query'] += 1
+            continue
+        yield pattern.strip()
+
+
+def is_regex_list(path):
+    """True if the feed at `path` looks like a pihole-regex list"""
+    with open(path, 'rb') as f:
+        return detect_format(take_sample(iter_lines(f))) == 'regex'
+
+
+class RuleSet:
+    """Regex rules compiled for one pass over a domain set"""
+
+    def __init__(self, patterns):
+        self.patterns = []
+        self.invalid = 0
+        self._searches = []
+        for pattern in dict.fromkeys(patterns):
+            try:
+                self._searches.append(re.compile(translate(pattern), re.I).search)
+            except re.error:
+                self.invalid += 1
+                continue
+            self.patterns.append(pattern)
+
+        literals = []
+        self._unfiltered = []
+        self._alone = []
+        for index, pattern in enumerate(self.patterns):
+            required = required_literals(translate(pattern))
+            if required and min(map(len, required)) >= MIN_LITERAL:
+                literals.extend((literal.lower(), index) for literal in required)
+            elif UNCOMBINABLE_RE.search(pattern):
+                self._alone.append(index)
+            else:
+                self._unfiltered.append(index)
+        # values_in first runs the automaton's trie regex, which rejects most names in C
+        self._literals = Automaton(literals)
+        self._combined = (re.compile('|'.join(f'(?:{translate(self.patterns[i])})' for i in self._unfiltered),
+                                     re.I)
+                          if self._unfiltered else None)
+
+    def __getstate__(self):
+        # Rule regexes are compiled again on first use: unpickling a pattern
+        # recompiles it, and most rules never get past the prefilter
+        return dict(self.__dict__, _searches=[None] * len(self.patterns))
+
+    def _search(self, index):
+        search = self._searches[index]
+        if search is None:
+            search = self._searches[index] = re.compile(translate(self.patterns[index]), re.I).search
+        return search
+
+    def __len__(self):
+        return len(self.patterns)
+
+    def summary(self):
+        return (f"{len(self.patterns) - len(self._unfiltered) - len(self._alone)} behind a literal prefilter "
+                f"({len(self._literals)} literals), {len(self._unfiltered)} in one combined alternation, "
+                f"{len(self._alone)} run alone")
+
+    def match_all(self, domains):
+        """{pattern: [domains it matches, in input order]} for every rule that matches at least one"""
+        found = [[] for _ in self.patterns]
+        rule = self._search
+        values_in = self._literals.values_in
+        combined = self._combined.search if self._combined else None
+        unfiltered = [(index, rule(index)) for index in self._unfiltered]
+        alone = [(index, rule(index)) for index in self._alone]
+        for domain in domains:
+            for index in values_in(domain):
+                if rule(index)(domain):
+                    found[index].append(domain)
+            if combined is not None and combined(domain):
+                for index, search in unfiltered:
+                    if search(domain):
+                        found[index].append(domain)
+            for index, search in alone:
+                if search(domain):
+                    found[index].append(domain)
+        return {self.patterns[index]: hits for index, hits in enumerate(found) if hits}
+
+
+def load_rules(paths, cache_dir=DEFAULT_CACHE_DIR, stats=None):
+    """Read rule lists into one RuleSet, reusing a pickled copy of the same rules if there is one"""
+    stats = Counter() if stats is None else stats
+    patterns = []
+    for path in paths:
+        with open(path, 'rb') as f:
+            patterns.extend(parse_rules(iter_lines(f), stats))
+    unique = list(dict.fromkeys(patterns))
+    stats['duplicate'] += len(patterns) - len(unique)
+    rules = None
+    if cache_dir:
+        key = hashlib.sha1('\n'.join([str(ENGINE_VERSION)] + unique).encode('utf-8')).hexdigest()
+        path = os.path.join(cache_dir, key + '.pickle')
+        try:
+            with open(path, 'rb') as f:
+                rules = pickle.load(f)
+            stats['cached'] = 1
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+            pass
+    if rules is None:
+        rules = RuleSet(unique)
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+            tmp_path = path + '.tmp'
+            with open(tmp_path, 'wb') as f:
+                pickle.dump(rules, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+    stats['invalid'] += rules.invalid
+    return rules
+
+
+def write_matches(path, matches):
+    """Tab-separated rule and matching domain, one row per match, rules with most matches first"""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write("# rule\tdomain\n")
+        for pattern, domains in sorted(matches.items(), key=lambda item: (-len(item[1]), item[0])):
+            f.writelines(f"{pattern}\t{domain}\n" for domain in domains)
+    os.replace(tmp_path, path)
+
+
+def report_matches(rules, matches, total, top=TOP_N):
+    """Print how much of the domain set the rules cover and the rules matching most"""
+    matched = len(set().union(*matches.values())) if matches else 0
+    share = matched / total if total else 0
+    print(f"✓ {len(matches)} of {len(rules)} rules match; {matched} of {total} domains matched ({share:.2%})")
+    if matches:
+        print(f"\nTop {top} rules:")
+        for pattern, domains in sorted(matches.items(), key=lambda item: (-len(item[1]), item[0]))[:top]:
+            print(f"  {len(domains):>10}  {pattern}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Report which blocklist domains each regex rule matches")
+    parser.add_argument("-r", "--rules", action="append", required=True,
+                        help="pihole-regex rule list (repeatable)")
+    parser.add_argument("-i", "--input", default="youtube-blocklist.txt", help="Domains to evaluate the rules on")
+    parser.add_argument("--matches-out", default=None, help="Write rule/domain pairs as TSV to this file")
+    parser.add_argument("--top", type=int, default=TOP_N, help="How many top rules to print")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR, help="Compiled rule cache ('' to disable)")
+    args = parser.parse_args()
+
+    stats = Counter()
+    try:
+        start = time.perf_counter()
+        rules = load_rules(args.rules, args.cache_dir, stats)
+        loaded = time.perf_counter() - start
+        with open(args.input, 'rb') as f:
+            domains = list(dict.fromkeys(parse_feed(iter_lines(f))))
+    except OSError as e:
+        print(f"Cannot read input: {e}", file=sys.stderr)
+        sys.exit(2)
+    print(f"✓ {len(rules)} rules ({'from cache' if stats['cached'] else 'compiled'} in {loaded:.2f}s): "
+          f"{rules.summary()}")
+    skipped = ', '.join(f"{stats[kind]} {kind}" for kind in ('duplicate', 'per-query', 'invalid') if stats[kind])
+    if skipped:
+        print(f"  skipped {skipped}")
+
+    start = time.perf_counter()
+    matches = rules.match_all(domains)
+    elapsed = time.perf_counter() - start
+    rate = f" ({len(domains) / elapsed:,.0f} domains/s)" if elapsed > 0 else ""
+    print(f"✓ Evaluated {len(domains)} domains in {elapsed:.2f}s{rate}")
+    report_matches(rules, matches, len(domains), args.top)
+
+    if args.matches_out:
+        write_matches(args.matches_out, matches)
+        print(f"\n✓ Matches written to {args.matches_out}")
+
+
+if __name__ == "__main__":
+    main()
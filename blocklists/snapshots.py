@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+snapshots.py
+
+Per-source snapshots of upstream feeds for incremental merges.
+
+After each run the domain set of every source is saved as a sorted text file
+(one domain per line). On the next run the new set is sorted and walked
+against the old snapshot in a single merge pass, which yields the domains
+added to and removed from that source and writes the new snapshot at the
+same time. The merged output can then be updated from those deltas instead
+of being rebuilt from scratch.
+
+Usage:
+  from snapshots import SnapshotStore
+
+  snapshots = SnapshotStore()
+  added, removed = snapshots.update("Steven Black", domains)
+"""
+
+import os
+import re
+
+DEFAULT_SNAPSHOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.snapshots')
+
+
+def slugify(name):
+    return re.sub(r"[^a-z0-9_-]+", "-", name.lower()).strip("-") or "source"
+
+
+class SnapshotStore:
+    """Directory of sorted per-source domain snapshots"""
+
+    def __init__(self, directory=DEFAULT_SNAPSHOT_DIR):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, name):
+        return os.path.join(self.directory, slugify(name) + '.txt')
+
+    def exists(self, name):
+        return os.path.exists(self.path(name))
+
+    def iter_domains(self, name):
+        """Yield the domains of a source's snapshot in sorted order"""
+        if not self.exists(name):
+            return
+        with open(self.path(name), 'r', encoding='utf-8') as f:
+            for line in f:
+                domain = line.rstrip('\n')
+                if domain:
+                    yield domain
+
+    def write(self, name, sorted_domains):
+        """Replace the snapshot of `name` with already sorted, unique domains, without computing deltas"""
+        path = self.path(name)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for domain in sorted_domains:
+                f.write(domain + '\n')
+        os.replace(tmp_path, path)
+
+    def update(self, name, domains):
+        """Replace the snapshot of `name` with `domains`; return (added, removed) lists"""
+        added = []
+        removed = []
+        old = self.iter_domains(name)
+        current = next(old, None)
+        path = self.path(name)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for domain in sorted(domains):
+                while current is not None and current < domain:
+                    removed.append(current)
+                    current = next(old, None)
+                if current == domain:
+                    current = next(old, None)
+                else:
+                    added.append(domain)
+                f.write(domain + '\n')
+            while current is not None:
+                removed.append(current)
+                current = next(old, None)
+        os.replace(tmp_path, path)
+        return added, removed
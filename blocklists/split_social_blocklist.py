@@ -10,6 +10,12 @@ Usage:
 The script extracts domain-like tokens from the input file and writes one file per pattern
 (e.g. `social-blocks/youtube.txt`) containing matched domains (one per line). An
 `other.txt` file is created for unmatched domains.
+
+With --stream the input is read line by line and every domain goes straight to
+its platform's file, so memory does not grow with the input size. Domains are
+written in input order instead of sorted, and duplicates are kept unless
+--dedup is given (which remembers 8 bytes per distinct domain, see
+hash_store.py). The set of domains per file is the same as without --stream.
 """
 
 from pathlib import Path
@@ -17,6 +23,10 @@ import argparse
 import re
 import sys
 
+from hash_store import HashStore
+from instrumentation import METRICS, add_arguments as add_metrics_arguments
+from multi_pattern import Automaton
+
 DOMAIN_RE = re.compile(r"(?:(?:[a-z0-9](?:[a-z0-9-]{0,61}[a-z0-9])?)\.)+[a-z]{2,}", re.I)
 
 
@@ -38,23 +48,104 @@ def platform_name_from_pattern(pat: str) -> str:
 
 
 def split_domains(domains, patterns):
-    result = {name: set() for name in patterns.keys()}
+    """Assign each domain to the first platform with a pattern occurring in it.
+
+    Exact and subdomain matches are substring matches too, so one automaton
+    over all patterns replaces the per-pattern checks.
+    """
+    names = list(patterns)
+    automaton = Automaton((pat, rank) for rank, name in enumerate(names) for pat in patterns[name])
+    result = {name: set() for name in names}
     others = set()
     for d in domains:
-        matched = False
-        for name, pats in patterns.items():
-            for pat in pats:
-                if d == pat or d.endswith("." + pat) or pat in d:
-                    result[name].add(d)
-                    matched = True
-                    break
-            if matched:
-                break
-        if not matched:
+        ranks = automaton.values_in(d)
+        if ranks:
+            result[names[min(ranks)]].add(d)
+        else:
             others.add(d)
     return result, others
 
 
+# Characters that can be part of a domain token. With re.I the class also
+# matches a few non-ASCII letters that fold to ASCII ones (e.g. the Kelvin
+# sign), which _TOKEN_FOLD maps back so tokens compare like the regex did.
+TOKEN_RE = re.compile(r"[A-Za-z0-9-_.]+", re.I)
+_TOKEN_FOLD = str.maketrans({'\u0130': 'i', '\u0131': 'i', '\u017f': 's', '\u212a': 'k'})
+
+
+def fold_token(token):
+    return token.lower() if token.isascii() else token.translate(_TOKEN_FOLD).lower()
+
+
+def line_tokens(line):
+    return map(fold_token, TOKEN_RE.findall(line))
+
+
+def line_contains_matched(line, matched_all):
+    """True if a domain of `matched_all` is a whole token of `line`.
+
+    `matched_all` must hold folded domains (see fold_token); plain lowercase
+    ASCII domains already are.
+    """
+    return any(token in matched_all for token in line_tokens(line))
+
+
+def stream_split(inp, patterns, out_dir, main_out=None, dedup=False, hosts_format=False):
+    """Split `inp` line by line; return ({platform: count}, other count, removed lines).
+
+    A line is dropped from `main_out` when one of its tokens is a matched
+    domain. Tokens are maximal runs of domain characters, so a matched token
+    is always also a domain extracted from that same line: checking the
+    line's own matches gives the same result as checking every match of the
+    file.
+    """
+    names = list(patterns)
+    automaton = Automaton((pat, rank) for rank, name in enumerate(names) for pat in patterns[name])
+    seen = HashStore() if dedup else None
+    counts = {name: 0 for name in names + ["other"]}
+    prefix = "0.0.0.0 " if hosts_format else ""
+    writers = {name: open(out_dir / f"{name}.txt", "w", encoding="utf-8") for name in counts}
+    main_tmp = main_file = None
+    if main_out:
+        main_tmp = main_out.with_name(main_out.name + ".tmp")
+        main_file = open(main_tmp, "w", encoding="utf-8")
+    removed = 0
+    try:
+        with open(inp, "r", encoding="utf-8", errors="replace", newline="") as f:
+            for raw in f:
+                # splitlines() also breaks on \f, \x1c, U+2028 etc., like the in-memory mode
+                for line in raw.splitlines() or [""]:
+                    line_matched = set()
+                    for d in DOMAIN_RE.findall(line):
+                        d = d.lower()
+                        ranks = automaton.values_in(d)
+                        if ranks:
+                            line_matched.add(fold_token(d))
+                        if seen is not None and not seen.add(d):
+                            continue
+                        name = names[min(ranks)] if ranks else "other"
+                        writers[name].write(prefix + d + "\n")
+                        counts[name] += 1
+                    if main_file is not None:
+                        if line_matched and line_contains_matched(line, line_matched):
+                            removed += 1
+                        else:
+                            main_file.write(line + "\n")
+    except BaseException:
+        if main_tmp is not None:
+            main_file.close()
+            main_tmp.unlink()
+        raise
+    finally:
+        for w in writers.values():
+            w.close()
+    if main_file is not None:
+        main_file.close()
+        main_tmp.replace(main_out)
+    others = counts.pop("other")
+    return counts, others, removed
+
+
 def main():
     parser = argparse.ArgumentParser(description="Split a blocklist into per-social-media files")
     parser.add_argument("-i", "--input", default="blocker.txt", help="Input blocklist file")
@@ -67,19 +158,21 @@ def main():
                         help="Overwrite the input file with social domains removed (unsafe).")
     parser.add_argument("--hosts-format", action="store_true",
                         help="Emit hosts-style lines (e.g. '0.0.0.0 domain') instead of plain domains")
+    parser.add_argument("--stream", action="store_true",
+                        help="Process the input line by line in constant memory (output in input order)")
+    parser.add_argument("--dedup", action="store_true",
+                        help="With --stream, write each domain only once")
+    add_metrics_arguments(parser, 'split_social_blocklist')
     args = parser.parse_args()
+    if args.dedup and not args.stream:
+        parser.error("--dedup only applies to --stream (the in-memory mode always deduplicates)")
+    METRICS.start_from_args(args)
 
     inp = Path(args.input)
     if not inp.exists():
         print(f"Input file not found: {inp}", file=sys.stderr)
         sys.exit(2)
 
-    text = inp.read_text(encoding="utf-8", errors="replace")
-    domains = extract_domains(text)
-    if not domains:
-        print("No domains found in input file.")
-        sys.exit(0)
-
     raw_patterns = [normalize_pattern(x) for x in args.patterns.split(",") if x.strip()] if args.patterns else []
 
     if not raw_patterns:
@@ -94,7 +187,30 @@ def main():
     out_dir = Path(args.out)
     out_dir.mkdir(parents=True, exist_ok=True)
 
-    matched, others = split_domains(domains, patterns)
+    if args.stream:
+        target = Path(args.main_out) if args.main_out else inp if args.inplace else None
+        with METRICS.span('stream_split') as span:
+            counts, others, removed = stream_split(inp, patterns, out_dir, target, args.dedup, args.hosts_format)
+            span.count(bytes_in=inp.stat().st_size, domains_out=sum(counts.values()) + others)
+        for name, count in counts.items():
+            print(f"Wrote {count} domains to {out_dir / f'{name}.txt'}")
+        print(f"Wrote {others} domains to {out_dir / 'other.txt'}")
+        if target:
+            print(f"Wrote filtered main file to {target} (removed {removed} lines)")
+        print(f"Processed {sum(counts.values()) + others} domains in total.")
+        return
+
+    with METRICS.span('read') as span:
+        text = inp.read_text(encoding="utf-8", errors="replace")
+        domains = extract_domains(text)
+        span.count(bytes_in=inp.stat().st_size, domains_out=len(domains))
+    if not domains:
+        print("No domains found in input file.")
+        sys.exit(0)
+
+    with METRICS.span('split') as span:
+        matched, others = split_domains(domains, patterns)
+        span.count(domains_in=len(domains), domains_out=sum(len(ds) for ds in matched.values()))
 
     def write_lines(path, lines):
         lines = sorted(lines)
@@ -104,30 +220,28 @@ def main():
             content = "\n".join(lines) + ("\n" if lines else "")
         path.write_text(content, encoding="utf-8")
 
-    for name, ds in matched.items():
-        out_path = out_dir / f"{name}.txt"
-        write_lines(out_path, ds)
-        print(f"Wrote {len(ds)} domains to {out_path}")
+    with METRICS.span('write') as span:
+        for name, ds in matched.items():
+            out_path = out_dir / f"{name}.txt"
+            write_lines(out_path, ds)
+            print(f"Wrote {len(ds)} domains to {out_path}")
 
-    other_path = out_dir / "other.txt"
-    write_lines(other_path, others)
+        other_path = out_dir / "other.txt"
+        write_lines(other_path, others)
+        span.count(domains_out=len(domains))
     print(f"Wrote {len(others)} domains to {other_path}")
 
     # Optionally write a filtered main blocker file without social domains
-    matched_all = set().union(*matched.values())
+    matched_all = {fold_token(d) for ds in matched.values() for d in ds}
     if args.main_out or args.inplace:
         # Filter original file lines by skipping lines that contain a matched domain as a whole token
-        def line_contains_matched(line):
-            for d in matched_all:
-                # match whole domain token using word boundaries / non-word separators
-                if re.search(r"(^|[^A-Za-z0-9-_.])" + re.escape(d) + r"($|[^A-Za-z0-9-_.])", line, re.I):
-                    return True
-            return False
-
-        filtered_lines = [ln for ln in text.splitlines() if not line_contains_matched(ln)]
-        target = Path(args.main_out) if args.main_out else inp
-        target.write_text("\n".join(filtered_lines) + ("\n" if filtered_lines else ""), encoding="utf-8")
-        print(f"Wrote filtered main file to {target} (removed {sum(1 for ln in text.splitlines() if line_contains_matched(ln))} lines)")
+        with METRICS.span('filter_main') as span:
+            lines = text.splitlines()
+            filtered_lines = [ln for ln in lines if not line_contains_matched(ln, matched_all)]
+            target = Path(args.main_out) if args.main_out else inp
+            target.write_text("\n".join(filtered_lines) + ("\n" if filtered_lines else ""), encoding="utf-8")
+            span.count(domains_in=len(lines), domains_out=len(filtered_lines))
+        print(f"Wrote filtered main file to {target} (removed {len(lines) - len(filtered_lines)} lines)")
 
     # summary
     total = sum(len(s) for s in matched.values()) + len(others)
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+synthetic_corpus.py
+
+Reproducible synthetic blocklist feeds for benchmarks.
+
+Domains follow roughly the shape of real blocklists: most names have 2-4
+labels, label lengths cluster around 5-10 characters with a tail of long
+hash-like tracking labels, `.com` dominates the TLDs, and many entries are
+subdomains of a smaller set of registrable domains picked with a Zipf-like
+skew. A small share sits under social platforms and whitelisted domains, so
+the split and whitelist stages have something to match.
+
+Usage:
+  python synthetic_corpus.py -n 1000000 -f hosts -o feed.txt
+
+  from synthetic_corpus import generate_domains, write_feed
+"""
+
+import argparse
+import random
+import string
+
+FEED_FORMATS = ('hosts', 'adblock', 'plain')
+
+TLDS = (['com'] * 50 + ['net'] * 10 + ['org'] * 6 + ['io'] * 4 + ['info'] * 4 + ['ru'] * 4
+        + ['de'] * 3 + ['xyz'] * 3 + ['co.uk'] * 2 + ['top'] * 2 + ['cn'] * 2 + ['br'] * 2
+        + ['online', 'site', 'club', 'biz', 'tk', 'ml', 'ga', 'cf', 'in', 'jp'])
+
+LABEL_LENGTHS = [2, 3, 4, 5, 5, 6, 6, 6, 7, 7, 7, 8, 8, 8, 9, 9, 10, 11, 12, 14, 16, 20]
+SUBDOMAIN_WORDS = ['www', 'ads', 'ad', 'track', 'tracker', 'metrics', 'stats', 'cdn', 'static',
+                   'api', 'pixel', 'log', 'analytics', 'img', 'm', 'mobile', 'click', 'srv']
+
+# Registrable domains mixed into the corpus so split/whitelist stages match something
+SOCIAL_BASES = ['youtube.com', 'tiktok.com', 'facebook.com', 'instagram.com', 'x.com',
+                'twitter.com', 'reddit.com']
+WHITELIST_BASES = ['paypal.com', 'google.com', 'microsoft.com', 'amazon.com', 'yahoo.com']
+
+ALPHABET = string.ascii_lowercase + string.digits
+HEX = '0123456789abcdef'
+
+
+def _label(rng):
+    length = rng.choice(LABEL_LENGTHS)
+    return rng.choice(string.ascii_lowercase) + ''.join(rng.choice(ALPHABET) for _ in range(length - 1))
+
+
+def _subdomain_label(rng):
+    roll = rng.random()
+    if roll < 0.35:
+        return rng.choice(SUBDOMAIN_WORDS) + (str(rng.randint(1, 99)) if rng.random() < 0.3 else '')
+    if roll < 0.45:
+        # hash-like tracking label
+        return ''.join(rng.choice(HEX) for _ in range(rng.choice([8, 12, 16, 24, 32])))
+    return _label(rng)
+
+
+def generate_domains(count, seed=1):
+    """Yield `count` synthetic domains (duplicates are possible, as in real feeds)"""
+    rng = random.Random(seed)
+    bases = [f"{_label(rng)}.{rng.choice(TLDS)}" for _ in range(max(1, count // 4))]
+    for _ in range(count):
+        roll = rng.random()
+        if roll < 0.01:
+            base = rng.choice(SOCIAL_BASES)
+        elif roll < 0.015:
+            base = rng.choice(WHITELIST_BASES)
+        else:
+            # Zipf-like skew: a few registrable domains carry many subdomains
+            base = bases[int(len(bases) * rng.random() ** 3)]
+        depth = rng.choices([0, 1, 2, 3], weights=[30, 45, 18, 7])[0]
+        labels = [_subdomain_label(rng) for _ in range(depth)]
+        yield '.'.join(labels + [base])
+
+
+def format_line(domain, fmt):
+    if fmt == 'hosts':
+        return f"0.0.0.0 {domain}"
+    if fmt == 'adblock':
+        return f"||{domain}^"
+    return domain
+
+
+FEED_HEADERS = {
+    'hosts': "# Synthetic hosts feed\n127.0.0.1 localhost\n::1 localhost\n",
+    'adblock': "! Title: Synthetic AdBlock feed\n! Expires: 1 day\n",
+    'plain': "# Synthetic plain feed\n",
+}
+
+
+def write_feed(path, count, fmt='plain', seed=1):
+    """Write a synthetic feed of `count` domains in `fmt` to `path`"""
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(FEED_HEADERS[fmt])
+        for domain in generate_domains(count, seed):
+            f.write(format_line(domain, fmt) + '\n')
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a reproducible synthetic blocklist feed")
+    parser.add_argument("-n", "--count", type=int, default=100000, help="Number of domains")
+    parser.add_argument("-f", "--format", choices=FEED_FORMATS, default="plain", help="Feed format")
+    parser.add_argument("-o", "--output", required=True, help="Output file")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed")
+    args = parser.parse_args()
+    write_feed(args.output, args.count, args.format, args.seed)
+    print(f"Wrote {args.count} {args.format} lines to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
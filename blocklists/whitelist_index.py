@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+whitelist_index.py
+
+Suffix index for whitelist matching.
+
+A domain is whitelisted when it equals a whitelisted entry or is a subdomain of
+one. Instead of testing every entry with `endswith`, the index keeps the entries
+in a dict and a lookup walks the label suffixes of the domain
+(`a.b.example.com`, `b.example.com`, `example.com`, `com`), so the cost depends
+on the number of labels in the domain and not on the size of the whitelist.
+
+Usage:
+  from whitelist_index import WhitelistIndex
+
+  index = WhitelistIndex(WHITELIST)
+  index.load_file('whitelisted_domains.txt')
+  if 'ads.paypal.com' in index:
+      ...
+"""
+
+from feed_parser import HOSTS_IPS
+
+
+def normalize_entry(entry):
+    """Normalize a whitelist entry or query (lowercase, strip AdBlock `||x^`)"""
+    entry = entry.strip().lower()
+    if entry.startswith('||') and entry.endswith('^'):
+        entry = entry[2:-1]
+    return entry
+
+
+class WhitelistIndex:
+    """Whitelist keyed on domain suffixes with O(labels) lookups"""
+
+    def __init__(self, entries=()):
+        # suffix -> rule that whitelisted it
+        self._entries = {}
+        self.update(entries)
+
+    def add(self, entry, rule=None):
+        """Add a single whitelisted domain; `rule` is what match() reports"""
+        domain = normalize_entry(entry)
+        if domain:
+            self._entries.setdefault(domain, rule if rule is not None else domain)
+
+    def update(self, entries):
+        for entry in entries:
+            self.add(entry)
+
+    def load_file(self, file_path, rule=None):
+        """Add every domain listed in a file (one per line or hosts format, '#' comments allowed)"""
+        with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
+            for line in f:
+                parts = line.split('#', 1)[0].split()
+                if not parts:
+                    continue
+                self.add(parts[1] if parts[0] in HOSTS_IPS and len(parts) > 1 else parts[0], rule)
+        return self
+
+    def match(self, domain):
+        """Return the rule whitelisting `domain`, or None if it is not whitelisted"""
+        entries = self._entries
+        rule = entries.get(domain)
+        if rule is not None:
+            return rule
+        dot = domain.find('.')
+        while dot != -1:
+            rule = entries.get(domain[dot + 1:])
+            if rule is not None:
+                return rule
+            dot = domain.find('.', dot + 1)
+        return None
+
+    def __contains__(self, domain):
+        return self.match(domain) is not None
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __iter__(self):
+        return iter(self._entries)
@@ -1,13 +1,23 @@
 #!/usr/bin/env python3
 
-import urllib.request
+import argparse
 from urllib.error import URLError, HTTPError
+import os
 import time
 import sys
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'blocklists'))
+
+from feed_cache import FeedCache
+from feed_downloader import fetch_all
+from feed_parser import PARSER_VERSION, parse_feed
+from instrumentation import METRICS, add_arguments as add_metrics_arguments
+
 USER_AGENT = 'Mozilla/5.0 (compatible; PI-HOLE-BLOCK/1.0)'
 TIMEOUT = 10
 
+FEED_CACHE = FeedCache()
+
 def read_upstream_sources(file_path):
     """Read upstream DNS sources from file"""
     sources = []
@@ -28,42 +38,14 @@ def read_upstream_sources(file_path):
         return []
 
 def fetch_domains(url):
-    """Fetch and parse domains from URL"""
-    domains = set()
+    """Fetch and parse domains from URL (conditional GET through the feed cache)"""
     try:
         print(f"  Fetching {url}...")
-        req = urllib.request.Request(url, headers={"User-Agent": USER_AGENT})
-        with urllib.request.urlopen(req, timeout=TIMEOUT) as response:
-            content = response.read().decode('utf-8', errors='ignore')
-        
-        lines = content.split('\n')
-        for line in lines:
-            line = line.strip()
-            if not line or line.startswith('#'):
-                continue
-            
-            # Parse different formats
-            parts = line.split()
-            if not parts:
-                continue
-            
-            # Handle hosts file format (0.0.0.0 or 127.0.0.1)
-            if parts[0] in ['0.0.0.0', '127.0.0.1']:
-                if len(parts) >= 2:
-                    domain = parts[1]
-                else:
-                    continue
-            # Handle plain domain format
-            elif parts[0].startswith(('http://', 'https://')):
-                continue
-            else:
-                domain = parts[0]
-            
-            # Validate domain
-            if domain and '.' in domain and not domain.startswith('^'):
-                domains.add(domain.lower())
-        
-        return domains
+        with METRICS.span('fetch', source=url) as span:
+            result = FEED_CACHE.fetch(url, parse_feed, headers={"User-Agent": USER_AGENT}, timeout=TIMEOUT,
+                                      parser_version=PARSER_VERSION)
+            span.count(bytes_in=0 if result.cached else result.size, domains_out=len(result.domains))
+        return result.domains
     
     except (URLError, HTTPError, TimeoutError) as e:
         print(f"  ✗ Failed to fetch {url}: {e}")
@@ -90,6 +72,10 @@ def read_current_blocklist(file_path):
         return set()
 
 def main():
+    parser = argparse.ArgumentParser(description="Check upstream DNS sources for domains missing from blocker.txt")
+    add_metrics_arguments(parser, 'check_dns_updates')
+    METRICS.start_from_args(parser.parse_args())
+
     print("=" * 70)
     print("DNS UPSTREAM SOURCES UPDATE CHECK")
     print("=" * 70)
@@ -104,34 +90,44 @@ def main():
     
     print(f"\nFound {len(sources)} upstream sources:\n")
     
-    # Fetch all domains from upstream sources
-    all_upstream_domains = set()
-    for url in sources:
-        domains = fetch_domains(url)
-        print(f"  ✓ Found {len(domains)} domains")
-        all_upstream_domains.update(domains)
-        time.sleep(0.5)  # Rate limiting
+    # Fetch all domains from upstream sources (in parallel, rate limited per host)
+    start_time = time.monotonic()
+    feeds = []
+    with METRICS.span('fetch_all') as span:
+        for url, domains in fetch_all(sources, fetch_domains):
+            print(f"  ✓ Found {len(domains)} domains in {url}")
+            feeds.append(domains)
+        span.count(domains_out=sum(len(domains) for domains in feeds))
+    with METRICS.span('union') as span:
+        all_upstream_domains = set().union(*feeds)
+        span.count(domains_in=sum(len(domains) for domains in feeds), domains_out=len(all_upstream_domains))
+    del feeds
     
     print(f"\n{'=' * 70}")
+    print(f"Fetched {len(sources)} sources in {time.monotonic() - start_time:.1f}s")
     print(f"Total unique domains from upstream sources: {len(all_upstream_domains)}")
     
     # Read current blocklist
     try:
         blocker_file = '/workspaces/PI-HOLE-BLOCK/blocker.txt'
-        current_domains = read_current_blocklist(blocker_file)
+        with METRICS.span('read_current') as span:
+            current_domains = read_current_blocklist(blocker_file)
+            span.count(domains_out=len(current_domains))
         print(f"Current domains in blocker.txt: {len(current_domains)}")
     except Exception as e:
         print(f"Error reading blocker.txt: {e}")
         current_domains = set()
     
     # Find new domains
-    new_domains = all_upstream_domains - current_domains
+    with METRICS.span('diff') as span:
+        new_domains = all_upstream_domains - current_domains
+        span.count(domains_in=len(all_upstream_domains), domains_out=len(new_domains))
     print(f"\n{'=' * 70}")
     print(f"NEW DOMAINS FOUND: {len(new_domains)}")
     print(f"{'=' * 70}\n")
     
     if new_domains:
-        # Sort and display new domains
+        # Display new domains
         sorted_new = sorted(new_domains)
         print("Top 50 new domains:")
         for i, domain in enumerate(sorted_new[:50], 1):
@@ -167,3 +163,4 @@ def main():
 
 if __name__ == '__main__':
     main()
+    FEED_CACHE.report()
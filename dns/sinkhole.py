@@ -0,0 +1,421 @@
+#!/usr/bin/env python3
+"""
+sinkhole.py
+
+Lightweight DNS sinkhole for boxes too small for a full Pi-hole: an asyncio
+UDP + TCP server that blocks the domains of the merged blocklist and forwards
+every other query to an upstream resolver.
+
+Usage:
+  python sinkhole.py -b ../blocklists/youtube-blocklist.txt --upstream 1.1.1.1
+                     [--listen 0.0.0.0:53] [--block-mode null|nxdomain]
+                     [--stats 127.0.0.1:8053] [--cache-size 10000] [--max-cache-ttl 3600]
+                     [--reload-interval 5]
+
+  curl http://127.0.0.1:8053/stats
+
+A name is blocked when it or one of its parent domains is listed. Blocked
+A/AAAA queries get 0.0.0.0 / :: (other types an empty answer), or NXDOMAIN
+with --block-mode nxdomain. The blocklist may be the plain text list or the
+file compiled by compiled_blocklist.py, which is memory-mapped instead of
+loaded and is the better choice on small boxes.
+
+Forwarded answers are kept in an LRU cache for their TTL (the smallest
+record TTL, or the SOA negative TTL for NXDOMAIN and empty answers, capped
+at --max-cache-ttl); cached answers are served with their TTLs aged.
+
+The blocklist file is polled every --reload-interval seconds. Once a change
+has been stable for one interval (merge_blocklists.py replaces the file
+atomically) the new list is loaded in a background thread and swapped in,
+so queries keep being answered during the reload.
+
+GET /stats on --stats returns JSON: query counts per outcome, cache hit
+rate, blocklist size and reloads, and latency percentiles over the last
+LATENCY_SAMPLES queries.
+"""
+
+from collections import OrderedDict, deque
+import argparse
+import asyncio
+import json
+import os
+import socket
+import struct
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'blocklists'))
+
+from compiled_blocklist import MAGIC, CompiledBlocklist
+from dns_wire import (CLASS_IN, FLAG_TC, OPCODE_MASK, QTYPE_A, QTYPE_AAAA, RCODE_NOERROR, RCODE_NOTIMP,
+                      RCODE_NXDOMAIN, RCODE_REFUSED, RCODE_SERVFAIL, RECV_BUFFER, DNSClient, adjust_ttls,
+                      build_response, encode_name, parse_query, parse_server, tcp_exchange)
+from exporters import read_domains
+
+BLOCK_TTL = 2
+CACHE_SIZE = 10000
+MAX_CACHE_TTL = 3600
+LATENCY_SAMPLES = 10000
+UDP_MAX = 512
+TCP_IDLE_TIMEOUT = 10
+OUTCOMES = ('blocked', 'cached', 'forwarded', 'failed', 'refused')
+
+_LENGTH = struct.Struct('!H')
+
+
+class TextBlocklist:
+    """Plain blocklist file loaded into a set, with the CompiledBlocklist match() interface"""
+
+    def __init__(self, path):
+        self._domains = set(read_domains(path))
+
+    def match(self, domain):
+        candidate = domain.lower().rstrip('.')
+        while True:
+            if candidate in self._domains:
+                return candidate, []
+            dot = candidate.find('.')
+            if dot == -1:
+                return None
+            candidate = candidate[dot + 1:]
+
+    def __len__(self):
+        return len(self._domains)
+
+    def close(self):
+        pass
+
+
+def load_blocklist(path):
+    """Open a compiled blocklist or load a plain one, by the file's magic"""
+    with open(path, 'rb') as f:
+        compiled = f.read(len(MAGIC)) == MAGIC
+    return CompiledBlocklist(path) if compiled else TextBlocklist(path)
+
+
+class BlocklistReloader:
+    """Current blocklist, swapped for a fresh copy when the file changes"""
+
+    def __init__(self, path):
+        self.path = path
+        self.signature = self._signature()
+        self.blocklist = load_blocklist(path)
+        self.loaded_at = time.time()
+        self.reloads = 0
+        self._candidate = None
+
+    def _signature(self):
+        st = os.stat(self.path)
+        return st.st_ino, st.st_size, st.st_mtime_ns
+
+    async def watch(self, interval):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                signature = self._signature()
+            except OSError:
+                continue
+            if signature == self.signature:
+                self._candidate = None
+                continue
+            if signature != self._candidate:
+                # Wait one more interval for the writer to finish
+                self._candidate = signature
+                continue
+            try:
+                blocklist = await loop.run_in_executor(None, load_blocklist, self.path)
+            except (OSError, ValueError) as e:
+                print(f"  ! Reload of {self.path} failed, keeping the current list: {e}")
+                self._candidate = None
+                continue
+            old, self.blocklist = self.blocklist, blocklist
+            # Lookups never await, so no query is using the old list now
+            old.close()
+            self.signature = signature
+            self._candidate = None
+            self.loaded_at = time.time()
+            self.reloads += 1
+            print(f"✓ Reloaded {self.path}: {len(blocklist)} domains")
+
+
+class AnswerCache:
+    """LRU of upstream answers, each valid for its own TTL"""
+
+    def __init__(self, size=CACHE_SIZE):
+        self.size = size
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, now):
+        """Return the cached answer aged to `now`, or None"""
+        entry = self._entries.get(key)
+        if entry is not None:
+            data, stored_at, expires = entry
+            if now < expires:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return adjust_ttls(data, int(now - stored_at))
+            del self._entries[key]
+        self.misses += 1
+        return None
+
+    def put(self, key, data, ttl, now):
+        if self.size <= 0 or ttl <= 0:
+            return
+        self._entries[key] = (data, now, now + ttl)
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def _percentiles(samples):
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+    pick = lambda p: round(ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))] * 1000, 3)
+    return {'p50': pick(50), 'p90': pick(90), 'p99': pick(99), 'max': round(ordered[-1] * 1000, 3)}
+
+
+class Stats:
+    def __init__(self):
+        self.started = time.time()
+        self.counts = {outcome: 0 for outcome in OUTCOMES}
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)
+        self.outcome_latencies = {outcome: deque(maxlen=LATENCY_SAMPLES) for outcome in OUTCOMES}
+
+    def record(self, outcome, seconds):
+        self.counts[outcome] += 1
+        self.latencies.append(seconds)
+        self.outcome_latencies[outcome].append(seconds)
+
+
+class Sinkhole:
+    """Answers one DNS message at a time; shared by the UDP and TCP servers"""
+
+    def __init__(self, reloader, client, upstream, block_mode='null', block_ttl=BLOCK_TTL,
+                 cache=None, max_cache_ttl=MAX_CACHE_TTL):
+        self.reloader = reloader
+        self.client = client
+        self.upstream = upstream
+        self.block_mode = block_mode
+        self.block_ttl = block_ttl
+        self.cache = cache if cache is not None else AnswerCache()
+        self.max_cache_ttl = max_cache_ttl
+        self.stats = Stats()
+
+    def _blocked_answer(self, query):
+        if self.block_mode == 'nxdomain':
+            return build_response(query, RCODE_NXDOMAIN)
+        if query.qtype == QTYPE_A:
+            return build_response(query, answers=[(QTYPE_A, self.block_ttl, bytes(4))])
+        if query.qtype == QTYPE_AAAA:
+            return build_response(query, answers=[(QTYPE_AAAA, self.block_ttl, bytes(16))])
+        return build_response(query)
+
+    def _cache_ttl(self, response):
+        if response.truncated or response.rcode not in (RCODE_NOERROR, RCODE_NXDOMAIN):
+            return 0
+        ttl = response.min_ttl if response.answers else response.negative_ttl
+        return min(ttl or 0, self.max_cache_ttl)
+
+    @staticmethod
+    def _for_client(data, query):
+        """Upstream answer with the client's query ID and question (original letter case)"""
+        question_length = len(encode_name(query.name)) + 4
+        if len(query.question) == question_length:
+            return _LENGTH.pack(query.qid) + data[2:12] + query.question + data[12 + question_length:]
+        return _LENGTH.pack(query.qid) + data[2:]
+
+    async def _forward(self, query, tcp):
+        result = await self.client.exchange(query.name, query.qtype)
+        if result is not None and result[0].truncated and tcp:
+            result = await tcp_exchange(self.upstream, query.name, query.qtype, self.client.timeout)
+        if result is None:
+            return None
+        response, data = result
+        ttl = self._cache_ttl(response)
+        if ttl:
+            self.cache.put((query.name, query.qtype), data, ttl, time.monotonic())
+        return data
+
+    async def answer(self, message, tcp=False):
+        """Return the reply to a query message, or None to drop it"""
+        start = time.perf_counter()
+        try:
+            query = parse_query(message)
+        except ValueError:
+            return None
+        if query.flags & OPCODE_MASK:
+            outcome, reply = 'refused', build_response(query, RCODE_NOTIMP)
+        elif query.qclass != CLASS_IN:
+            outcome, reply = 'refused', build_response(query, RCODE_REFUSED)
+        elif self.reloader.blocklist.match(query.name):
+            outcome, reply = 'blocked', self._blocked_answer(query)
+        else:
+            data = self.cache.get((query.name, query.qtype), time.monotonic())
+            outcome = 'cached'
+            if data is None:
+                try:
+                    data = await self._forward(query, tcp)
+                except ValueError:
+                    data = None
+                outcome = 'forwarded'
+            if data is None:
+                outcome, reply = 'failed', build_response(query, RCODE_SERVFAIL)
+            else:
+                reply = self._for_client(data, query)
+        if not tcp and len(reply) > UDP_MAX:
+            # Header and question only, with TC set: the client retries over TCP
+            flags = _LENGTH.unpack_from(reply, 2)[0] | FLAG_TC
+            reply = reply[:2] + _LENGTH.pack(flags) + b'\x00\x01' + bytes(6) + query.question
+        self.stats.record(outcome, time.perf_counter() - start)
+        return reply
+
+    def stats_snapshot(self):
+        stats = self.stats
+        lookups = self.cache.hits + self.cache.misses
+        return {
+            'uptime_seconds': round(time.time() - stats.started, 1),
+            'queries': sum(stats.counts.values()),
+            'outcomes': stats.counts,
+            'cache': {
+                'entries': len(self.cache),
+                'hits': self.cache.hits,
+                'misses': self.cache.misses,
+                'hit_rate': round(self.cache.hits / lookups, 4) if lookups else 0.0,
+            },
+            'blocklist': {
+                'path': self.reloader.path,
+                'domains': len(self.reloader.blocklist),
+                'loaded_at': self.reloader.loaded_at,
+                'reloads': self.reloader.reloads,
+            },
+            'latency_ms': dict(_percentiles(stats.latencies),
+                               by_outcome={outcome: _percentiles(samples)
+                                           for outcome, samples in stats.outcome_latencies.items() if samples}),
+        }
+
+
+class _UDPServer(asyncio.DatagramProtocol):
+    def __init__(self, sinkhole):
+        self.sinkhole = sinkhole
+        self.tasks = set()
+
+    def connection_made(self, transport):
+        self.transport = transport
+        try:
+            transport.get_extra_info('socket').setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECV_BUFFER)
+        except OSError:
+            pass
+
+    def datagram_received(self, data, addr):
+        task = asyncio.get_running_loop().create_task(self._reply(data, addr))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def _reply(self, data, addr):
+        reply = await self.sinkhole.answer(data)
+        if reply is not None:
+            self.transport.sendto(reply, addr)
+
+
+async def _serve_tcp(sinkhole, reader, writer):
+    try:
+        while True:
+            header = await asyncio.wait_for(reader.readexactly(2), TCP_IDLE_TIMEOUT)
+            message = await asyncio.wait_for(reader.readexactly(_LENGTH.unpack(header)[0]), TCP_IDLE_TIMEOUT)
+            reply = await sinkhole.answer(message, tcp=True)
+            if reply is None:
+                break
+            writer.write(_LENGTH.pack(len(reply)) + reply)
+            await writer.drain()
+    except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+
+async def _serve_stats(sinkhole, reader, writer):
+    try:
+        request = await asyncio.wait_for(reader.readline(), TCP_IDLE_TIMEOUT)
+        while (await asyncio.wait_for(reader.readline(), TCP_IDLE_TIMEOUT)).strip():
+            pass
+        parts = request.decode('latin-1').split()
+        if len(parts) >= 2 and parts[0] == 'GET' and parts[1].split('?')[0] in ('/', '/stats'):
+            status, body = '200 OK', json.dumps(sinkhole.stats_snapshot(), indent=2).encode('utf-8')
+        else:
+            status, body = '404 Not Found', b'{"error": "not found"}'
+        writer.write(f"HTTP/1.0 {status}\r\nContent-Type: application/json\r\n"
+                     f"Content-Length: {len(body)}\r\n\r\n".encode('latin-1') + body)
+        await writer.drain()
+    except (OSError, asyncio.TimeoutError):
+        pass
+    finally:
+        writer.close()
+
+
+async def serve(args):
+    listen_host, listen_port = parse_server(args.listen)
+    upstream = parse_server(args.upstream)
+    reloader = BlocklistReloader(args.blocklist)
+    client = DNSClient(upstream, args.timeout, args.retries, max_in_flight=4096)
+    await client.open()
+    sinkhole = Sinkhole(reloader, client, upstream, args.block_mode, args.block_ttl,
+                        AnswerCache(args.cache_size), args.max_cache_ttl)
+
+    loop = asyncio.get_running_loop()
+    udp, _ = await loop.create_datagram_endpoint(lambda: _UDPServer(sinkhole),
+                                                 local_addr=(listen_host, listen_port))
+    tcp = await asyncio.start_server(lambda r, w: _serve_tcp(sinkhole, r, w), listen_host, listen_port)
+    servers = [tcp]
+    if args.stats:
+        stats_host, stats_port = parse_server(args.stats, 8053)
+        servers.append(await asyncio.start_server(lambda r, w: _serve_stats(sinkhole, r, w),
+                                                  stats_host, stats_port))
+    print(f"✓ Blocking {len(reloader.blocklist)} domains from {args.blocklist}")
+    print(f"✓ Listening on {listen_host}:{listen_port} (UDP/TCP), forwarding to {upstream[0]}:{upstream[1]}")
+    if args.stats:
+        print(f"✓ Stats on http://{stats_host}:{stats_port}/stats")
+    try:
+        await reloader.watch(args.reload_interval)
+    finally:
+        udp.close()
+        for server in servers:
+            server.close()
+        client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the merged blocklist as a DNS sinkhole")
+    parser.add_argument("-b", "--blocklist", required=True,
+                        help="Merged blocklist (plain text, or compiled with compiled_blocklist.py)")
+    parser.add_argument("--upstream", required=True, help="Resolver for unblocked names, host[:port]")
+    parser.add_argument("--listen", default="0.0.0.0:53", help="Address to serve DNS on, host[:port]")
+    parser.add_argument("--block-mode", choices=("null", "nxdomain"), default="null",
+                        help="Answer blocked names with 0.0.0.0/:: (null) or NXDOMAIN")
+    parser.add_argument("--block-ttl", type=int, default=BLOCK_TTL, help="TTL of blocked answers")
+    parser.add_argument("--stats", default="127.0.0.1:8053", help="host[:port] of the stats endpoint ('' to disable)")
+    parser.add_argument("--cache-size", type=int, default=CACHE_SIZE, help="Upstream answers kept (0 disables)")
+    parser.add_argument("--max-cache-ttl", type=int, default=MAX_CACHE_TTL, help="Upper bound on cached TTLs")
+    parser.add_argument("--timeout", type=float, default=2.0, help="Seconds to wait for the upstream")
+    parser.add_argument("--retries", type=int, default=1, help="Upstream retries after a timeout")
+    parser.add_argument("--reload-interval", type=float, default=5.0,
+                        help="Seconds between checks of the blocklist file for changes")
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+    except (OSError, ValueError) as e:
+        print(f"✗ {e}", file=sys.stderr)
+        sys.exit(2)
+
+
+if __name__ == "__main__":
+    main()